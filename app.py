@@ -1,5 +1,5 @@
 import os
-from flask import Flask, send_from_directory, session
+from flask import Flask, abort, session, url_for
 from flask_wtf.csrf import CSRFProtect
 from config import Config
 from auth_utils import login_required
@@ -10,6 +10,9 @@ from routes.settings import settings_bp
 from routes.history import history_bp
 from routes.auth import auth_bp
 from routes.categories import categories_bp
+from routes.recurring import recurring_bp
+from services import analytics, avatars, coldstore, db, files, forecast, money, passwords, rangestats, ratelimit, receipts, thumbnails
+from services import settings as settings_service
 
 csrf = CSRFProtect()
 
@@ -21,12 +24,29 @@ def create_app(config_class=Config):
         import secrets
         app.config["SECRET_KEY"] = secrets.token_hex(32)
 
+    # Behind a proxy, remote_addr would be the proxy's for every client and
+    # the per-IP login limits would become one site-wide bucket
+    if app.config.get("PROXY_FIX_X_FOR"):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
+
     # Session cookie security
     app.config.setdefault("SESSION_COOKIE_HTTPONLY", True)
     app.config.setdefault("SESSION_COOKIE_SAMESITE", "Lax")
 
     csrf.init_app(app)
     Config.init_db(app)
+    db.init_app(app)
+    settings_service.init_app(app)
+    files.init_app(app)
+    thumbnails.init_app(app)
+    passwords.init_app(app)
+    ratelimit.init_app(app)
+    coldstore.init_app(app)
+    analytics.init_app(app)
+    forecast.init_app(app)
+    rangestats.init_app(app)
+    money.init_app(app)
 
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['AVATAR_FOLDER'], exist_ok=True)
@@ -39,6 +59,7 @@ def create_app(config_class=Config):
     app.register_blueprint(settings_bp)
     app.register_blueprint(history_bp)
     app.register_blueprint(categories_bp)
+    app.register_blueprint(recurring_bp)
 
     # Security headers
     @app.after_request
@@ -53,12 +74,37 @@ def create_app(config_class=Config):
     @app.route('/uploads/avatars/<path:filename>')
     @login_required
     def avatar_file(filename):
-        return send_from_directory(app.config['AVATAR_FOLDER'], filename)
+        if not files.owns(filename, session['user_id'], 'avatars'):
+            abort(404)
+        return files.send_upload(
+            'avatars', filename,
+            immutable=avatars.is_variant(filename),
+        )
 
     @app.route('/uploads/receipts/<path:filename>')
     @login_required
     def receipt_file(filename):
-        return send_from_directory(app.config['RECEIPT_FOLDER'], filename)
+        if not files.owns(filename, session['user_id'], 'receipts'):
+            abort(404)
+        return files.send_upload(
+            'receipts', filename,
+            immutable=receipts.is_content_addressed(filename),
+        )
+
+    @app.route('/uploads/thumbs/<path:filename>')
+    @login_required
+    def receipt_thumbnail(filename):
+        if not files.owns(filename, session['user_id'], 'receipts'):
+            abort(404)
+        thumb = thumbnails.ensure(filename)
+        if thumb is thumbnails.UNSUPPORTED:
+            abort(404)
+        if thumb == thumbnails.PENDING:
+            return "Thumbnail is being generated", 503, {"Retry-After": "1"}
+        return files.send_upload(
+            'receipts', thumb,
+            immutable=receipts.is_content_addressed(filename),
+        )
 
     # Jinja2 filter
     def clamp_filter(value, min_val=0, max_val=100):
@@ -68,6 +114,18 @@ def create_app(config_class=Config):
             return 0
     app.jinja_env.filters['clamp'] = clamp_filter
 
+    def avatar_url(key, size=64):
+        return url_for('avatar_file', filename=avatars.variant(key, size))
+    app.jinja_env.globals['avatar_url'] = avatar_url
+
     return app
 
-app = create_app()
+
+def __getattr__(name):
+    # ``app:app`` for Gunicorn/Flask CLI; built on first access so importing
+    # this module (tests, scripts, create_app users) stays cheap
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
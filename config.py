@@ -1,7 +1,6 @@
 import os
-import mysql.connector
-from mysql.connector import pooling
 from dotenv import load_dotenv
+from services.db import LazyPool
 
 load_dotenv()
 
@@ -13,25 +12,106 @@ class Config:
     MYSQL_USER = os.getenv('MYSQL_USER')
     MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
     MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'budget_db')
+    # Optional read replica for @read_only views; same credentials as the primary
+    MYSQL_REPLICA_HOST = os.getenv('MYSQL_REPLICA_HOST') or None
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    # Connections all app workers may hold together; DB_POOL_SIZE overrides the per-worker share
+    DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', 40))
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0)) or None
 
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
     AVATAR_FOLDER = os.path.join(UPLOAD_FOLDER, 'avatars')
     RECEIPT_FOLDER = os.path.join(UPLOAD_FOLDER, 'receipts')
+    ARCHIVE_FOLDER = os.path.join(BASE_DIR, 'archive')
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024
     ALLOWED_ATTACH_EXT = {"pdf", "png", "jpg", "jpeg", "doc"}
 
+    SETTINGS_CACHE_TTL = int(os.getenv('SETTINGS_CACHE_TTL', 60))
+
+    # Hand file bytes to the front proxy: None, 'x-sendfile' or 'x-accel-redirect'
+    SENDFILE_BACKEND = os.getenv('SENDFILE_BACKEND') or None
+    X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/_protected_uploads')
+
+    # Tune with `python -m services.passwords --target-ms 100`
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Native threads for verifying under gevent workers; sync workers verify inline
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4))
+
+    # Login token buckets; set RATELIMIT_SQLITE_PATH to share them between workers
+    LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 20))
+    LOGIN_IP_PER_MINUTE = float(os.getenv('LOGIN_IP_PER_MINUTE', 10))
+    LOGIN_EMAIL_BURST = int(os.getenv('LOGIN_EMAIL_BURST', 5))
+    LOGIN_EMAIL_PER_MINUTE = float(os.getenv('LOGIN_EMAIL_PER_MINUTE', 2))
+    LOGIN_ACCOUNT_BURST = int(os.getenv('LOGIN_ACCOUNT_BURST', 50))
+    LOGIN_ACCOUNT_PER_MINUTE = float(os.getenv('LOGIN_ACCOUNT_PER_MINUTE', 10))
+    RATELIMIT_SQLITE_PATH = os.getenv('RATELIMIT_SQLITE_PATH') or None
+    # Proxies in front of the app that append to X-Forwarded-For (1 behind nginx);
+    # 0 trusts none, so a directly exposed app can't be handed a forged client IP
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+
+    # Upload storage: 'local' (the *_FOLDER paths above) or 's3'
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_URL_EXPIRY = int(os.getenv('STORAGE_URL_EXPIRY', 300))
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None  # e.g. a MinIO server
+    S3_REGION = os.getenv('S3_REGION') or None
+    S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    S3_MAX_CONCURRENCY = 4
+
+    # Archive months older than this are moved to cold storage by
+    # `python -m services.coldstore`; decoded months are cached per worker
+    COLD_AFTER_MONTHS = int(os.getenv('COLD_AFTER_MONTHS', 24))
+    COLD_CACHE_MONTHS = int(os.getenv('COLD_CACHE_MONTHS', 64))
+
+    # Users whose archive is held as columns for history/compare, and for how long
+    ANALYTICS_CACHE_USERS = int(os.getenv('ANALYTICS_CACHE_USERS', 32))
+    ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+
+    # Dashboard month-end forecast: smoothing weight of the latest day, archived
+    # months used for seasonality, and per-user state kept between loads
+    FORECAST_ALPHA = float(os.getenv('FORECAST_ALPHA', 0.3))
+    FORECAST_HISTORY_MONTHS = int(os.getenv('FORECAST_HISTORY_MONTHS', 12))
+    FORECAST_CACHE_USERS = int(os.getenv('FORECAST_CACHE_USERS', 256))
+    FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', 600))
+
+    # Dashboard stats for the part of a date range before today, kept per worker
+    RANGE_CACHE_ENTRIES = int(os.getenv('RANGE_CACHE_ENTRIES', 512))
+    RANGE_CACHE_TTL = int(os.getenv('RANGE_CACHE_TTL', 600))
+
+    # Users per transaction when `python -m services.recurring` fills a month
+    RECURRING_BATCH_USERS = int(os.getenv('RECURRING_BATCH_USERS', 500))
+
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_SIZE = 320
+    THUMBNAIL_FORMAT = 'webp'
+    THUMBNAIL_WAIT = 2.0
+
     @staticmethod
     def init_db(app):
-        try:
-            app.db_pool = mysql.connector.pooling.MySQLConnectionPool(
-                pool_name="budget_pool",
-                pool_size=5,
-                host=Config.MYSQL_HOST,
-                user=Config.MYSQL_USER,
-                password=Config.MYSQL_PASSWORD,
-                database=Config.MYSQL_DATABASE
+        def pool_factory(name, host):
+            def create_pool(pool_size):
+                from mysql.connector import pooling
+
+                return pooling.MySQLConnectionPool(
+                    pool_name=name,
+                    pool_size=pool_size,
+                    host=host,
+                    user=Config.MYSQL_USER,
+                    password=Config.MYSQL_PASSWORD,
+                    database=Config.MYSQL_DATABASE
+                )
+            return create_pool
+
+        # Connected on first use in each worker, see services.db
+        app.db_pool = LazyPool(
+            pool_factory("budget_pool", Config.MYSQL_HOST),
+            Config.DB_CONNECTION_BUDGET, Config.DB_POOL_SIZE,
+        )
+        app.db_replica_pool = None
+        if Config.MYSQL_REPLICA_HOST:
+            app.db_replica_pool = LazyPool(
+                pool_factory("budget_replica_pool", Config.MYSQL_REPLICA_HOST),
+                Config.DB_CONNECTION_BUDGET, Config.DB_POOL_SIZE,
             )
-        except mysql.connector.Error as e:
-            import logging
-            logging.error(f"Could not initialize database pool: {e}")
-            app.db_pool = None
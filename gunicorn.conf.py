@@ -0,0 +1,20 @@
+# Gunicorn settings: gunicorn app:app
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def post_fork(server, worker):
+    # Size this worker's MySQL pool from the shared connection budget and
+    # make sure it doesn't reuse a pool opened in the master before forking
+    from services import db
+
+    db.set_worker_count(server.cfg.workers)
+    from app import app
+
+    for pool in (app.db_pool, getattr(app, 'db_replica_pool', None)):
+        if pool is not None:
+            pool.reset()
@@ -0,0 +1,33 @@
+"""Add FULLTEXT indexes on expense and archived_expense text
+
+Revision ID: 1d8f4b6a2e93
+Revises: 6979c949de3e
+Create Date: 2026-10-19 09:38:12.905417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d8f4b6a2e93'
+down_revision = '6979c949de3e'
+branch_labels = None
+depends_on = None
+
+TABLES = ('expense', 'archived_expense')
+
+
+def upgrade():
+    # FULLTEXT indexes, like the MATCH ... AGAINST queries they serve, are MySQL-only
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for table in TABLES:
+        op.create_index(f'ft_{table}_category_note', table, ['category', 'note'], mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for table in TABLES:
+        op.drop_index(f'ft_{table}_category_note', table_name=table)
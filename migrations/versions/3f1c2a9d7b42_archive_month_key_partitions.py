@@ -0,0 +1,95 @@
+"""Key archive tables on an integer month and partition them by year
+
+Revision ID: 3f1c2a9d7b42
+Revises: 7c2a5e9d4b18
+Create Date: 2026-10-19 10:12:04.118530
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b42'
+down_revision = '7c2a5e9d4b18'
+branch_labels = None
+depends_on = None
+
+TABLES = ('archived_income', 'archived_expense')
+BACKFILL_BATCH = 10000
+
+
+# Frozen copy of services.archive.partition_sql as of this revision: a
+# migration must keep producing the same DDL even if the app's helper changes
+def _partition_sql(table, first_year, last_year):
+    parts = [
+        f"PARTITION p{year} VALUES LESS THAN ({(year + 1) * 100})"
+        for year in range(first_year, last_year + 1)
+    ]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return f"ALTER TABLE {table} PARTITION BY RANGE (month_key) ({', '.join(parts)})"
+
+
+def upgrade():
+    bind = op.get_bind()
+    mysql = bind.dialect.name == 'mysql'
+
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('month_key', sa.Integer(), nullable=False, server_default='0'))
+
+        # 'YYYY-MM' -> YYYYMM, one id range per statement so the backfill
+        # doesn't hold one huge lock. Ranges rather than "LIMIT until nothing
+        # changes": rows whose label doesn't parse stay 0 and must not stop it.
+        backfill = sa.text(
+            f"UPDATE {table} SET month_key = CAST(REPLACE(month, '-', '') AS {'UNSIGNED' if mysql else 'INTEGER'}) "
+            "WHERE id BETWEEN :start AND :stop AND month_key = 0"
+        )
+        low, high = bind.execute(sa.text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+        if low is not None:
+            for start in range(low, high + 1, BACKFILL_BATCH):
+                bind.execute(backfill, {"start": start, "stop": start + BACKFILL_BATCH - 1})
+
+        op.create_index(f'idx_{table}_user_month_key', table, ['user_id', 'month_key'])
+
+    if not mysql:
+        # Partitioning is MySQL-only; the (user_id, month_key) index gives
+        # other engines the same month range scans
+        return
+
+    # InnoDB can't keep a FULLTEXT index on a partitioned table (search moves
+    # to archived_expense_text in 9a4c6e1f3b27), and every unique key must
+    # include the partitioning column
+    # 1d8f4b6a2e93 creates the index, but a database stamped past it may lack it
+    has_fulltext = bind.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+        "AND table_name = 'archived_expense' AND index_name = 'ft_archived_expense_category_note'"
+    )).scalar()
+    if has_fulltext:
+        op.execute("ALTER TABLE archived_expense DROP INDEX ft_archived_expense_category_note")
+    first = bind.execute(sa.text(
+        "SELECT MIN(month_key) FROM (SELECT month_key FROM archived_income "
+        "UNION ALL SELECT month_key FROM archived_expense) AS k"
+    )).scalar()
+    first_year = first // 100 if first else date.today().year
+    for table in TABLES:
+        op.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, month_key)")
+        op.execute(_partition_sql(table, first_year, date.today().year + 1))
+
+
+def downgrade():
+    bind = op.get_bind()
+    mysql = bind.dialect.name == 'mysql'
+
+    for table in TABLES:
+        if mysql:
+            op.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+            op.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+        op.drop_index(f'idx_{table}_user_month_key', table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('month_key')
+
+    if mysql:
+        op.execute("ALTER TABLE archived_expense ADD FULLTEXT INDEX ft_archived_expense_category_note (category, note)")
@@ -0,0 +1,35 @@
+"""Add budget and running spent totals to categories
+
+Revision ID: 4b9e1a7c3d25
+Revises: c41d7e2a9b13
+Create Date: 2026-10-19 17:48:09.613870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9e1a7c3d25'
+down_revision = 'c41d7e2a9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # categories itself is created by schema.sql
+    op.add_column('categories', sa.Column('budget', sa.Numeric(precision=10, scale=2), nullable=True))
+    op.add_column('categories', sa.Column('spent', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False))
+
+    # Start each counter from the live expenses already filed under its name
+    op.execute(
+        "UPDATE categories SET spent = COALESCE(("
+        "SELECT SUM(e.amount) FROM expense e "
+        "WHERE e.user_id = categories.user_id AND e.category = categories.name"
+        "), 0)"
+    )
+
+
+def downgrade():
+    op.drop_column('categories', 'spent')
+    op.drop_column('categories', 'budget')
@@ -0,0 +1,33 @@
+"""Add category_id to expense and archived_expense
+
+Revision ID: 5d9a3f6e2c18
+Revises: 4b9e1a7c3d25
+Create Date: 2026-10-19 18:22:40.117264
+
+Run `python -m services.categories` afterwards to fill existing rows.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9a3f6e2c18'
+down_revision = '4b9e1a7c3d25'
+branch_labels = None
+depends_on = None
+
+TABLES = ('expense', 'archived_expense')
+
+
+def upgrade():
+    # No foreign key: archived_expense is partitioned, and categories is
+    # created by schema.sql, which adds the key on expense itself
+    for table in TABLES:
+        op.add_column(table, sa.Column('category_id', sa.Integer(), nullable=True))
+        op.create_index(f'idx_{table}_user_category', table, ['user_id', 'category_id'])
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'idx_{table}_user_category', table_name=table)
+        op.drop_column(table, 'category_id')
@@ -0,0 +1,34 @@
+"""Add receipt for content-addressed, reference-counted attachments
+
+Revision ID: 7c2a5e9d4b18
+Revises: 1d8f4b6a2e93
+Create Date: 2026-10-19 09:51:36.277054
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2a5e9d4b18'
+down_revision = '1d8f4b6a2e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Legacy user<id>_<name> attachments get no row; only hashed blobs are counted
+    op.create_table('receipt',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'path', name='user_receipt_unique')
+    )
+
+
+def downgrade():
+    op.drop_table('receipt')
@@ -0,0 +1,35 @@
+"""Add archive_summary for months compacted into cold storage
+
+Revision ID: 8b2e5d1c4a70
+Revises: 3f1c2a9d7b42
+Create Date: 2026-10-19 14:37:51.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e5d1c4a70'
+down_revision = '3f1c2a9d7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archive_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month_key', sa.Integer(), nullable=False),
+    sa.Column('month', sa.String(length=20), nullable=False),
+    sa.Column('income_total', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+    sa.Column('expense_total', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+    sa.Column('income_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('expense_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('file_key', sa.String(length=255), nullable=False),
+    sa.Column('compacted_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'month_key')
+    )
+
+
+def downgrade():
+    op.drop_table('archive_summary')
@@ -0,0 +1,54 @@
+"""Keep archived expense text in an unpartitioned FULLTEXT-indexed table
+
+Revision ID: 9a4c6e1f3b27
+Revises: e7b04c91d5a6
+Create Date: 2026-10-19 21:05:47.210384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c6e1f3b27'
+down_revision = 'e7b04c91d5a6'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 10000
+
+
+def upgrade():
+    op.create_table('archived_expense_text',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('month_key', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'month_key')
+    )
+    op.create_index('idx_archived_expense_text_user_month', 'archived_expense_text', ['user_id', 'month_key'])
+
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text("SELECT MIN(id), MAX(id) FROM archived_expense")).one()
+    if low is not None:
+        # One id range per statement, so the copy doesn't hold one huge lock
+        copy = sa.text(
+            "INSERT INTO archived_expense_text (id, month_key, user_id, category, note) "
+            "SELECT id, month_key, user_id, category, note FROM archived_expense "
+            "WHERE id BETWEEN :start AND :stop"
+        )
+        for start in range(low, high + 1, BACKFILL_BATCH):
+            bind.execute(copy, {"start": start, "stop": start + BACKFILL_BATCH - 1})
+
+    if bind.dialect.name == 'mysql':
+        # Built after the copy: one index build is cheaper than maintaining it per batch
+        op.create_index('ft_archived_expense_text_category_note', 'archived_expense_text',
+                        ['category', 'note'], mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ft_archived_expense_text_category_note', table_name='archived_expense_text')
+    op.drop_index('idx_archived_expense_text_user_month', table_name='archived_expense_text')
+    op.drop_table('archived_expense_text')
@@ -0,0 +1,29 @@
+"""Add per-user cache versions shared by all workers
+
+Revision ID: b3e8d2f05a61
+Revises: 9a4c6e1f3b27
+Create Date: 2026-10-19 21:48:13.602417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8d2f05a61'
+down_revision = '9a4c6e1f3b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('archive_version', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('expense_version', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
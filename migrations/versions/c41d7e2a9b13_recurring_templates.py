@@ -0,0 +1,47 @@
+"""Add recurring templates and idempotency keys on income/expense
+
+Revision ID: c41d7e2a9b13
+Revises: 8b2e5d1c4a70
+Create Date: 2026-10-19 17:05:22.640913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e2a9b13'
+down_revision = '8b2e5d1c4a70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recurring',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('label', sa.String(length=100), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('day', sa.SmallInteger(), server_default='1', nullable=False),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.Column('done_by', sa.String(length=50), nullable=True),
+    sa.Column('active', sa.Boolean(), server_default='1', nullable=False),
+    sa.Column('last_month_key', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_recurring_due', 'recurring', ['active', 'last_month_key', 'user_id'])
+
+    # '<template id>:<YYYYMM>' on materialized rows; unique so re-runs are no-ops
+    for table in ('expense', 'income'):
+        op.add_column(table, sa.Column('recurring_key', sa.String(length=32), nullable=True))
+        op.create_unique_constraint(f'uq_{table}_recurring', table, ['user_id', 'recurring_key'])
+
+
+def downgrade():
+    for table in ('income', 'expense'):
+        op.drop_constraint(f'uq_{table}_recurring', table, type_='unique')
+        op.drop_column(table, 'recurring_key')
+    op.drop_index('idx_recurring_due', table_name='recurring')
+    op.drop_table('recurring')
@@ -0,0 +1,24 @@
+"""Add a setting version to cache_version
+
+Revision ID: d6f2a8c4e0b7
+Revises: b3e8d2f05a61
+Create Date: 2026-10-19 22:31:40.518263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6f2a8c4e0b7'
+down_revision = 'b3e8d2f05a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('cache_version', sa.Column('setting_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('cache_version', 'setting_version')
@@ -0,0 +1,54 @@
+"""Add people and person ids on expense, archived_expense and setting
+
+Revision ID: e7b04c91d5a6
+Revises: 5d9a3f6e2c18
+Create Date: 2026-10-19 19:41:08.533902
+
+Run `python -m services.people` afterwards to fill person ids on existing rows.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b04c91d5a6'
+down_revision = '5d9a3f6e2c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('people',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('spent', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'name', name='user_person_unique')
+    )
+    # Automated income is read from people.spent alone, so each person must
+    # start from the live expenses already filed under their name
+    op.execute(
+        "INSERT INTO people (user_id, name, spent) "
+        "SELECT user_id, done_by, SUM(amount) FROM expense GROUP BY user_id, done_by"
+    )
+
+    for table in ('expense', 'archived_expense'):
+        op.add_column(table, sa.Column('person_id', sa.Integer(), nullable=True))
+        op.create_index(f'idx_{table}_user_person', table, ['user_id', 'person_id'])
+    # archived_expense is partitioned, so only expense gets the foreign key
+    op.create_foreign_key('fk_expense_person', 'expense', 'people', ['person_id'], ['id'])
+
+    op.add_column('setting', sa.Column('default_person_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_setting_default_person', 'setting', 'people', ['default_person_id'], ['id'],
+                          ondelete='SET NULL')
+
+
+def downgrade():
+    op.drop_constraint('fk_setting_default_person', 'setting', type_='foreignkey')
+    op.drop_column('setting', 'default_person_id')
+    op.drop_constraint('fk_expense_person', 'expense', type_='foreignkey')
+    for table in ('archived_expense', 'expense'):
+        op.drop_index(f'idx_{table}_user_person', table_name=table)
+        op.drop_column(table, 'person_id')
+    op.drop_table('people')
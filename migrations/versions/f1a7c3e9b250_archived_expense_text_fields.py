@@ -0,0 +1,55 @@
+"""Copy the fields search results show into archived_expense_text
+
+Revision ID: f1a7c3e9b250
+Revises: d6f2a8c4e0b7
+Create Date: 2026-10-19 23:02:17.845391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c3e9b250'
+down_revision = 'd6f2a8c4e0b7'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 10000
+COLUMNS = ('amount', 'date', 'done_by', 'month')
+
+
+def upgrade():
+    # Search reads archived results from this table alone, so its rows can
+    # outlive the archived_expense rows that compaction moves to cold storage
+    with op.batch_alter_table('archived_expense_text', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amount', sa.Numeric(precision=10, scale=2), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('date', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('done_by', sa.String(length=50), server_default='Self', nullable=False))
+        batch_op.add_column(sa.Column('month', sa.String(length=20), server_default='', nullable=False))
+
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text("SELECT MIN(id), MAX(id) FROM archived_expense_text")).one()
+    if low is None:
+        return
+    # Correlated subqueries rather than UPDATE ... JOIN, which SQLite lacks;
+    # one id range per statement so the copy doesn't hold one huge lock
+    copy = sa.text(
+        "UPDATE archived_expense_text SET "
+        + ", ".join(
+            f"{col} = (SELECT a.{col} FROM archived_expense a "
+            "WHERE a.id = archived_expense_text.id AND a.month_key = archived_expense_text.month_key)"
+            for col in COLUMNS
+        )
+        + " WHERE id BETWEEN :start AND :stop "
+        "AND EXISTS (SELECT 1 FROM archived_expense a "
+        "WHERE a.id = archived_expense_text.id AND a.month_key = archived_expense_text.month_key)"
+    )
+    for start in range(low, high + 1, BACKFILL_BATCH):
+        bind.execute(copy, {"start": start, "stop": start + BACKFILL_BATCH - 1})
+
+
+def downgrade():
+    with op.batch_alter_table('archived_expense_text', schema=None) as batch_op:
+        for col in reversed(COLUMNS):
+            batch_op.drop_column(col)
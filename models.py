@@ -6,18 +6,32 @@ class Income(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     source = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
+    recurring_key = db.Column(db.String(32), nullable=True)
 
 class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     category = db.Column(db.String(50), nullable=False)
+    category_id = db.Column(db.Integer, nullable=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=True)
     note = db.Column(db.Text)
     date = db.Column(db.Date, nullable=False)
+    recurring_key = db.Column(db.String(32), nullable=True)
 
 class Setting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     monthly_limit = db.Column(db.Numeric(10, 2), nullable=False, default=0.0)
     total_savings = db.Column(db.Numeric(10, 2), nullable=True, server_default="0.0")
+    default_person_id = db.Column(db.Integer, db.ForeignKey('people.id', ondelete='SET NULL'), nullable=True)
+
+class Receipt(db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'path', name='user_receipt_unique'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, server_default="0")
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
 
 
 class ArchivedIncome(db.Model):
@@ -25,11 +39,64 @@ class ArchivedIncome(db.Model):
     source = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     month = db.Column(db.String(20), nullable=False)
+    month_key = db.Column(db.Integer, nullable=False, server_default="0")
 
 class ArchivedExpense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     category = db.Column(db.String(50), nullable=False)
+    category_id = db.Column(db.Integer, nullable=True)
+    person_id = db.Column(db.Integer, nullable=True)
     note = db.Column(db.Text)
     date = db.Column(db.Date, nullable=False)
     month = db.Column(db.String(20), nullable=False)
+    month_key = db.Column(db.Integer, nullable=False, server_default="0")
+
+class ArchivedExpenseText(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month_key = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    note = db.Column(db.Text)
+    amount = db.Column(db.Numeric(10, 2), nullable=False, server_default="0")
+    date = db.Column(db.Date, nullable=True)
+    done_by = db.Column(db.String(50), nullable=False, server_default="Self")
+    month = db.Column(db.String(20), nullable=False, server_default="")
+
+class ArchiveSummary(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    month_key = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(20), nullable=False)
+    income_total = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    expense_total = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+    income_count = db.Column(db.Integer, nullable=False, server_default="0")
+    expense_count = db.Column(db.Integer, nullable=False, server_default="0")
+    file_key = db.Column(db.String(255), nullable=False)
+    compacted_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+class Recurring(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    label = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    day = db.Column(db.SmallInteger, nullable=False, server_default="1")
+    note = db.Column(db.Text)
+    done_by = db.Column(db.String(50), nullable=True)
+    active = db.Column(db.Boolean, nullable=False, server_default="1")
+    last_month_key = db.Column(db.Integer, nullable=False, server_default="0")
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+class Person(db.Model):
+    __tablename__ = 'people'
+    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='user_person_unique'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    spent = db.Column(db.Numeric(12, 2), nullable=False, server_default="0")
+
+class CacheVersion(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    archive_version = db.Column(db.Integer, nullable=False, server_default="0")
+    expense_version = db.Column(db.Integer, nullable=False, server_default="0")
+    setting_version = db.Column(db.Integer, nullable=False, server_default="0")
@@ -1,9 +1,9 @@
-import os
+import math
 import re
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from auth_utils import login_required
+from services import avatars, passwords, ratelimit
+from services.uploads import UploadRejected
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -42,7 +42,7 @@ def signup():
                 cur.execute("SELECT id FROM users WHERE email=%s", (email,))
                 if cur.fetchone():
                     return "Email already exists", 400
-                pw_hash = generate_password_hash(password)
+                pw_hash = passwords.hash_password(password)
                 cur.execute(
                     "INSERT INTO users (name, email, password_hash) VALUES (%s, %s, %s)",
                     (name, email, pw_hash)
@@ -62,10 +62,14 @@ def login():
         email = request.form['email'].strip().lower()
         password = request.form['password']
 
+        wait = ratelimit.check_login(current_app.login_limiter, request.remote_addr, email)
+        if wait:
+            return "Too many login attempts. Try again later.", 429, {"Retry-After": str(math.ceil(wait))}
+
         conn = current_app.db_pool.get_connection()
         try:
             with conn.cursor(dictionary=True) as cur:
-                cur.execute("SELECT id, name, email, password_hash FROM users WHERE email=%s", (email,))
+                cur.execute("SELECT id, name, email, password_hash, avatar_filename FROM users WHERE email=%s", (email,))
                 user = cur.fetchone()
         finally:
             conn.close()
@@ -74,12 +78,26 @@ def login():
             flash("Invalid credentials. Want to sign up?", "error")
             return redirect(url_for('auth.login'))
 
-        if not check_password_hash(user['password_hash'], password):
+        if not passwords.verify_password(user['password_hash'], password):
             flash("Invalid credentials. Want to sign up?", "error")
             return redirect(url_for('auth.login'))
 
+        if passwords.needs_rehash(user['password_hash']):
+            # Upgrade to the configured cost while we have the plaintext
+            conn = current_app.db_pool.get_connection()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+                        (passwords.hash_password(password), user['id'], user['password_hash'])
+                    )
+                    conn.commit()
+            finally:
+                conn.close()
+
         session['user_id'] = user['id']
         session['user_name'] = user['name']
+        session['avatar'] = user.get('avatar_filename')
 
         return redirect(url_for('dashboard.index'))
 
@@ -105,15 +123,22 @@ def profile():
                     session['user_name'] = name
 
                 file = request.files.get('avatar')
+                replaced = None
                 if file and file.filename:
                     if allowed_avatar(file.filename):
-                        filename = secure_filename(file.filename)
-                        filename = f"user{session['user_id']}_{filename}"
-                        os.makedirs(current_app.config['AVATAR_FOLDER'], exist_ok=True)
-                        file.save(os.path.join(current_app.config['AVATAR_FOLDER'], filename))
-                        cur.execute("UPDATE users SET avatar_filename=%s WHERE id=%s", (filename, session['user_id']))
-                        session['avatar'] = filename
+                        try:
+                            key = avatars.store(file, session['user_id'])
+                        except UploadRejected:
+                            flash("Avatar must be a valid PNG or JPEG image.", "error")
+                        else:
+                            cur.execute("SELECT avatar_filename FROM users WHERE id=%s", (session['user_id'],))
+                            row = cur.fetchone()
+                            if row and row['avatar_filename'] != key:
+                                replaced = row['avatar_filename']
+                            cur.execute("UPDATE users SET avatar_filename=%s WHERE id=%s", (key, session['user_id']))
+                            session['avatar'] = key
                 conn.commit()
+                avatars.remove(replaced)
 
             cur.execute("SELECT id, name, email, avatar_filename FROM users WHERE id=%s", (session['user_id'],))
             user = cur.fetchone()
@@ -1,8 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, session
+from decimal import Decimal, InvalidOperation
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, jsonify
 from auth_utils import login_required
+from services import budgets, db, money
 
 categories_bp = Blueprint('categories', __name__, url_prefix='/categories')
 
+
+def _parse_budget(value):
+    """Form value -> ``Decimal`` budget, ``None`` for no budget, ``False`` if invalid."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        budget = Decimal(value)
+    except InvalidOperation:
+        return False
+    return budget if Decimal('0') <= budget <= Decimal('99999999.99') else False
+
+
 @categories_bp.route('/', methods=['GET', 'POST'])
 @login_required
 def index():
@@ -11,27 +26,68 @@ def index():
         with conn.cursor(dictionary=True) as cur:
             if request.method == 'POST':
                 name = request.form['name'].strip()
-                if name:
-                    cur.execute(
-                        "INSERT IGNORE INTO categories (user_id, name) VALUES (%s, %s)",
-                        (session['user_id'], name)
-                    )
+                budget = _parse_budget(request.form.get('budget'))
+                if name and budget is not False:
+                    budgets.create(cur, session['user_id'], name, budget)
                     conn.commit()
 
-            cur.execute("SELECT id, name FROM categories WHERE user_id=%s ORDER BY name", (session['user_id'],))
+            cur.execute(
+                "SELECT id, name, " + money.cents('budget') + " AS budget_cents, "
+                + money.cents('spent') + " AS spent_cents "
+                "FROM categories WHERE user_id=%s ORDER BY name",
+                (session['user_id'],)
+            )
             rows = cur.fetchall()
     finally:
         conn.close()
     return render_template('categories.html', categories=rows)
 
 
+@categories_bp.route('/budget/<int:id>', methods=['POST'])
+@login_required
+def set_budget(id):
+    budget = _parse_budget(request.form.get('budget'))
+    if budget is False:
+        return redirect(url_for('categories.index'))
+    conn = current_app.db_pool.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE categories SET budget=%s WHERE id=%s AND user_id=%s",
+                (None if budget is None else str(budget), id, session['user_id'])
+            )
+            conn.commit()
+    finally:
+        conn.close()
+    return redirect(url_for('categories.index'))
+
+
+@categories_bp.route('/budgets')
+@login_required
+@db.read_only
+def budget_status():
+    """All budgets with spend so far, as JSON (amounts in cents)."""
+    conn = db.get_connection()
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            status = budgets.status(cur, session['user_id'])
+    finally:
+        conn.close()
+    return jsonify(budgets=status, over=[b['category'] for b in status if b['over']])
+
+
 @categories_bp.route('/delete/<int:id>', methods=['POST'])
 @login_required
 def delete(id):
     conn = current_app.db_pool.get_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM categories WHERE id=%s AND user_id=%s", (id, session['user_id']))
+            # Categories still referenced by an expense stay, so their id keeps a name
+            cur.execute("""
+                DELETE FROM categories WHERE id=%s AND user_id=%s
+                AND NOT EXISTS (SELECT 1 FROM expense WHERE user_id=%s AND category_id=%s)
+                AND NOT EXISTS (SELECT 1 FROM archived_expense WHERE user_id=%s AND category_id=%s)
+            """, (id, session['user_id']) + (session['user_id'], id) * 2)
             conn.commit()
     finally:
         conn.close()
@@ -1,48 +1,76 @@
-from flask import Blueprint, render_template, current_app, session
+from datetime import date
+from flask import Blueprint, render_template, request, session
 from auth_utils import login_required
+from services import db, forecast, money, rangestats
+from services.daterange import PRESETS, parse_range
+from services.settings import get_settings
+from services.timeseries import GRANULARITIES, bucket, fit_granularity, parse_granularity
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='')
 
+# Income and expense are each rolled up to one row per month before joining,
+# so the join is month-to-month rather than row-by-row.
+SAVINGS_SERIES_QUERY = """
+    SELECT month, """ + money.cents('savings') + """ AS savings_cents FROM (
+        SELECT m.month_key, m.month,
+               COALESCE(i.total, 0) - COALESCE(e.total, 0) AS savings
+        FROM (
+            SELECT month_key, month FROM archived_income WHERE user_id=%s
+            UNION
+            SELECT month_key, month FROM archived_expense WHERE user_id=%s
+        ) AS m
+        LEFT JOIN (
+            SELECT month_key, SUM(amount) AS total
+            FROM archived_income WHERE user_id=%s
+            GROUP BY month_key
+        ) AS i ON i.month_key = m.month_key
+        LEFT JOIN (
+            SELECT month_key, SUM(amount) AS total
+            FROM archived_expense WHERE user_id=%s
+            GROUP BY month_key
+        ) AS e ON e.month_key = m.month_key
+        UNION ALL
+        -- Months moved to cold storage keep their totals here
+        SELECT month_key, month, income_total - expense_total
+        FROM archive_summary WHERE user_id=%s
+    ) AS s
+    ORDER BY month_key
+"""
+
 @dashboard_bp.route('/')
 @login_required
+@db.read_only
 def index():
-    conn = current_app.db_pool.get_connection()
+    granularity = parse_granularity(request.args.get('granularity'))
+    date_range = parse_range(request.args)
+    range_sql, range_params = date_range.sql()
+
+    conn = db.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
             # Get settings including income mode toggle
-            cur.execute(
-                "SELECT monthly_limit, total_savings, use_automated_income FROM setting WHERE user_id=%s LIMIT 1",
-                (session['user_id'],)
-            )
-            setting = cur.fetchone()
-            monthly_limit = float(setting['monthly_limit']) if setting else 0
-            total_savings = float(setting['total_savings']) if setting else 0
-            use_automated_income = bool(setting['use_automated_income']) if setting else False
+            # All amounts below are integer cents (see services.money)
+            setting = get_settings(cur)
+            monthly_limit = setting['monthly_limit']
+            total_savings = setting['total_savings']
+            use_automated_income = setting['use_automated_income']
 
             # Manual income (user-entered)
             cur.execute(
-                "SELECT COALESCE(SUM(amount), 0) AS total FROM income WHERE user_id=%s",
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents FROM income WHERE user_id=%s",
                 (session['user_id'],)
             )
-            total_manual_income = float(cur.fetchone()['total'])
+            total_manual_income = cur.fetchone()['total_cents']
 
-            cur.execute(
-                "SELECT COALESCE(SUM(amount), 0) AS total FROM expense WHERE user_id=%s",
-                (session['user_id'],)
-            )
-            total_expenses = float(cur.fetchone()['total'])
+            # Range totals; the part before today is cached (services.rangestats)
+            range_stats = rangestats.stats(cur, session['user_id'], date_range)
+            total_expenses = range_stats['total_cents']
 
-            # Automated income (calculated from expenses by done_by)
-            cur.execute("""
-                SELECT done_by, SUM(amount) AS total
-                FROM expense
-                WHERE user_id=%s
-                GROUP BY done_by
-            """, (session['user_id'],))
-            who_data = cur.fetchall()
+            # Automated income: what each person paid
+            who_data = range_stats['people']
             who_labels = [row['done_by'] for row in who_data]
-            who_values = [float(row['total']) for row in who_data]
-            total_automated_income = sum(who_values)
+            total_automated_income = money.sum_column(who_data, 'total_cents')
+            who_values = [money.units(row['total_cents']) for row in who_data]
 
             # Use the appropriate income based on toggle
             total_income = total_automated_income if use_automated_income else total_manual_income
@@ -50,53 +78,38 @@ def index():
 
             grand_total = net_savings + total_savings
 
-            cur.execute("""
-                SELECT category, SUM(amount) AS total
-                FROM expense
-                WHERE user_id=%s
-                GROUP BY category
-            """, (session['user_id'],))
-            category_data = cur.fetchall()
+            category_data = range_stats['categories']
             pie_labels = [row['category'] for row in category_data]
-            pie_values = [float(row['total']) for row in category_data]
+            pie_values = [money.units(row['total_cents']) for row in category_data]
 
-            cur.execute("""
-                SELECT DATE_FORMAT(date, '%b %d') AS day, SUM(amount) AS total
-                FROM expense
-                WHERE user_id=%s
-                GROUP BY DATE_FORMAT(date, '%b %d')
-                ORDER BY DATE_FORMAT(date, '%b %d')
-            """, (session['user_id'],))
-            daily_data = cur.fetchall()
-            daily_labels = [row['day'] for row in daily_data]
-            daily_values = [float(row['total']) for row in daily_data]
+            daily_rows = range_stats['daily']
+            granularity = fit_granularity(daily_rows, granularity)
+            daily_labels, daily_values = bucket(daily_rows, granularity)
 
-            cur.execute("""
-                SELECT DATE_FORMAT(e.date, '%b') AS mon,
-                       COALESCE(SUM(i.amount), 0) - COALESCE(SUM(e.amount), 0) AS savings
-                FROM expense e
-                LEFT JOIN income i ON i.user_id = e.user_id
-                WHERE e.user_id=%s
-                GROUP BY DATE_FORMAT(e.date, '%b')
-                ORDER BY DATE_FORMAT(e.date, '%b')
-            """, (session['user_id'],))
+            # Archived months first, then the live (not yet archived) period
+            cur.execute(SAVINGS_SERIES_QUERY, (session['user_id'],) * 5)
             monthly_data = cur.fetchall()
-            savings_labels = [row['mon'] for row in monthly_data]
-            savings_values = [float(row['savings']) for row in monthly_data]
+            savings_labels = [row['month'] for row in monthly_data]
+            savings_values = [money.units(row['savings_cents']) for row in monthly_data]
+            if total_income or total_expenses:
+                savings_labels.append('Current')
+                savings_values.append(money.units(net_savings))
 
             # Recent expenses for quick view
             cur.execute("""
-                SELECT id, amount, category, note, date
+                SELECT id, """ + money.cents('amount') + """ AS amount_cents, category, note, date
                 FROM expense
-                WHERE user_id=%s
+                WHERE user_id=%s""" + range_sql + """
                 ORDER BY date DESC, id DESC
                 LIMIT 5
-            """, (session['user_id'],))
+            """, (session['user_id'], *range_params))
             recent_expenses = cur.fetchall()
+            expense_count = range_stats['count']
 
-            # Expense count
-            cur.execute("SELECT COUNT(*) AS cnt FROM expense WHERE user_id=%s", (session['user_id'],))
-            expense_count = int(cur.fetchone()['cnt'])
+            # Month-end projection; incremental, so cheap after the first load
+            month_forecast = None
+            if monthly_limit:
+                month_forecast = forecast.month_end(cur, session['user_id'], date.today(), monthly_limit)
 
         return render_template(
             "dashboard.html",
@@ -109,10 +122,15 @@ def index():
             total_savings=total_savings,
             grand_total=grand_total,
             monthly_limit=monthly_limit,
+            forecast=month_forecast,
             pie_labels=pie_labels,
             pie_values=pie_values,
             daily_labels=daily_labels,
             daily_values=daily_values,
+            granularity=granularity,
+            granularities=GRANULARITIES,
+            date_range=date_range,
+            range_presets=PRESETS,
             savings_labels=savings_labels,
             savings_values=savings_values,
             who_labels=who_labels,
@@ -1,9 +1,12 @@
-import os
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, flash
-from werkzeug.utils import secure_filename
 from auth_utils import login_required
+from services import budgets, categories, forecast, money, people, receipts, thumbnails
+from services.daterange import PRESETS, parse_range
+from services.search import search_expenses
+from services.settings import get_settings
+from services.uploads import UploadRejected
 
 expenses_bp = Blueprint('expenses', __name__, url_prefix='/expenses')
 
@@ -17,6 +20,8 @@ def allowed_attachment(filename):
 def index():
     category_filter = request.args.get('category', '')
     person_filter = request.args.get('person', '')
+    date_range = parse_range(request.args)
+    range_sql, range_params = date_range.sql()
 
     conn = current_app.db_pool.get_connection()
     try:
@@ -26,8 +31,8 @@ def index():
                 SELECT id, amount, category, note, date, attachment, done_by
                 FROM expense
                 WHERE user_id=%s
-            """
-            params = [session['user_id']]
+            """ + range_sql
+            params = [session['user_id'], *range_params]
 
             if category_filter:
                 expense_query += " AND category=%s"
@@ -40,58 +45,76 @@ def index():
             cur.execute(expense_query, tuple(params))
             expenses = cur.fetchall()
 
-            # Unfiltered totals for summary
+            # Totals for summary (date range only, not category/person)
             cur.execute(
-                "SELECT COALESCE(SUM(amount),0) AS total, COUNT(*) AS count FROM expense WHERE user_id=%s",
-                (session['user_id'],)
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents, COUNT(*) AS count FROM expense WHERE user_id=%s" + range_sql,
+                (session['user_id'], *range_params)
             )
             summary = cur.fetchone()
-            total_expenses = float(summary['total'])
+            total_expenses = summary['total_cents']
             expense_count = int(summary['count'])
 
             # Category breakdown for filter + top category
-            cur.execute("""
-                SELECT category, SUM(amount) AS total, COUNT(*) AS count
-                FROM expense WHERE user_id=%s
-                GROUP BY category ORDER BY total DESC
-            """, (session['user_id'],))
-            categories = cur.fetchall()
-            top_category = categories[0]['category'] if categories else None
-            category_list = [r['category'] for r in categories]
+            cur.execute(categories.grouped(
+                "SUM(amount) AS total, COUNT(*) AS count",
+                "FROM expense WHERE user_id=%s" + range_sql,
+            ) + " ORDER BY total DESC", (session['user_id'], *range_params))
+            breakdown = cur.fetchall()
+            top_category = breakdown[0]['category'] if breakdown else None
+            category_list = [r['category'] for r in breakdown]
 
             # Persons for filter
             cur.execute(
-                "SELECT DISTINCT done_by FROM expense WHERE user_id=%s AND done_by IS NOT NULL",
-                (session['user_id'],)
+                "SELECT DISTINCT done_by FROM expense WHERE user_id=%s AND done_by IS NOT NULL" + range_sql,
+                (session['user_id'], *range_params)
             )
             person_list = [r['done_by'] for r in cur.fetchall()]
 
-            cur.execute("""
-                SELECT default_done_by
-                FROM setting
-                WHERE user_id=%s
-                LIMIT 1
-            """, (session['user_id'],))
-            row = cur.fetchone()
-            default_done_by = row['default_done_by'] if row else None
+            default_done_by = get_settings(cur)['default_done_by']
 
         return render_template(
             'expenses.html',
             expenses=expenses,
             current_date=date.today(),
             default_done_by=default_done_by,
-            total_expenses=total_expenses,
+            total_expenses=money.units(total_expenses),
             expense_count=expense_count,
             top_category=top_category,
             category_list=category_list,
             person_list=person_list,
             category_filter=category_filter,
             person_filter=person_filter,
+            date_range=date_range,
+            range_presets=PRESETS,
         )
     finally:
         conn.close()
 
 
+@expenses_bp.route('/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()[:200]
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results, has_next = [], False
+    if q:
+        conn = current_app.db_pool.get_connection()
+        try:
+            with conn.cursor(dictionary=True) as cur:
+                results, has_next = search_expenses(cur, session['user_id'], q, page)
+        finally:
+            conn.close()
+
+    return render_template(
+        'expenses/search.html',
+        q=q,
+        page=page,
+        results=results,
+        has_next=has_next,
+    )
+
+
 @expenses_bp.route('/add', methods=['GET', 'POST'])
 @login_required
 def add_expense():
@@ -99,9 +122,7 @@ def add_expense():
         conn = current_app.db_pool.get_connection()
         try:
             with conn.cursor(dictionary=True) as cur:
-                cur.execute("SELECT default_done_by FROM setting WHERE user_id=%s LIMIT 1", (session['user_id'],))
-                row = cur.fetchone()
-                default_done_by = row['default_done_by'] if row else None
+                default_done_by = get_settings(cur)['default_done_by']
             return render_template('expenses/add.html', current_date=date.today(), default_done_by=default_done_by)
         finally:
             conn.close()
@@ -140,22 +161,36 @@ def add_expense():
         return redirect(url_for('expenses.add_expense'))
 
     file = request.files.get('attachment')
-    filename = None
-    if file and file.filename and allowed_attachment(file.filename):
-        filename = secure_filename(file.filename)
-        filename = f"user{session['user_id']}_{filename}"
-        os.makedirs(current_app.config['RECEIPT_FOLDER'], exist_ok=True)
-        file.save(os.path.join(current_app.config['RECEIPT_FOLDER'], filename))
 
     conn = current_app.db_pool.get_connection()
+    filename = None
     try:
         with conn.cursor() as cur:
+            if file and file.filename and allowed_attachment(file.filename):
+                try:
+                    filename = receipts.store(cur, file, session['user_id'])
+                except UploadRejected:
+                    flash("Receipt content doesn't match its file type.", "error")
+                    return redirect(url_for('expenses.add_expense'))
+
+            categories.ensure(cur, session['user_id'], category)
+            people.ensure(cur, session['user_id'], done_by)
             cur.execute(
-                "INSERT INTO expense (amount, category, note, date, user_id, attachment, done_by) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (str(amount_val), category, note or None, date_str, session['user_id'], filename, done_by)
+                "INSERT INTO expense (amount, category, category_id, note, date, user_id, attachment, done_by, person_id) "
+                "VALUES (%s, %s, " + categories.ID_SQL + ", %s, %s, %s, %s, %s, " + people.ID_SQL + ")",
+                (str(amount_val), category, session['user_id'], category, note or None, date_str,
+                 session['user_id'], filename, done_by, session['user_id'], done_by)
             )
+            budgets.record(cur, session['user_id'], category, amount_val)
+            people.record(cur, session['user_id'], done_by, amount_val)
+            forecast.expense_changed(cur, session['user_id'], date.fromisoformat(date_str))
             conn.commit()
+        thumbnails.schedule(filename)
         return redirect(url_for('expenses.index'))
+    except Exception:
+        # Nothing references a blob stored for a write that didn't commit
+        receipts.abandon(conn, session['user_id'], filename)
+        raise
     finally:
         conn.close()
 
@@ -164,6 +199,7 @@ def add_expense():
 @login_required
 def edit_expense(id):
     conn = current_app.db_pool.get_connection()
+    new_filename = None
     try:
         with conn.cursor(dictionary=True) as cur:
             cur.execute(
@@ -207,24 +243,40 @@ def edit_expense(id):
                 return redirect(url_for('expenses.edit_expense', id=id))
 
             file = request.files.get('attachment')
-            new_filename = None
+            orphaned = False
             if file and file.filename and allowed_attachment(file.filename):
-                new_filename = secure_filename(file.filename)
-                new_filename = f"user{session['user_id']}_{new_filename}"
-                os.makedirs(current_app.config['RECEIPT_FOLDER'], exist_ok=True)
-                file.save(os.path.join(current_app.config['RECEIPT_FOLDER'], new_filename))
-
+                try:
+                    new_filename = receipts.store(cur, file, session['user_id'])
+                except UploadRejected:
+                    flash("Receipt content doesn't match its file type.", "error")
+                    return redirect(url_for('expenses.edit_expense', id=id))
+                orphaned = receipts.release(cur, session['user_id'], expense['attachment'])
+
+            categories.ensure(cur, session['user_id'], category)
+            people.ensure(cur, session['user_id'], done_by)
+            assignments = (
+                "amount=%s, category=%s, category_id=" + categories.ID_SQL + ", note=%s, date=%s, "
+                "done_by=%s, person_id=" + people.ID_SQL
+            )
+            params = [str(amount_val), category, session['user_id'], category, note or None, date_str,
+                      done_by, session['user_id'], done_by]
             if new_filename:
-                cur.execute(
-                    "UPDATE expense SET amount=%s, category=%s, note=%s, date=%s, attachment=%s, done_by=%s WHERE id=%s AND user_id=%s",
-                    (str(amount_val), category, note or None, date_str, new_filename, done_by, id, session['user_id'])
-                )
-            else:
-                cur.execute(
-                    "UPDATE expense SET amount=%s, category=%s, note=%s, date=%s, done_by=%s WHERE id=%s AND user_id=%s",
-                    (str(amount_val), category, note or None, date_str, done_by, id, session['user_id'])
-                )
+                assignments += ", attachment=%s"
+                params.append(new_filename)
+            cur.execute(
+                "UPDATE expense SET " + assignments + " WHERE id=%s AND user_id=%s",
+                (*params, id, session['user_id'])
+            )
+            budgets.move(cur, session['user_id'], expense['category'], expense['amount'], category, amount_val)
+            people.move(cur, session['user_id'], expense['done_by'], expense['amount'], done_by, amount_val)
+            forecast.expense_changed(cur, session['user_id'], expense['date'], date.fromisoformat(date_str))
             conn.commit()
+        thumbnails.schedule(new_filename)
+        if orphaned:
+            receipts.purge(conn, session['user_id'], expense['attachment'])
+    except Exception:
+        receipts.abandon(conn, session['user_id'], new_filename)
+        raise
     finally:
         conn.close()
 
@@ -236,9 +288,20 @@ def edit_expense(id):
 def delete_expense(id):
     conn = current_app.db_pool.get_connection()
     try:
-        with conn.cursor() as cur:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("SELECT attachment, date, amount, category, done_by FROM expense WHERE id=%s AND user_id=%s", (id, session['user_id']))
+            row = cur.fetchone()
+            attachment = row['attachment'] if row else None
+
             cur.execute("DELETE FROM expense WHERE id=%s AND user_id=%s", (id, session['user_id']))
+            if row and cur.rowcount:
+                budgets.record(cur, session['user_id'], row['category'], -row['amount'])
+                people.record(cur, session['user_id'], row['done_by'], -row['amount'])
+                forecast.expense_changed(cur, session['user_id'], row['date'])
+            orphaned = receipts.release(cur, session['user_id'], attachment)
             conn.commit()
+        if orphaned:
+            receipts.purge(conn, session['user_id'], attachment)
         return redirect(url_for('expenses.index'))
     finally:
         conn.close()
@@ -1,64 +1,79 @@
-from flask import Blueprint, render_template, request, current_app, session
+from flask import Blueprint, render_template, request, session
 from auth_utils import login_required
+from services import analytics, archive, categories, coldstore, db, money, people
+from services.daterange import PRESETS, parse_range
 
 history_bp = Blueprint('history', __name__, url_prefix='/history')
 
 
 @history_bp.route('/')
 @login_required
+@db.read_only
 def index():
-    conn = current_app.db_pool.get_connection()
+    # Archives are month-granular, so a date range selects whole months
+    date_range = parse_range(request.args)
+    range_sql, range_params = date_range.month_sql()
+
+    conn = db.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
-            # Get all archived months
+            # Get all archived months, including those moved to cold storage
             cur.execute("""
-                SELECT month FROM archived_income WHERE user_id=%s
+                SELECT month_key, month, NULL AS file_key FROM archived_income WHERE user_id=%s""" + range_sql + """
+                UNION
+                SELECT month_key, month, NULL AS file_key FROM archived_expense WHERE user_id=%s""" + range_sql + """
                 UNION
-                SELECT month FROM archived_expense WHERE user_id=%s
-                ORDER BY month DESC
-            """, (session['user_id'], session['user_id']))
-            months = [row['month'] for row in cur.fetchall()]
+                SELECT month_key, month, file_key FROM archive_summary WHERE user_id=%s""" + range_sql + """
+                ORDER BY month_key DESC
+            """, (session['user_id'], *range_params) * 3)
+            month_rows = cur.fetchall()
+            months = [row['month'] for row in month_rows]
+            cold_files = {row['month']: row['file_key'] for row in month_rows if row.get('file_key')}
 
             selected_month = request.args.get('month') or (months[0] if months else None)
             category_filter = request.args.get('category', '')
 
+            # Amounts are integer cents (see services.money)
             archived_income = []
             archived_expenses = []
-            total_income_month = 0.0
-            total_expense_month = 0.0
+            total_income_month = 0
+            total_expense_month = 0
             category_breakdown = {}
             expense_categories = []
 
             actual_income_by_person = {}
-            total_actual_income_month = 0.0
+            total_actual_income_month = 0
+
+            month_key = archive.month_key(selected_month)
 
-            if selected_month:
+            if selected_month in cold_files:
+                (archived_income, actual_income_by_person, archived_expenses,
+                 category_breakdown) = _cold_month(
+                    session['user_id'], month_key, cold_files[selected_month], category_filter
+                )
+            elif selected_month:
                 # Expected Income (manually entered, archived)
                 cur.execute(
-                    "SELECT id, source, amount FROM archived_income WHERE month=%s AND user_id=%s",
-                    (selected_month, session['user_id'])
+                    "SELECT id, source, " + money.cents('amount') + " AS amount_cents "
+                    "FROM archived_income WHERE month_key=%s AND user_id=%s",
+                    (month_key, session['user_id'])
                 )
-                archived_income = [
-                    {"id": r['id'], "source": r['source'], "amount": float(r['amount'])}
-                    for r in cur.fetchall()
-                ]
-                total_income_month = sum(i["amount"] for i in archived_income)
+                archived_income = cur.fetchall()
 
                 # Actual Income (calculated from archived expenses grouped by done_by)
-                cur.execute("""
-                    SELECT done_by, SUM(amount) AS total
-                    FROM archived_expense WHERE month=%s AND user_id=%s GROUP BY done_by
-                """, (selected_month, session['user_id']))
-                actual_income_by_person = {row['done_by']: float(row['total']) for row in cur.fetchall()}
-                total_actual_income_month = sum(actual_income_by_person.values())
+                cur.execute(people.grouped(
+                    money.cents('SUM(amount)') + " AS total_cents",
+                    "FROM archived_expense WHERE month_key=%s AND user_id=%s",
+                ), (month_key, session['user_id']))
+                actual_income_by_person = money.totals_by(cur.fetchall(), 'done_by', 'total_cents')
 
                 # Expenses
                 expense_query = """
-                    SELECT id, amount, category, note, date, done_by
+                    SELECT id, """ + money.cents('amount') + """ AS amount_cents, category, note, date, done_by
                     FROM archived_expense
-                    WHERE month=%s AND user_id=%s
+                    WHERE month_key=%s AND user_id=%s
                 """
-                expense_params = [selected_month, session['user_id']]
+                expense_params = [month_key, session['user_id']]
 
                 if category_filter:
                     expense_query += " AND category=%s"
@@ -66,42 +81,25 @@ def index():
 
                 expense_query += " ORDER BY date DESC"
                 cur.execute(expense_query, tuple(expense_params))
+                archived_expenses = cur.fetchall()
 
-                archived_expenses = [
-                    {
-                        "id": r['id'],
-                        "amount": float(r['amount']),
-                        "category": r['category'],
-                        "note": r['note'],
-                        "date": r['date'],
-                        "done_by": r['done_by'],
-                    }
-                    for r in cur.fetchall()
-                ]
-
-                # Total expenses (unfiltered for summary)
-                cur.execute(
-                    "SELECT COALESCE(SUM(amount),0) AS total FROM archived_expense WHERE month=%s AND user_id=%s",
-                    (selected_month, session['user_id'])
-                )
-                total_expense_month = float(cur.fetchone()['total'])
-
-                # Category breakdown
-                cur.execute("""
-                    SELECT category, SUM(amount) AS total, COUNT(*) AS count
-                    FROM archived_expense
-                    WHERE month=%s AND user_id=%s
-                    GROUP BY category
-                    ORDER BY total DESC
-                """, (selected_month, session['user_id']))
+                # Category breakdown; also gives the unfiltered month total
+                cur.execute(categories.grouped(
+                    money.cents('SUM(amount)') + " AS total_cents, COUNT(*) AS count",
+                    "FROM archived_expense WHERE month_key=%s AND user_id=%s",
+                ) + " ORDER BY total_cents DESC", (month_key, session['user_id']))
                 category_breakdown = {
-                    r['category']: {"total": float(r['total']), "count": int(r['count'])}
+                    r['category']: {"total": r['total_cents'], "count": int(r['count'])}
                     for r in cur.fetchall()
                 }
-                expense_categories = list(category_breakdown.keys())
+
+            total_income_month = money.sum_column(archived_income, 'amount_cents')
+            total_actual_income_month = sum(actual_income_by_person.values())
+            total_expense_month = sum(entry["total"] for entry in category_breakdown.values())
+            expense_categories = list(category_breakdown.keys())
 
         net_savings = total_income_month - total_expense_month
-        savings_rate = (net_savings / total_income_month * 100) if total_income_month else 0
+        savings_rate = money.percent(net_savings, total_income_month)
         income_variance = total_income_month - total_actual_income_month
 
         return render_template(
@@ -120,27 +118,73 @@ def index():
             category_breakdown=category_breakdown,
             expense_categories=expense_categories,
             category_filter=category_filter,
+            date_range=date_range,
+            range_presets=PRESETS,
         )
     finally:
         conn.close()
 
 
+def _cold_month(user_id, month_key, file_key, category_filter):
+    """The same rows ``index`` queries for, computed from a compacted month."""
+    data = coldstore.load_month(user_id, month_key, file_key)
+    incomes = [
+        {"id": r['id'], "source": r['source'], "amount_cents": money.to_cents(r['amount'])}
+        for r in data['income']
+    ]
+    # Blocks are stored newest first, as the live query orders them
+    expenses = [
+        {
+            "id": r['id'],
+            "amount_cents": money.to_cents(r['amount']),
+            "category": r['category'],
+            "note": r['note'],
+            "date": r['date'],
+            "done_by": r['done_by'],
+        }
+        for r in data['expense']
+    ]
+
+    breakdown = {}
+    for r in expenses:
+        entry = breakdown.setdefault(r['category'], {"total": 0, "count": 0})
+        entry["total"] += r['amount_cents']
+        entry["count"] += 1
+    breakdown = dict(sorted(breakdown.items(), key=lambda item: item[1]["total"], reverse=True))
+
+    by_person = money.group_sum(expenses, 'done_by', 'amount_cents')
+    if category_filter:
+        expenses = [r for r in expenses if r['category'] == category_filter]
+    return incomes, by_person, expenses, breakdown
+
+
 @history_bp.route('/expense/<int:id>')
 @login_required
+@db.read_only
 def view_archived_expense(id):
-    conn = current_app.db_pool.get_connection()
+    # ?month= lets MySQL prune to one partition and finds compacted rows
+    month_key = archive.month_key(request.args.get('month'))
+    conn = db.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(
-                """
+            query = """
                 SELECT id, amount, category, note, date, done_by
                 FROM archived_expense
                 WHERE id=%s AND user_id=%s
-                """,
-                (id, session['user_id'])
-            )
+            """
+            params = [id, session['user_id']]
+            if month_key:
+                query += " AND month_key=%s"
+                params.append(month_key)
+            cur.execute(query, tuple(params))
             expense = cur.fetchone()
 
+            if not expense and month_key:
+                cold = coldstore.summary(cur, session['user_id'], month_key)
+                if cold:
+                    data = coldstore.load_month(session['user_id'], month_key, cold['file_key'])
+                    expense = next((r for r in data['expense'] if r['id'] == id), None)
+
         if not expense:
             return "Archived expense not found", 404
 
@@ -154,112 +198,36 @@ def view_archived_expense(id):
 
 @history_bp.route('/compare', methods=['GET'])
 @login_required
+@db.read_only
 def compare():
-    conn = current_app.db_pool.get_connection()
+    date_range = parse_range(request.args)
+    range_sql, range_params = date_range.month_sql()
+
+    conn = db.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
 
             cur.execute("""
-                SELECT DISTINCT month FROM archived_income WHERE user_id=%s
+                SELECT month_key, month FROM archived_income WHERE user_id=%s""" + range_sql + """
                 UNION
-                SELECT DISTINCT month FROM archived_expense WHERE user_id=%s
-                ORDER BY month DESC
-            """, (session['user_id'], session['user_id']))
+                SELECT month_key, month FROM archived_expense WHERE user_id=%s""" + range_sql + """
+                UNION
+                SELECT month_key, month FROM archive_summary WHERE user_id=%s""" + range_sql + """
+                ORDER BY month_key DESC
+            """, (session['user_id'], *range_params) * 3)
             months = [r['month'] for r in cur.fetchall()]
 
             m1 = request.args.get('m1')
             m2 = request.args.get('m2')
 
             comparison = None
-
-            # All-months trend data
             trend = []
             if months:
-                for month in reversed(months):
-                    cur.execute(
-                        "SELECT COALESCE(SUM(amount),0) AS total FROM archived_income WHERE user_id=%s AND month=%s",
-                        (session['user_id'], month)
-                    )
-                    inc = float(cur.fetchone()['total'])
-                    cur.execute(
-                        "SELECT COALESCE(SUM(amount),0) AS total FROM archived_expense WHERE user_id=%s AND month=%s",
-                        (session['user_id'], month)
-                    )
-                    exp = float(cur.fetchone()['total'])
-                    trend.append({
-                        "month": month,
-                        "income": inc,
-                        "expense": exp,
-                        "net": inc - exp,
-                        "savings_rate": round((inc - exp) / inc * 100, 1) if inc else 0
-                    })
-
-            if m1 and m2:
-                # Income totals
-                cur.execute("""
-                    SELECT month, COALESCE(SUM(amount),0) AS total
-                    FROM archived_income
-                    WHERE user_id=%s AND month IN (%s,%s)
-                    GROUP BY month
-                """, (session['user_id'], m1, m2))
-                income = {r['month']: float(r['total']) for r in cur.fetchall()}
-
-                # Expense totals
-                cur.execute("""
-                    SELECT month, COALESCE(SUM(amount),0) AS total
-                    FROM archived_expense
-                    WHERE user_id=%s AND month IN (%s,%s)
-                    GROUP BY month
-                """, (session['user_id'], m1, m2))
-                expense = {r['month']: float(r['total']) for r in cur.fetchall()}
-
-                # Category breakdown
-                cur.execute("""
-                    SELECT category, month, SUM(amount) AS total
-                    FROM archived_expense
-                    WHERE user_id=%s AND month IN (%s,%s)
-                    GROUP BY category, month
-                """, (session['user_id'], m1, m2))
-
-                cat_raw = cur.fetchall()
-                categories = {}
-                for r in cat_raw:
-                    categories.setdefault(r['category'], {})
-                    categories[r['category']][r['month']] = float(r['total'])
-
-                # Income source breakdown
-                cur.execute("""
-                    SELECT source, month, SUM(amount) AS total
-                    FROM archived_income
-                    WHERE user_id=%s AND month IN (%s,%s)
-                    GROUP BY source, month
-                """, (session['user_id'], m1, m2))
-                src_raw = cur.fetchall()
-                income_sources = {}
-                for r in src_raw:
-                    income_sources.setdefault(r['source'], {})
-                    income_sources[r['source']][r['month']] = float(r['total'])
-
-                i1 = income.get(m1, 0)
-                i2 = income.get(m2, 0)
-                e1 = expense.get(m1, 0)
-                e2 = expense.get(m2, 0)
-                n1 = i1 - e1
-                n2 = i2 - e2
-
-                comparison = {
-                    "m1": m1,
-                    "m2": m2,
-                    "income": income,
-                    "expense": expense,
-                    "net": {m1: n1, m2: n2},
-                    "categories": categories,
-                    "income_sources": income_sources,
-                    "savings_rate": {
-                        m1: round(n1 / i1 * 100, 1) if i1 else 0,
-                        m2: round(n2 / i2 * 100, 1) if i2 else 0,
-                    },
-                }
+                # One load per user, then trend and comparison are array ops
+                cols = analytics.get_columns(cur, session['user_id'])
+                trend = analytics.trend(cols, [archive.month_key(m) for m in months])
+                if m1 and m2:
+                    comparison = analytics.comparison(cols, m1, m2)
 
         return render_template(
             "history/compare.html",
@@ -268,6 +236,8 @@ def compare():
             m1=m1,
             m2=m2,
             trend=trend,
+            date_range=date_range,
+            range_presets=PRESETS,
         )
 
     finally:
@@ -1,6 +1,8 @@
 from decimal import Decimal, InvalidOperation
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, flash
 from auth_utils import login_required
+from services import money, people
+from services.settings import get_settings
 
 income_bp = Blueprint('income', __name__, url_prefix='/income')
 
@@ -11,21 +13,19 @@ def index():
     try:
         with conn.cursor(dictionary=True) as cur:
             # Check income mode setting
-            cur.execute("SELECT use_automated_income FROM setting WHERE user_id=%s LIMIT 1", (session['user_id'],))
-            setting = cur.fetchone()
-            use_automated_income = bool(setting['use_automated_income']) if setting else False
-
-            # Manual income (user-entered)
-            cur.execute("SELECT id, source, amount FROM income WHERE user_id=%s ORDER BY amount DESC", (session['user_id'],))
-            incomes = [{"id": row['id'], "source": row['source'], "amount": float(row['amount'])} for row in cur.fetchall()]
-            total_manual_income = sum(i['amount'] for i in incomes)
-
-            # Automated income (calculated from expenses grouped by done_by)
-            cur.execute("""
-                SELECT done_by, SUM(amount) AS total
-                FROM expense WHERE user_id=%s GROUP BY done_by
-            """, (session['user_id'],))
-            income_by_person = {row['done_by']: float(row['total']) for row in cur.fetchall()}
+            use_automated_income = get_settings(cur)['use_automated_income']
+
+            # Manual income (user-entered), amounts in cents
+            cur.execute(
+                "SELECT id, source, " + money.cents('amount') + " AS amount_cents "
+                "FROM income WHERE user_id=%s ORDER BY amount DESC",
+                (session['user_id'],)
+            )
+            incomes = cur.fetchall()
+            total_manual_income = money.sum_column(incomes, 'amount_cents')
+
+            # Automated income: running per-person totals (services.people)
+            income_by_person = money.totals_by(people.totals(cur, session['user_id']), 'done_by', 'total_cents')
             total_automated_income = sum(income_by_person.values())
 
         return render_template(
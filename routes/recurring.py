@@ -0,0 +1,95 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, flash
+from auth_utils import login_required
+from services import archive, money, recurring
+
+recurring_bp = Blueprint('recurring', __name__, url_prefix='/recurring')
+
+@recurring_bp.route('/', methods=['GET', 'POST'])
+@login_required
+def index():
+    if request.method == 'POST':
+        kind = request.form.get('kind', '')
+        label = request.form.get('label', '').strip()
+        amount = request.form.get('amount', '')
+        day = request.form.get('day', '1')
+        note = request.form.get('note', '').strip()
+        done_by = request.form.get('done_by', '').strip()
+
+        if kind not in recurring.KINDS:
+            flash("Choose expense or income.", "error")
+            return redirect(url_for('recurring.index'))
+        max_label = 50 if kind == 'expense' else 100
+        if not label or len(label) > max_label:
+            flash(f"{'Category' if kind == 'expense' else 'Source'} is required (max {max_label} chars).", "error")
+            return redirect(url_for('recurring.index'))
+        try:
+            amount_val = Decimal(amount)
+            if amount_val < 0 or amount_val > Decimal('99999999.99'):
+                raise ValueError
+        except (InvalidOperation, ValueError):
+            flash("Please enter a valid positive amount.", "error")
+            return redirect(url_for('recurring.index'))
+        if not day.isdigit() or not 1 <= int(day) <= 31:
+            flash("Day must be between 1 and 31.", "error")
+            return redirect(url_for('recurring.index'))
+        if len(done_by) > 50 or len(note) > 1000:
+            flash("Done By is max 50 chars and note max 1000.", "error")
+            return redirect(url_for('recurring.index'))
+
+    conn = current_app.db_pool.get_connection()
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            if request.method == 'POST':
+                cur.execute(
+                    "INSERT INTO recurring (user_id, kind, label, amount, day, note, done_by) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    (session['user_id'], kind, label, str(amount_val), int(day),
+                     note or None, (done_by or None) if kind == 'expense' else None)
+                )
+                conn.commit()
+                return redirect(url_for('recurring.index'))
+
+            cur.execute(
+                "SELECT id, kind, label, " + money.cents('amount') + " AS amount_cents, day, note, done_by, last_month_key "
+                "FROM recurring WHERE user_id=%s ORDER BY kind, day, label",
+                (session['user_id'],)
+            )
+            templates = cur.fetchall()
+    finally:
+        conn.close()
+    return render_template(
+        'recurring.html',
+        templates=templates,
+        current_key=archive.key_for(date.today()),
+        month_label=archive.month_label,
+    )
+
+
+@recurring_bp.route('/apply', methods=['POST'])
+@login_required
+def apply():
+    """Copy due templates into the current month now, instead of waiting for rollover."""
+    conn = current_app.db_pool.get_connection()
+    try:
+        with conn.cursor() as cur:
+            inserted = recurring.materialize(cur, [session['user_id']], archive.key_for(date.today()))
+            conn.commit()
+    finally:
+        conn.close()
+    flash(f"Added {inserted} recurring entr{'y' if inserted == 1 else 'ies'} to this month.", "success")
+    return redirect(url_for('recurring.index'))
+
+
+@recurring_bp.route('/delete/<int:id>', methods=['POST'])
+@login_required
+def delete(id):
+    conn = current_app.db_pool.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM recurring WHERE id=%s AND user_id=%s", (id, session['user_id']))
+            conn.commit()
+    finally:
+        conn.close()
+    return redirect(url_for('recurring.index'))
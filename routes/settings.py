@@ -2,6 +2,8 @@ from decimal import Decimal, InvalidOperation
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, session, flash
 from datetime import datetime
 from auth_utils import login_required
+from services import archive, budgets, money, people, receipts, recurring, search, storage, versions
+from services.settings import get_settings, invalidate
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
 
@@ -11,38 +13,33 @@ def index():
     conn = current_app.db_pool.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute("""
-                SELECT monthly_limit, total_savings, default_done_by, use_automated_income
-                FROM setting
-                WHERE user_id=%s
-                LIMIT 1
-            """, (session['user_id'],))
-            setting = cur.fetchone()
-
-            current_limit = float(setting['monthly_limit']) if setting else 0
-            total_savings = float(setting['total_savings']) if setting else 0
-            default_done_by = setting['default_done_by'] if setting else None
-            use_automated_income = bool(setting['use_automated_income']) if setting else False
-
-            # Manual income (user-entered)
-            cur.execute("SELECT COALESCE(SUM(amount),0) AS total, COUNT(*) AS count FROM income WHERE user_id=%s", (session['user_id'],))
+            setting = get_settings(cur)
+
+            current_limit = setting['monthly_limit']
+            total_savings = setting['total_savings']
+            default_done_by = setting['default_done_by']
+            use_automated_income = setting['use_automated_income']
+
+            # Manual income (user-entered); amounts here are integer cents
+            cur.execute(
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents, COUNT(*) AS count FROM income WHERE user_id=%s",
+                (session['user_id'],)
+            )
             inc_row = cur.fetchone()
-            month_manual_income = float(inc_row['total'])
+            month_manual_income = inc_row['total_cents']
             income_count = int(inc_row['count'])
 
             # Expenses
-            cur.execute("SELECT COALESCE(SUM(amount),0) AS total, COUNT(*) AS count FROM expense WHERE user_id=%s", (session['user_id'],))
+            cur.execute(
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents, COUNT(*) AS count FROM expense WHERE user_id=%s",
+                (session['user_id'],)
+            )
             exp_row = cur.fetchone()
-            month_expenses = float(exp_row['total'])
+            month_expenses = exp_row['total_cents']
             expense_count = int(exp_row['count'])
 
-            # Automated income (from expenses grouped by done_by)
-            cur.execute("""
-                SELECT done_by, SUM(amount) AS total
-                FROM expense WHERE user_id=%s GROUP BY done_by
-            """, (session['user_id'],))
-            automated_income_by_person = {row['done_by']: float(row['total']) for row in cur.fetchall()}
-            month_automated_income = sum(automated_income_by_person.values())
+            # Automated income: running per-person totals (services.people)
+            month_automated_income = money.sum_column(people.totals(cur, session['user_id']), 'total_cents')
 
             # Use the appropriate income based on toggle
             month_income = month_automated_income if use_automated_income else month_manual_income
@@ -50,12 +47,14 @@ def index():
 
             # Count archived months
             cur.execute("""
-                SELECT COUNT(DISTINCT month) AS cnt FROM (
-                    SELECT month FROM archived_income WHERE user_id=%s
+                SELECT COUNT(DISTINCT month_key) AS cnt FROM (
+                    SELECT month_key FROM archived_income WHERE user_id=%s
                     UNION
-                    SELECT month FROM archived_expense WHERE user_id=%s
+                    SELECT month_key FROM archived_expense WHERE user_id=%s
+                    UNION
+                    SELECT month_key FROM archive_summary WHERE user_id=%s
                 ) AS months
-            """, (session['user_id'], session['user_id']))
+            """, (session['user_id'],) * 3)
             archived_months = int(cur.fetchone()['cnt'])
 
         return render_template(
@@ -69,6 +68,7 @@ def index():
             month_income=month_income,
             month_expenses=month_expenses,
             month_net=month_net,
+            limit_percent=money.percent(month_expenses, current_limit),
             income_count=income_count,
             expense_count=expense_count,
             archived_months=archived_months,
@@ -106,22 +106,29 @@ def update_limit():
             cur.execute("SELECT id FROM setting WHERE user_id=%s LIMIT 1", (session['user_id'],))
             row = cur.fetchone()
 
+            if default_done_by:
+                people.ensure(cur, session['user_id'], default_done_by)
             if not row:
                 cur.execute("""
-                    INSERT INTO setting (monthly_limit, total_savings, default_done_by, use_automated_income, user_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (str(limit_val), str(savings_val), default_done_by or None, 1 if use_automated_income else 0, session['user_id']))
+                    INSERT INTO setting (monthly_limit, total_savings, default_done_by, default_person_id, use_automated_income, user_id)
+                    VALUES (%s, %s, %s, """ + people.ID_SQL + """, %s, %s)
+                """, (str(limit_val), str(savings_val), default_done_by or None, session['user_id'], default_done_by or None,
+                      1 if use_automated_income else 0, session['user_id']))
             else:
                 cur.execute("""
                     UPDATE setting
                     SET monthly_limit=%s,
                         total_savings=%s,
                         default_done_by=%s,
+                        default_person_id=""" + people.ID_SQL + """,
                         use_automated_income=%s
                     WHERE user_id=%s
-                """, (str(limit_val), str(savings_val), default_done_by or None, 1 if use_automated_income else 0, session['user_id']))
+                """, (str(limit_val), str(savings_val), default_done_by or None, session['user_id'], default_done_by or None,
+                      1 if use_automated_income else 0, session['user_id']))
 
+            versions.bump(cur, [session['user_id']], "setting")
             conn.commit()
+        invalidate(session['user_id'])
         return redirect(url_for('settings.index'))
     finally:
         conn.close()
@@ -132,22 +139,28 @@ def update_limit():
 def end_month():
     now = datetime.now()
     month_str = now.strftime("%Y-%m")
+    month_key = archive.key_for(now)
 
     conn = current_app.db_pool.get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
             # Check income mode setting
-            cur.execute("SELECT use_automated_income, total_savings FROM setting WHERE user_id=%s LIMIT 1", (session['user_id'],))
-            setting = cur.fetchone()
-            use_automated_income = bool(setting['use_automated_income']) if setting else False
+            setting = get_settings(cur)
+            use_automated_income = setting['use_automated_income']
 
             # Get manual income
-            cur.execute("SELECT COALESCE(SUM(amount), 0) AS total FROM income WHERE user_id=%s", (session['user_id'],))
-            manual_income = float(cur.fetchone()['total'])
+            cur.execute(
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents FROM income WHERE user_id=%s",
+                (session['user_id'],)
+            )
+            manual_income = cur.fetchone()['total_cents']
 
             # Get expenses
-            cur.execute("SELECT COALESCE(SUM(amount), 0) AS total FROM expense WHERE user_id=%s", (session['user_id'],))
-            total_expenses = float(cur.fetchone()['total'])
+            cur.execute(
+                "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents FROM expense WHERE user_id=%s",
+                (session['user_id'],)
+            )
+            total_expenses = cur.fetchone()['total_cents']
 
             # Automated income = total expenses (sum of all done_by amounts)
             automated_income = total_expenses
@@ -156,28 +169,42 @@ def end_month():
             total_income = automated_income if use_automated_income else manual_income
             net_savings = total_income - total_expenses
 
-            if setting:
-                new_savings = float(setting['total_savings']) + net_savings
-                cur.execute("UPDATE setting SET total_savings=%s WHERE user_id=%s", (new_savings, session['user_id']))
+            # Increment in SQL so a stale cached total_savings is never written back
+            if setting['exists']:
+                cur.execute(
+                    "UPDATE setting SET total_savings = total_savings + %s WHERE user_id=%s",
+                    (money.from_cents(net_savings), session['user_id'])
+                )
 
             # Archive manual income (even if using automated, for historical records)
             cur.execute("SELECT source, amount FROM income WHERE user_id=%s", (session['user_id'],))
             for row in cur.fetchall():
                 cur.execute(
-                    "INSERT INTO archived_income (source, amount, month, user_id) VALUES (%s, %s, %s, %s)",
-                    (row['source'], row['amount'], month_str, session['user_id'])
+                    "INSERT INTO archived_income (source, amount, month, month_key, user_id) VALUES (%s, %s, %s, %s, %s)",
+                    (row['source'], row['amount'], month_str, month_key, session['user_id'])
                 )
 
-            cur.execute("SELECT amount, category, note, date, done_by FROM expense WHERE user_id=%s", (session['user_id'],))
+            cur.execute("SELECT amount, category, category_id, note, date, done_by, person_id FROM expense WHERE user_id=%s", (session['user_id'],))
             for row in cur.fetchall():
                 cur.execute(
-                    "INSERT INTO archived_expense (amount, category, note, date, month, user_id, done_by) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                    (row['amount'], row['category'], row['note'], row['date'], month_str, session['user_id'], row['done_by'])
+                    "INSERT INTO archived_expense (amount, category, category_id, note, date, month, month_key, user_id, done_by, person_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (row['amount'], row['category'], row['category_id'], row['note'], row['date'], month_str, month_key, session['user_id'], row['done_by'], row['person_id'])
                 )
+            search.index_archived_month(cur, session['user_id'], month_key)
 
+            orphaned = receipts.release_all(cur, session['user_id'])
             cur.execute("DELETE FROM income WHERE user_id=%s", (session['user_id'],))
             cur.execute("DELETE FROM expense WHERE user_id=%s", (session['user_id'],))
+            budgets.reset(cur, session['user_id'])
+            people.reset(cur, session['user_id'])
+
+            # Start the next month with its recurring rent, salary, subscriptions...
+            recurring.materialize(cur, [session['user_id']], archive.next_key(month_key))
+            versions.bump(cur, [session['user_id']], "archive", "setting")
             conn.commit()
+        for path in orphaned:
+            receipts.purge(conn, session['user_id'], path)
+        invalidate(session['user_id'])
         return redirect(url_for('settings.index'))
     finally:
         conn.close()
@@ -188,13 +215,28 @@ def end_month():
 def fresh_start():
     conn = current_app.db_pool.get_connection()
     try:
-        with conn.cursor() as cur:
+        with conn.cursor(dictionary=True) as cur:
             cur.execute("DELETE FROM archived_income WHERE user_id=%s", (session['user_id'],))
             cur.execute("DELETE FROM archived_expense WHERE user_id=%s", (session['user_id'],))
+            search.unindex_archived(cur, session['user_id'])
+            cur.execute("SELECT DISTINCT file_key FROM archive_summary WHERE user_id=%s", (session['user_id'],))
+            cold_files = [row['file_key'] for row in cur.fetchall()]
+            cur.execute("DELETE FROM archive_summary WHERE user_id=%s", (session['user_id'],))
+            orphaned = receipts.release_all(cur, session['user_id'])
             cur.execute("DELETE FROM income WHERE user_id=%s", (session['user_id'],))
             cur.execute("DELETE FROM expense WHERE user_id=%s", (session['user_id'],))
             cur.execute("DELETE FROM setting WHERE user_id=%s", (session['user_id'],))
+            cur.execute("DELETE FROM recurring WHERE user_id=%s", (session['user_id'],))
+            budgets.reset(cur, session['user_id'])
+            people.reset(cur, session['user_id'])
+            versions.bump(cur, [session['user_id']], "archive", "setting")
             conn.commit()
+        for path in orphaned:
+            receipts.purge(conn, session['user_id'], path)
+        cold_store = storage.get_storage('archive')
+        for key in cold_files:
+            cold_store.delete(key)
+        invalidate(session['user_id'])
         return redirect(url_for('settings.index'))
     finally:
         conn.close()
@@ -56,6 +56,16 @@ CREATE TABLE IF NOT EXISTS categories (
     UNIQUE KEY user_category_unique (user_id, name)
 );
 
+CREATE TABLE IF NOT EXISTS receipt (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    size INT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY user_receipt_unique (user_id, path)
+);
+
 ALTER TABLE income ADD COLUMN user_id INT NOT NULL;
 ALTER TABLE expense ADD COLUMN user_id INT NOT NULL;
 ALTER TABLE setting ADD COLUMN user_id INT NOT NULL;
@@ -71,3 +81,133 @@ ALTER TABLE setting ADD COLUMN default_done_by VARCHAR(50) DEFAULT NULL;
 ALTER TABLE archived_expense ADD COLUMN done_by VARCHAR(50) NOT NULL DEFAULT 'Self';
 
 ALTER TABLE setting ADD COLUMN use_automated_income TINYINT(1) NOT NULL DEFAULT 0;
+
+ALTER TABLE archived_income ADD INDEX idx_archived_income_user_month (user_id, month);
+ALTER TABLE archived_expense ADD INDEX idx_archived_expense_user_month (user_id, month);
+
+ALTER TABLE expense ADD INDEX idx_expense_user_date (user_id, date);
+
+ALTER TABLE expense ADD FULLTEXT INDEX ft_expense_category_note (category, note);
+ALTER TABLE archived_expense ADD FULLTEXT INDEX ft_archived_expense_category_note (category, note);
+
+ALTER TABLE archived_income ADD COLUMN month_key INT NOT NULL DEFAULT 0;
+ALTER TABLE archived_expense ADD COLUMN month_key INT NOT NULL DEFAULT 0;
+UPDATE archived_income SET month_key = CAST(REPLACE(month, '-', '') AS UNSIGNED) WHERE month_key = 0;
+UPDATE archived_expense SET month_key = CAST(REPLACE(month, '-', '') AS UNSIGNED) WHERE month_key = 0;
+ALTER TABLE archived_income DROP INDEX idx_archived_income_user_month, ADD INDEX idx_archived_income_user_month_key (user_id, month_key);
+ALTER TABLE archived_expense DROP INDEX idx_archived_expense_user_month, ADD INDEX idx_archived_expense_user_month_key (user_id, month_key);
+ALTER TABLE archived_expense DROP INDEX ft_archived_expense_category_note;
+ALTER TABLE archived_income DROP PRIMARY KEY, ADD PRIMARY KEY (id, month_key);
+ALTER TABLE archived_expense DROP PRIMARY KEY, ADD PRIMARY KEY (id, month_key);
+ALTER TABLE archived_income PARTITION BY RANGE (month_key) (
+    PARTITION p2024 VALUES LESS THAN (202500),
+    PARTITION p2025 VALUES LESS THAN (202600),
+    PARTITION p2026 VALUES LESS THAN (202700),
+    PARTITION p2027 VALUES LESS THAN (202800),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+ALTER TABLE archived_expense PARTITION BY RANGE (month_key) (
+    PARTITION p2024 VALUES LESS THAN (202500),
+    PARTITION p2025 VALUES LESS THAN (202600),
+    PARTITION p2026 VALUES LESS THAN (202700),
+    PARTITION p2027 VALUES LESS THAN (202800),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Searchable text of archived expenses; partitioned tables can't have FULLTEXT indexes
+CREATE TABLE IF NOT EXISTS archived_expense_text (
+    id INT NOT NULL,
+    month_key INT NOT NULL,
+    user_id INT NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    note TEXT,
+    PRIMARY KEY (id, month_key),
+    INDEX idx_archived_expense_text_user_month (user_id, month_key),
+    FULLTEXT INDEX ft_archived_expense_text_category_note (category, note)
+);
+INSERT IGNORE INTO archived_expense_text (id, month_key, user_id, category, note)
+SELECT id, month_key, user_id, category, note FROM archived_expense;
+
+CREATE TABLE IF NOT EXISTS archive_summary (
+    user_id INT NOT NULL,
+    month_key INT NOT NULL,
+    month VARCHAR(20) NOT NULL,
+    income_total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    expense_total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    income_count INT NOT NULL DEFAULT 0,
+    expense_count INT NOT NULL DEFAULT 0,
+    file_key VARCHAR(255) NOT NULL,
+    compacted_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, month_key),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS recurring (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    label VARCHAR(100) NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    day TINYINT NOT NULL DEFAULT 1,
+    note TEXT,
+    done_by VARCHAR(50) DEFAULT NULL,
+    active TINYINT(1) NOT NULL DEFAULT 1,
+    last_month_key INT NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_recurring_due (active, last_month_key, user_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+ALTER TABLE expense ADD COLUMN recurring_key VARCHAR(32) DEFAULT NULL, ADD UNIQUE KEY uq_expense_recurring (user_id, recurring_key);
+ALTER TABLE income ADD COLUMN recurring_key VARCHAR(32) DEFAULT NULL, ADD UNIQUE KEY uq_income_recurring (user_id, recurring_key);
+
+ALTER TABLE categories ADD COLUMN budget DECIMAL(10, 2) DEFAULT NULL, ADD COLUMN spent DECIMAL(12, 2) NOT NULL DEFAULT 0;
+UPDATE categories c
+LEFT JOIN (SELECT user_id, category, SUM(amount) AS total FROM expense GROUP BY user_id, category) e
+    ON e.user_id = c.user_id AND e.category = c.name
+SET c.spent = COALESCE(e.total, 0);
+
+ALTER TABLE expense ADD COLUMN category_id INT DEFAULT NULL,
+    ADD INDEX idx_expense_user_category (user_id, category_id),
+    ADD CONSTRAINT fk_expense_category FOREIGN KEY (category_id) REFERENCES categories(id);
+-- Partitioned tables can't have foreign keys; the id is kept consistent by the writers
+ALTER TABLE archived_expense ADD COLUMN category_id INT DEFAULT NULL,
+    ADD INDEX idx_archived_expense_user_category (user_id, category_id);
+
+CREATE TABLE IF NOT EXISTS people (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    name VARCHAR(50) NOT NULL,
+    spent DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    UNIQUE KEY user_person_unique (user_id, name),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+INSERT IGNORE INTO people (user_id, name, spent)
+SELECT user_id, done_by, SUM(amount) FROM expense GROUP BY user_id, done_by;
+
+ALTER TABLE expense ADD COLUMN person_id INT DEFAULT NULL,
+    ADD INDEX idx_expense_user_person (user_id, person_id),
+    ADD CONSTRAINT fk_expense_person FOREIGN KEY (person_id) REFERENCES people(id);
+ALTER TABLE archived_expense ADD COLUMN person_id INT DEFAULT NULL,
+    ADD INDEX idx_archived_expense_user_person (user_id, person_id);
+ALTER TABLE setting ADD COLUMN default_person_id INT DEFAULT NULL,
+    ADD CONSTRAINT fk_setting_default_person FOREIGN KEY (default_person_id) REFERENCES people(id) ON DELETE SET NULL;
+
+CREATE TABLE IF NOT EXISTS cache_version (
+    user_id INT PRIMARY KEY,
+    archive_version INT NOT NULL DEFAULT 0,
+    expense_version INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+ALTER TABLE cache_version ADD COLUMN setting_version INT NOT NULL DEFAULT 0;
+
+-- Search results come from the text copy alone, so it outlives cold-storage compaction
+ALTER TABLE archived_expense_text
+    ADD COLUMN amount DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN date DATE DEFAULT NULL,
+    ADD COLUMN done_by VARCHAR(50) NOT NULL DEFAULT 'Self',
+    ADD COLUMN month VARCHAR(20) NOT NULL DEFAULT '';
+UPDATE archived_expense_text t
+JOIN archived_expense a ON a.id = t.id AND a.month_key = t.month_key
+SET t.amount = a.amount, t.date = a.date, t.done_by = a.done_by, t.month = a.month;
@@ -0,0 +1,348 @@
+"""
+Columnar analytics over a user's archived months.
+
+``history.compare`` needs every archived month's totals plus category and
+income-source breakdowns. Instead of one ``SUM`` per month, a user's
+archive is loaded once into NumPy columns:
+
+- amounts as ``int64`` cents, so sums are exact
+- ``month_key``, category, source and ``done_by`` dictionary-encoded as
+  small integer codes into sorted label lists
+
+Pivots (month x category, month x source) are a single ``bincount`` over
+the combined code, and totals, deltas and savings rates are vector ops on
+the pivot. Compacted months (see ``services.coldstore``) are read through
+the cold reader, so they take part like any other month.
+
+Loaded users are kept in a per-process LRU (``ANALYTICS_CACHE_USERS``) for
+``ANALYTICS_CACHE_TTL`` seconds, together with the user's archive version
+(``services.versions``); routes that change a user's archive bump it, and
+every worker reloads once it sees the new version. ``python -m services.analytics`` benchmarks this path
+against the per-month SQL it replaced.
+
+NumPy is imported on first use so app startup doesn't pay for it.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from services import archive, coldstore, money, versions
+
+DEFAULT_CACHE_USERS = 32
+DEFAULT_TTL = 300
+
+# Amounts are DECIMAL(10,2); selecting cents hands us exact integers
+INCOME_QUERY = """
+    SELECT month_key, source, """ + money.cents('amount') + """ AS cents
+    FROM archived_income WHERE user_id=%s
+"""
+EXPENSE_QUERY = """
+    SELECT month_key, category, done_by, """ + money.cents('amount') + """ AS cents
+    FROM archived_expense WHERE user_id=%s
+"""
+COLD_QUERY = "SELECT month_key, file_key FROM archive_summary WHERE user_id=%s"
+
+
+def _encode(values):
+    """Sorted distinct labels and each value's code into them."""
+    import numpy as np
+
+    # A dict pass beats np.unique here: sorting an object array compares
+    # Python strings, while a category column has only a handful of values
+    seen = {}
+    codes = np.fromiter((seen.setdefault(v, len(seen)) for v in values), dtype=np.int32, count=len(values))
+    labels = sorted(seen)
+    order = np.empty(len(labels), dtype=np.int32)
+    order[[seen[label] for label in labels]] = np.arange(len(labels), dtype=np.int32)
+    return labels, order[codes]
+
+
+class ArchiveColumns:
+    """One user's archived income and expenses as encoded columns."""
+
+    def __init__(self, incomes, expenses):
+        """``incomes``: ``(month_key, source, cents)`` rows; ``expenses``: ``(month_key, category, done_by, cents)``."""
+        import numpy as np
+
+        self.month_keys = sorted({r[0] for r in incomes} | {r[0] for r in expenses})
+        index = {key: i for i, key in enumerate(self.month_keys)}
+
+        self.income_month = np.fromiter((index[r[0]] for r in incomes), dtype=np.int32, count=len(incomes))
+        self.sources, self.income_source = _encode([r[1] for r in incomes])
+        self.income_cents = np.fromiter((r[2] for r in incomes), dtype=np.int64, count=len(incomes))
+
+        self.expense_month = np.fromiter((index[r[0]] for r in expenses), dtype=np.int32, count=len(expenses))
+        self.categories, self.expense_category = _encode([r[1] for r in expenses])
+        self.people, self.expense_person = _encode([r[2] for r in expenses])
+        self.expense_cents = np.fromiter((r[3] for r in expenses), dtype=np.int64, count=len(expenses))
+
+    def _pivot(self, months, codes, cents, width):
+        """``len(month_keys) x width`` matrix of summed cents."""
+        import numpy as np
+
+        rows = len(self.month_keys)
+        if not width:
+            return np.zeros((rows, 0), dtype=np.int64)
+        flat = np.bincount(months * width + codes, weights=cents, minlength=rows * width)
+        return np.rint(flat).astype(np.int64).reshape(rows, width)
+
+    def expense_pivot(self):
+        return self._pivot(self.expense_month, self.expense_category, self.expense_cents, len(self.categories))
+
+    def income_pivot(self):
+        return self._pivot(self.income_month, self.income_source, self.income_cents, len(self.sources))
+
+    def person_pivot(self):
+        return self._pivot(self.expense_month, self.expense_person, self.expense_cents, len(self.people))
+
+    def rows_for(self, month_keys):
+        """Row indexes of ``month_keys``; months with no data map to -1."""
+        import numpy as np
+
+        index = {key: i for i, key in enumerate(self.month_keys)}
+        return np.array([index.get(key, -1) for key in month_keys], dtype=np.int64)
+
+
+def _take(matrix, rows):
+    """Rows of ``matrix``, with zeros where ``rows`` is -1."""
+    import numpy as np
+
+    out = np.zeros((len(rows), matrix.shape[1]), dtype=matrix.dtype)
+    found = rows >= 0
+    out[found] = matrix[rows[found]]
+    return out
+
+
+def _savings_rates(income, net):
+    import numpy as np
+
+    rates = np.zeros(len(income))
+    np.divide(net * 100.0, income, out=rates, where=income != 0)
+    return np.round(rates, 1)
+
+
+def trend(cols, month_keys):
+    """Per-month income, expense, net and savings rate, oldest first."""
+    month_keys = sorted(month_keys)
+    rows = cols.rows_for(month_keys)
+    income = _take(cols.income_pivot(), rows).sum(axis=1) / 100.0
+    expense = _take(cols.expense_pivot(), rows).sum(axis=1) / 100.0
+    net = income - expense
+    rates = _savings_rates(income, net)
+    return [
+        {
+            "month": archive.month_label(key),
+            "income": float(income[i]),
+            "expense": float(expense[i]),
+            "net": float(net[i]),
+            "savings_rate": float(rates[i]),
+        }
+        for i, key in enumerate(month_keys)
+    ]
+
+
+def _breakdown(labels, matrix, months):
+    """``{label: {month: total}}`` for labels with spending in either month."""
+    breakdown = {}
+    for j in (matrix != 0).any(axis=0).nonzero()[0]:
+        breakdown[labels[j]] = {
+            month: float(matrix[i, j]) / 100.0
+            for i, month in enumerate(months) if matrix[i, j]
+        }
+    return breakdown
+
+
+def comparison(cols, m1, m2):
+    """Everything ``compare`` shows for two ``YYYY-MM`` months."""
+    months = [m1, m2]
+    rows = cols.rows_for([archive.month_key(m) for m in months])
+    categories = _take(cols.expense_pivot(), rows)
+    sources = _take(cols.income_pivot(), rows)
+
+    income = sources.sum(axis=1) / 100.0
+    expense = categories.sum(axis=1) / 100.0
+    net = income - expense
+    rates = _savings_rates(income, net)
+    deltas = (categories[1] - categories[0]) / 100.0
+
+    return {
+        "m1": m1,
+        "m2": m2,
+        "income": {m: float(income[i]) for i, m in enumerate(months) if rows[i] >= 0},
+        "expense": {m: float(expense[i]) for i, m in enumerate(months) if rows[i] >= 0},
+        "net": {m: float(net[i]) for i, m in enumerate(months)},
+        "categories": _breakdown(cols.categories, categories, months),
+        "category_deltas": {
+            cols.categories[j]: float(deltas[j]) for j in (categories != 0).any(axis=0).nonzero()[0]
+        },
+        "income_sources": _breakdown(cols.sources, sources, months),
+        "savings_rate": {m: float(rates[i]) for i, m in enumerate(months)},
+    }
+
+
+def load_columns(cur, user_id):
+    """Read a user's whole archive, hot and compacted, into columns."""
+    cur.execute(INCOME_QUERY, (user_id,))
+    incomes = [(r['month_key'], r['source'], r['cents']) for r in cur.fetchall()]
+    cur.execute(EXPENSE_QUERY, (user_id,))
+    expenses = [(r['month_key'], r['category'], r['done_by'], r['cents']) for r in cur.fetchall()]
+
+    cur.execute(COLD_QUERY, (user_id,))
+    for row in cur.fetchall():
+        data = coldstore.load_month(user_id, row['month_key'], row['file_key'])
+        incomes.extend((row['month_key'], r['source'], money.to_cents(r['amount'])) for r in data['income'])
+        expenses.extend((row['month_key'], r['category'], r['done_by'], money.to_cents(r['amount'])) for r in data['expense'])
+    return ArchiveColumns(incomes, expenses)
+
+
+class ColumnCache:
+    """Thread-safe LRU of ``ArchiveColumns`` by user id, with a TTL."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_USERS, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, value = entry
+            if self._clock() >= expires:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return value
+
+    def set(self, user_id, value):
+        with self._lock:
+            self._entries[user_id] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    app.analytics_cache = ColumnCache(
+        app.config.get('ANALYTICS_CACHE_USERS', DEFAULT_CACHE_USERS),
+        app.config.get('ANALYTICS_CACHE_TTL', DEFAULT_TTL),
+    )
+
+
+def get_columns(cur, user_id):
+    """The user's archive columns, loaded with ``cur`` on a miss or a newer archive version."""
+    cache = current_app.analytics_cache
+    version = versions.read(cur, user_id)[0]
+    entry = cache.get(user_id)
+    if entry is None or entry[0] != version:
+        entry = (version, load_columns(cur, user_id))
+        cache.set(user_id, entry)
+    return entry[1]
+
+
+def _synthetic_db(months, rows_per_month, categories=12):
+    """In-memory SQLite archive for one user, shaped like production's."""
+    import random
+    import sqlite3
+
+    rng = random.Random(42)
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.execute("CREATE TABLE archived_income (user_id INT, month_key INT, source TEXT, amount NUMERIC)")
+    db.execute("CREATE TABLE archived_expense (user_id INT, month_key INT, category TEXT, done_by TEXT, amount NUMERIC)")
+    db.execute("CREATE INDEX ie ON archived_expense (user_id, month_key)")
+    db.execute("CREATE INDEX ii ON archived_income (user_id, month_key)")
+    keys = [(2000 + m // 12) * 100 + m % 12 + 1 for m in range(months)]
+    db.executemany("INSERT INTO archived_income VALUES (1, ?, ?, ?)", (
+        (key, source, rng.randint(100000, 500000) / 100)
+        for key in keys for source in ("Salary", "Bonus")
+    ))
+    db.executemany("INSERT INTO archived_expense VALUES (1, ?, ?, ?, ?)", (
+        (key, f"cat{rng.randrange(categories)}", rng.choice(("Alex", "Sam")), rng.randint(100, 50000) / 100)
+        for key in keys for _ in range(rows_per_month)
+    ))
+    return db, keys
+
+
+def _synthetic_rows(db):
+    """``ArchiveColumns`` input from a ``_synthetic_db``, like ``load_columns`` reads it."""
+    incomes = db.execute(
+        "SELECT month_key, source, CAST(ROUND(amount * 100) AS INTEGER) FROM archived_income WHERE user_id=1"
+    ).fetchall()
+    expenses = db.execute(
+        "SELECT month_key, category, done_by, CAST(ROUND(amount * 100) AS INTEGER) FROM archived_expense WHERE user_id=1"
+    ).fetchall()
+    return incomes, expenses
+
+
+def _sql_path(db, keys, k1, k2):
+    """The per-month queries ``compare`` used to run."""
+    trend_rows = []
+    for key in keys:
+        inc = db.execute("SELECT COALESCE(SUM(amount),0) FROM archived_income WHERE user_id=1 AND month_key=?", (key,)).fetchone()[0]
+        exp = db.execute("SELECT COALESCE(SUM(amount),0) FROM archived_expense WHERE user_id=1 AND month_key=?", (key,)).fetchone()[0]
+        trend_rows.append((key, inc, exp))
+    db.execute(
+        "SELECT category, month_key, SUM(amount) FROM archived_expense "
+        "WHERE user_id=1 AND month_key IN (?, ?) GROUP BY category, month_key", (k1, k2)
+    ).fetchall()
+    db.execute(
+        "SELECT source, month_key, SUM(amount) FROM archived_income "
+        "WHERE user_id=1 AND month_key IN (?, ?) GROUP BY source, month_key", (k1, k2)
+    ).fetchall()
+    return trend_rows
+
+
+def benchmark(months=120, rows_per_month=200, rounds=5):
+    """Median seconds for the SQL path, a cold columnar load and a warm columnar query."""
+    db, keys = _synthetic_db(months, rows_per_month)
+    k1, k2 = keys[-2], keys[-1]
+    m1, m2 = archive.month_label(k1), archive.month_label(k2)
+
+    def load():
+        return ArchiveColumns(*_synthetic_rows(db))
+
+    def median(fn):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        return sorted(samples)[len(samples) // 2]
+
+    cols = load()
+    return {
+        "sql": median(lambda: _sql_path(db, keys, k1, k2)),
+        "columnar_load": median(lambda: (lambda c: (trend(c, keys), comparison(c, m1, m2)))(load())),
+        "columnar_cached": median(lambda: (trend(cols, keys), comparison(cols, m1, m2))),
+    }
+
+
+def sql_queries(months):
+    """Round trips the SQL path makes; the columnar load makes three."""
+    return 2 * months + 2
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark columnar compare against the SQL path.")
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument("--rows-per-month", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0.5,
+                        help="database round trip to add per query (SQLite here has none)")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.months, args.rows_per_month)
+    results["sql"] += sql_queries(args.months) * args.rtt_ms / 1000
+    results["columnar_load"] += 3 * args.rtt_ms / 1000
+    for name, seconds in results.items():
+        print(f"{name:16s} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
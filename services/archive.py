@@ -0,0 +1,83 @@
+"""
+Month keys and range partitions for the archive tables.
+
+``archived_income`` and ``archived_expense`` keep their ``YYYY-MM`` label in
+``month`` for display, but are filtered and partitioned on ``month_key``, an
+``INT`` of the form ``YYYYMM``. On MySQL both tables are
+``PARTITION BY RANGE (month_key)`` with one partition per year plus a
+catch-all ``pmax``, so a history query for one month only opens that year's
+partition and whole years can be compacted or dropped on their own.
+
+New years are split off ``pmax`` with ``add_partition_sql``; run
+
+    python -m services.archive 2027
+
+to print the statements for a year.
+"""
+
+import re
+from datetime import date
+
+TABLES = ("archived_income", "archived_expense")
+
+_LABEL_RE = re.compile(r"(\d{4})-(\d{2})")
+
+
+def month_key(label):
+    """``'2024-05'`` -> ``202405``; ``None`` for anything else."""
+    match = _LABEL_RE.fullmatch(label or "")
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return int(match.group(1)) * 100 + int(match.group(2))
+
+
+def month_label(key):
+    """``202405`` -> ``'2024-05'``."""
+    return f"{key // 100:04d}-{key % 100:02d}"
+
+
+def key_for(day):
+    """``month_key`` of the month containing ``day``."""
+    return day.year * 100 + day.month
+
+
+def next_key(key):
+    """``month_key`` of the month after ``key``: ``202412`` -> ``202501``."""
+    year, month = divmod(key, 100)
+    return key + 1 if month < 12 else (year + 1) * 100 + 1
+
+
+def partition_name(year):
+    return f"p{year}"
+
+
+def partition_sql(table, first_year, last_year):
+    """``ALTER TABLE`` that partitions ``table`` by year."""
+    parts = [
+        f"PARTITION {partition_name(year)} VALUES LESS THAN ({(year + 1) * 100})"
+        for year in range(first_year, last_year + 1)
+    ]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return f"ALTER TABLE {table} PARTITION BY RANGE (month_key) (\n    " + ",\n    ".join(parts) + "\n)"
+
+
+def add_partition_sql(table, year):
+    """Split ``year`` out of the catch-all partition."""
+    return (
+        f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+        f"PARTITION {partition_name(year)} VALUES LESS THAN ({(year + 1) * 100}), "
+        f"PARTITION pmax VALUES LESS THAN MAXVALUE)"
+    )
+
+
+def main(argv=None):
+    import sys
+
+    args = sys.argv[1:] if argv is None else argv
+    year = int(args[0]) if args else date.today().year + 1
+    for table in TABLES:
+        print(add_partition_sql(table, year) + ";")
+
+
+if __name__ == "__main__":
+    main()
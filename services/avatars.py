@@ -0,0 +1,86 @@
+"""
+Avatar normalisation.
+
+Uploaded avatars are decoded once, cropped to a square and re-encoded as
+small WebP files at each of ``SIZES``. Re-encoding drops EXIF/GPS and any
+other metadata. Files are named after the hash of the upload,
+``u<user_id>/<digest>-<size>.webp``, and ``users.avatar_filename`` stores the
+``u<user_id>/<digest>`` key, so every variant can be cached as immutable.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from services import storage, uploads
+from services.uploads import UploadRejected
+
+SIZES = (32, 64, 128)
+FORMAT = "webp"
+
+_KEY_RE = re.compile(r"u\d+/[0-9a-f]{32}")
+_VARIANT_RE = re.compile(r"u\d+/[0-9a-f]{32}-\d+\.webp")
+
+
+def is_key(value):
+    return bool(value and _KEY_RE.fullmatch(value))
+
+
+def is_variant(filename):
+    """True for normalised files, whose bytes never change."""
+    return bool(_VARIANT_RE.fullmatch(filename))
+
+
+def variant(key, size):
+    """Filename of the smallest stored size covering ``size`` pixels."""
+    if not is_key(key):
+        # Avatars uploaded before normalisation are served as-is
+        return key
+    fit = next((s for s in SIZES if s >= size), SIZES[-1])
+    return f"{key}-{fit}.{FORMAT}"
+
+
+def _render(src, store, key):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            side = min(img.size)
+            img = ImageOps.fit(img, (side, side))
+            for size in SIZES:
+                fd, tmp = tempfile.mkstemp(dir=store.tmp_dir(), suffix=".part")
+                os.close(fd)
+                try:
+                    img.resize((size, size), Image.LANCZOS).save(tmp, format=FORMAT.upper(), quality=85)
+                    store.put_file(tmp, variant(key, size), f"image/{FORMAT}")
+                finally:
+                    uploads.discard(tmp)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise UploadRejected(f"unreadable image: {e}") from e
+
+
+def store(file, user_id):
+    """Normalise an uploaded avatar and return its storage key."""
+    avatar_store = storage.get_storage('avatars')
+    sha = hashlib.sha256()
+    tmp_path, _ = uploads.spool(
+        file.stream, avatar_store.tmp_dir(), uploads.extension(file.filename), hasher=sha
+    )
+    try:
+        key = f"u{user_id}/{sha.hexdigest()[:32]}"
+        if not all(avatar_store.exists(variant(key, s)) for s in SIZES):
+            _render(tmp_path, avatar_store, key)
+        return key
+    finally:
+        uploads.discard(tmp_path)
+
+
+def remove(key):
+    """Delete every stored size of a replaced avatar."""
+    if not is_key(key):
+        return
+    avatar_store = storage.get_storage('avatars')
+    for size in SIZES:
+        avatar_store.delete(variant(key, size))
@@ -0,0 +1,93 @@
+"""
+Per-category budgets with running spend counters.
+
+``categories.budget`` is an optional monthly budget and ``categories.spent``
+is what the live (not yet archived) expenses in that category add up to.
+Pages don't ``GROUP BY`` the expense table to compute it. Each write keeps
+the counter current in its own transaction:
+
+- a new category row starts with the spend already recorded against it
+- ``add_expense``, ``edit_expense`` and ``delete_expense`` call ``record``
+  with the amount added or removed
+- recurring copies add their templates' amounts
+- ``end_month`` and ``fresh_start`` reset counters to zero
+
+``status`` then reads every budget with one lookup on the
+``(user_id, name)`` key. ``rebuild`` recomputes a user's counters from
+``expense`` if they ever drift.
+"""
+
+from decimal import Decimal
+from services import money
+
+STATUS_QUERY = (
+    "SELECT id, name, " + money.cents('budget') + " AS budget_cents, "
+    + money.cents('spent') + " AS spent_cents "
+    "FROM categories WHERE user_id=%s AND budget IS NOT NULL ORDER BY name"
+)
+
+# New category rows start from what's already been spent against them;
+# the sum is only taken when the row is actually missing
+CREATE_SQL = """
+    INSERT IGNORE INTO categories (user_id, name, budget, spent)
+    SELECT %s, %s, %s, (SELECT COALESCE(SUM(amount), 0) FROM expense WHERE user_id=%s AND category=%s)
+    FROM DUAL
+    WHERE NOT EXISTS (SELECT 1 FROM categories WHERE user_id=%s AND name=%s)
+"""
+
+REBUILD_SQL = """
+    UPDATE categories c
+    LEFT JOIN (
+        SELECT category_id, SUM(amount) AS total FROM expense WHERE user_id=%s GROUP BY category_id
+    ) e ON e.category_id = c.id
+    SET c.spent = COALESCE(e.total, 0)
+    WHERE c.user_id=%s
+"""
+
+
+def create(cur, user_id, name, budget=None):
+    cur.execute(CREATE_SQL, (user_id, name, None if budget is None else str(budget), user_id, name, user_id, name))
+
+
+def record(cur, user_id, category, amount):
+    """Add ``amount`` (negative to remove) to ``category``'s counter, if it has a row."""
+    if amount:
+        cur.execute(
+            "UPDATE categories SET spent = spent + %s WHERE user_id=%s AND name=%s",
+            (str(amount), user_id, category)
+        )
+
+
+def move(cur, user_id, old_category, old_amount, new_category, new_amount):
+    """Counter updates for an edited expense."""
+    if old_category == new_category:
+        record(cur, user_id, new_category, Decimal(new_amount) - Decimal(old_amount))
+    else:
+        record(cur, user_id, old_category, -Decimal(old_amount))
+        record(cur, user_id, new_category, new_amount)
+
+
+def reset(cur, user_id):
+    """Zero a user's counters once their live expenses are archived or deleted."""
+    cur.execute("UPDATE categories SET spent = 0 WHERE user_id=%s", (user_id,))
+
+
+def rebuild(cur, user_id):
+    cur.execute(REBUILD_SQL, (user_id, user_id))
+
+
+def status(cur, user_id):
+    """Every budgeted category with its spend, remaining amount and percentage used."""
+    cur.execute(STATUS_QUERY, (user_id,))
+    return [
+        {
+            "id": row['id'],
+            "category": row['name'],
+            "budget": row['budget_cents'],
+            "spent": row['spent_cents'],
+            "remaining": row['budget_cents'] - row['spent_cents'],
+            "percent": money.percent(row['spent_cents'], row['budget_cents']),
+            "over": row['spent_cents'] > row['budget_cents'],
+        }
+        for row in cur.fetchall()
+    ]
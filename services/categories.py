@@ -0,0 +1,124 @@
+"""
+Category ids on expenses.
+
+``expense`` and ``archived_expense`` keep their free-text ``category`` for
+display and search, and also carry ``category_id``, a reference to the
+user's ``categories`` row. Aggregations group on the integer id and look up
+names only for the few groups that come out (``grouped``). Grouping on an
+int avoids hashing a string per row, the ``(user_id, category_id)`` index
+is smaller than one on the string, and a name change only touches one
+``categories`` row.
+
+Writers fill ``category_id`` as they insert (``ensure`` + ``ID_SQL``).
+Rows written before the column existed are filled by
+
+    python -m services.categories [--chunk 5000]
+
+which creates any missing ``categories`` rows and then updates one id range
+per transaction, so no lock is held for long. Until it finishes, rows
+without an id are still grouped by their string.
+"""
+
+from services import budgets
+
+TABLES = ("expense", "archived_expense")
+DEFAULT_CHUNK = 5000
+
+# Id of the user's category called %s, for INSERT/UPDATE ... VALUES
+ID_SQL = "(SELECT id FROM categories WHERE user_id=%s AND name=%s)"
+
+
+def ensure(cur, user_id, name):
+    """Make sure ``name`` has a ``categories`` row (starting its spend counter)."""
+    budgets.create(cur, user_id, name)
+
+
+def grouped(select, source, keys=None, lookup="categories", id_column="category_id", text_column="category"):
+    """
+    SQL aggregating ``select`` over ``source`` per category id (plus ``keys``).
+
+    ``source`` is the ``FROM ... WHERE ...`` clause and ``keys`` maps extra
+    group columns' aliases to expressions. Rows come back with
+    ``category`` (the name), the keys and the aggregates. ``lookup``,
+    ``id_column`` and ``text_column`` let other id/name pairs
+    (``services.people``) share this.
+    """
+    keys = keys or {}
+    columns = "".join(f"{expr} AS {alias}, " for alias, expr in keys.items())
+    group = "".join(f"{alias}, " for alias in keys)
+    return f"""
+        SELECT COALESCE(n.name, g.legacy_name) AS {text_column}, g.*
+        FROM (
+            SELECT {columns}{id_column},
+                   CASE WHEN {id_column} IS NULL THEN {text_column} END AS legacy_name,
+                   {select}
+            {source}
+            GROUP BY {group}{id_column}, legacy_name
+        ) AS g
+        LEFT JOIN {lookup} n ON n.id = g.{id_column}
+    """
+
+
+def _create_missing_sql(table):
+    if table == "expense":
+        # Live spend seeds the budget counter of categories created here
+        return """
+            INSERT IGNORE INTO categories (user_id, name, spent)
+            SELECT user_id, category, SUM(amount) FROM expense
+            WHERE category_id IS NULL GROUP BY user_id, category
+        """
+    return f"""
+        INSERT IGNORE INTO categories (user_id, name)
+        SELECT DISTINCT user_id, category FROM {table} WHERE category_id IS NULL
+    """
+
+
+def update_in_chunks(conn, cur, table, id_column, update_sql, chunk):
+    """Run ``update_sql`` (``... WHERE t.id BETWEEN %s AND %s``) over the ids still missing ``id_column``."""
+    cur.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE {id_column} IS NULL")
+    low, high = cur.fetchone()
+    if low is None:
+        return 0
+    updated = 0
+    for start in range(low, high + 1, chunk):
+        cur.execute(update_sql, (start, start + chunk - 1))
+        updated += cur.rowcount
+        conn.commit()
+    return updated
+
+
+def backfill(conn, table, chunk=DEFAULT_CHUNK):
+    """Fill ``table.category_id`` ``chunk`` ids per commit; returns rows updated."""
+    if table not in TABLES:
+        raise ValueError(f"unknown table {table!r}")
+    with conn.cursor() as cur:
+        cur.execute(_create_missing_sql(table))
+        conn.commit()
+        return update_in_chunks(conn, cur, table, "category_id", f"""
+            UPDATE {table} t
+            JOIN categories c ON c.user_id = t.user_id AND c.name = t.category
+            SET t.category_id = c.id
+            WHERE t.id BETWEEN %s AND %s AND t.category_id IS NULL
+        """, chunk)
+
+
+def main(argv=None):
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Fill category_id on expense rows.")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="ids per transaction")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        conn = app.db_pool.get_connection()
+        try:
+            for table in TABLES:
+                print(f"{table}: {backfill(conn, table, args.chunk)} rows updated")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Cold storage for old archived months.
+
+``compact`` moves archive months older than ``COLD_AFTER_MONTHS`` out of
+``archived_income``/``archived_expense`` into one file per user and year in
+the ``archive`` storage (``u<user_id>/<year>.cold``), and records each month
+in ``archive_summary`` with its totals and the file it lives in.
+
+A file is a small JSON index followed by one zlib-compressed block per
+month::
+
+    MAGIC | 4-byte index length | {"202301": [offset, length], ...} | blocks
+
+Each block holds that month's rows column by column (amounts as integer
+cents), so reading one month only decompresses that month. Decoded months
+are kept in a per-process LRU (``COLD_CACHE_MONTHS``); compacted months never
+change, so entries don't need invalidating.
+
+Run ``python -m services.coldstore`` (see ``--help``) from cron.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date
+from flask import current_app
+from services import archive, money, search, storage
+
+MAGIC = b"BTCOLD1\n"
+DEFAULT_AFTER_MONTHS = 24
+DEFAULT_CACHE_MONTHS = 64
+
+INCOME_COLUMNS = ("id", "source", "amount")
+EXPENSE_COLUMNS = ("id", "amount", "category", "note", "date", "done_by")
+
+SUMMARY_QUERY = """
+    SELECT month_key, month, income_total, expense_total, file_key
+    FROM archive_summary
+    WHERE user_id=%s AND month_key=%s
+"""
+
+
+def file_key(user_id, year):
+    return f"u{user_id}/{year}.cold"
+
+
+def _encode_month(incomes, expenses):
+    columns = {
+        "income": {col: [r[col] for r in incomes] for col in INCOME_COLUMNS},
+        "expense": {col: [r[col] for r in expenses] for col in EXPENSE_COLUMNS},
+    }
+    for table in columns.values():
+        table["amount"] = [money.to_cents(a) for a in table["amount"]]
+    columns["expense"]["date"] = [d.isoformat() for d in columns["expense"]["date"]]
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9)
+
+
+def _decode_month(block):
+    columns = json.loads(zlib.decompress(block))
+    income = columns["income"]
+    expense = columns["expense"]
+    income["amount"] = [money.from_cents(c) for c in income["amount"]]
+    expense["amount"] = [money.from_cents(c) for c in expense["amount"]]
+    expense["date"] = [date.fromisoformat(d) for d in expense["date"]]
+    return {
+        "income": [dict(zip(INCOME_COLUMNS, row)) for row in zip(*(income[c] for c in INCOME_COLUMNS))],
+        "expense": [dict(zip(EXPENSE_COLUMNS, row)) for row in zip(*(expense[c] for c in EXPENSE_COLUMNS))],
+    }
+
+
+def write_file(path, blocks):
+    """Write ``{month_key: compressed_block}`` to ``path``."""
+    index, offset = {}, 0
+    for key in sorted(blocks):
+        index[str(key)] = [offset, len(blocks[key])]
+        offset += len(blocks[key])
+    header = json.dumps(index).encode()
+    with open(path, "wb") as out:
+        out.write(MAGIC + struct.pack(">I", len(header)) + header)
+        for key in sorted(blocks):
+            out.write(blocks[key])
+
+
+def _read_index(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a cold archive file")
+    (length,) = struct.unpack(">I", f.read(4))
+    index = json.loads(f.read(length))
+    return {int(k): v for k, v in index.items()}, len(MAGIC) + 4 + length
+
+
+def read_blocks(path):
+    """All ``{month_key: compressed_block}`` of a file, still compressed."""
+    with open(path, "rb") as f:
+        index, base = _read_index(f)
+        blocks = {}
+        for key, (offset, length) in index.items():
+            f.seek(base + offset)
+            blocks[key] = f.read(length)
+    return blocks
+
+
+def read_month(path, month_key):
+    """Decode one month from a cold file, or ``None`` if it isn't there."""
+    with open(path, "rb") as f:
+        index, base = _read_index(f)
+        if month_key not in index:
+            return None
+        offset, length = index[month_key]
+        f.seek(base + offset)
+        return _decode_month(f.read(length))
+
+
+class MonthCache:
+    """Thread-safe LRU of decoded months keyed by ``(user_id, month_key)``."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_MONTHS):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    app.cold_cache = MonthCache(app.config.get('COLD_CACHE_MONTHS', DEFAULT_CACHE_MONTHS))
+
+
+def summary(cur, user_id, month_key):
+    """The ``archive_summary`` row of a compacted month, or ``None``."""
+    cur.execute(SUMMARY_QUERY, (user_id, month_key))
+    return cur.fetchone()
+
+
+def load_month(user_id, month_key, key):
+    """Rows of a compacted month, read through the process cache."""
+    cache = current_app.cold_cache
+    data = cache.get((user_id, month_key))
+    if data is None:
+        with storage.get_storage('archive').fetch(key) as path:
+            data = read_month(path, month_key)
+        if data is None:
+            raise LookupError(f"month {month_key} missing from {key}")
+        cache.set((user_id, month_key), data)
+    return data
+
+
+def cutoff_key(today, after_months):
+    """Months strictly before this key are old enough to compact."""
+    months = today.year * 12 + today.month - 1 - after_months
+    return (months // 12) * 100 + months % 12 + 1
+
+
+def _fetch_month(cur, user_id, month_key):
+    cur.execute(
+        "SELECT id, source, amount FROM archived_income WHERE user_id=%s AND month_key=%s",
+        (user_id, month_key)
+    )
+    incomes = cur.fetchall()
+    cur.execute(
+        "SELECT id, amount, category, note, date, done_by FROM archived_expense "
+        "WHERE user_id=%s AND month_key=%s ORDER BY date DESC, id DESC",
+        (user_id, month_key)
+    )
+    return incomes, cur.fetchall()
+
+
+def compact_user_year(conn, store, user_id, year, month_keys):
+    """Move ``month_keys`` of one user and year into their cold file."""
+    key = file_key(user_id, year)
+    blocks = {}
+    if store.exists(key):
+        with store.fetch(key) as path:
+            blocks = read_blocks(path)
+
+    summaries = []
+    with conn.cursor(dictionary=True) as cur:
+        for month_key in month_keys:
+            incomes, expenses = _fetch_month(cur, user_id, month_key)
+            blocks[month_key] = _encode_month(incomes, expenses)
+            summaries.append((
+                user_id, month_key, archive.month_label(month_key),
+                sum(r['amount'] for r in incomes), sum(r['amount'] for r in expenses),
+                len(incomes), len(expenses), key,
+            ))
+
+    # Write the file before touching the tables: a crash in between leaves
+    # an extra month in the file, never rows without a home
+    tmp_dir = store.tmp_dir()
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".cold")
+    os.close(fd)
+    try:
+        write_file(tmp, blocks)
+        store.put_file(tmp, key, "application/octet-stream")
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    # Upsert so a re-run after a partial compaction can finish
+    with conn.cursor() as cur:
+        cur.executemany("""
+            INSERT INTO archive_summary
+                (user_id, month_key, month, income_total, expense_total, income_count, expense_count, file_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                month=VALUES(month), income_total=VALUES(income_total), expense_total=VALUES(expense_total),
+                income_count=VALUES(income_count), expense_count=VALUES(expense_count), file_key=VALUES(file_key)
+        """, summaries)
+        for month_key in month_keys:
+            # The search copy stays, so compacted months can still be found
+            search.index_archived_month(cur, user_id, month_key)
+            cur.execute("DELETE FROM archived_income WHERE user_id=%s AND month_key=%s", (user_id, month_key))
+            cur.execute("DELETE FROM archived_expense WHERE user_id=%s AND month_key=%s", (user_id, month_key))
+    conn.commit()
+
+
+def compact(conn, store, before_key):
+    """Compact every archive month older than ``before_key``; returns the count."""
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("""
+            SELECT user_id, month_key FROM archived_income WHERE month_key < %s
+            UNION
+            SELECT user_id, month_key FROM archived_expense WHERE month_key < %s
+            ORDER BY user_id, month_key
+        """, (before_key, before_key))
+        pending = cur.fetchall()
+
+    groups = OrderedDict()
+    for row in pending:
+        groups.setdefault((row['user_id'], row['month_key'] // 100), []).append(row['month_key'])
+    for (user_id, year), month_keys in groups.items():
+        compact_user_year(conn, store, user_id, year, month_keys)
+    return len(pending)
+
+
+def main(argv=None):
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Move old archive months to cold storage.")
+    parser.add_argument("--older-than", type=int, default=None,
+                        help="months to keep in the database (default COLD_AFTER_MONTHS)")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        after = args.older_than or app.config.get('COLD_AFTER_MONTHS', DEFAULT_AFTER_MONTHS)
+        conn = app.db_pool.get_connection()
+        try:
+            count = compact(conn, storage.get_storage('archive'), cutoff_key(date.today(), after))
+        finally:
+            conn.close()
+    print(f"Compacted {count} user-months older than {after} months")
+
+
+if __name__ == "__main__":
+    main()
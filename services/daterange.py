@@ -0,0 +1,117 @@
+"""
+``from``/``to`` date-range filtering shared by list and chart pages.
+
+A range is parsed once from the query string (either explicit ISO dates or a
+preset such as ``?range=30d``) and turned into plain ``date >= %s AND
+date <= %s`` predicates, which the ``(user_id, date)`` indexes can serve as a
+range scan. Archived months are filtered on their ``YYYYMM`` ``month_key``
+instead, which also prunes the archive tables' year partitions.
+"""
+
+from collections import namedtuple
+from datetime import date, timedelta
+
+PRESETS = {
+    'week': 'This week',
+    '30d': 'Last 30 days',
+    'ytd': 'Year to date',
+}
+
+
+class DateRange(namedtuple('DateRange', 'start end preset')):
+    """Inclusive ``[start, end]`` range; either bound may be ``None``."""
+
+    __slots__ = ()
+
+    @property
+    def active(self):
+        return self.start is not None or self.end is not None
+
+    @property
+    def key(self):
+        """Stable string for use in cache keys."""
+        return f"{self.start or ''}:{self.end or ''}"
+
+    def split(self, today):
+        """
+        ``(closed, open)`` parts of the range: days before ``today`` and the rest.
+
+        Either part is ``None`` when the range has no days on that side.
+        """
+        yesterday = today - timedelta(days=1)
+        closed = open_ = None
+        if self.start is None or self.start <= yesterday:
+            end = self.end if self.end is not None and self.end <= yesterday else yesterday
+            closed = DateRange(self.start, end, None)
+        if self.end is None or self.end >= today:
+            start = self.start if self.start is not None and self.start >= today else today
+            open_ = DateRange(start, self.end, None)
+        return closed, open_
+
+    def sql(self, column='date'):
+        """Return ``(sql, params)`` to append to a ``WHERE`` clause."""
+        return self._predicate(column, self.start, self.end)
+
+    def month_sql(self, column='month_key'):
+        """Like ``sql`` but against a ``YYYYMM`` integer month key."""
+        start = self.start.year * 100 + self.start.month if self.start else None
+        end = self.end.year * 100 + self.end.month if self.end else None
+        return self._predicate(column, start, end)
+
+    def args(self):
+        """Query-string arguments that reproduce this range in ``url_for``."""
+        if self.preset:
+            return {'range': self.preset}
+        args = {}
+        if self.start:
+            args['from'] = self.start.isoformat()
+        if self.end:
+            args['to'] = self.end.isoformat()
+        return args
+
+    @staticmethod
+    def _predicate(column, start, end):
+        sql, params = "", []
+        if start is not None:
+            sql += f" AND {column} >= %s"
+            params.append(start)
+        if end is not None:
+            sql += f" AND {column} <= %s"
+            params.append(end)
+        return sql, params
+
+
+ALL_TIME = DateRange(None, None, None)
+
+
+def preset_range(preset, today=None):
+    today = today or date.today()
+    if preset == 'week':
+        start = today - timedelta(days=today.weekday())
+    elif preset == '30d':
+        start = today - timedelta(days=29)
+    elif preset == 'ytd':
+        start = today.replace(month=1, day=1)
+    else:
+        return ALL_TIME
+    return DateRange(start, today, preset)
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_range(args, today=None):
+    """Build a ``DateRange`` from request args; bad input means no bound."""
+    preset = args.get('range')
+    if preset in PRESETS:
+        return preset_range(preset, today)
+
+    start = _parse_date(args.get('from'))
+    end = _parse_date(args.get('to'))
+    if start and end and start > end:
+        start, end = end, start
+    return DateRange(start, end, None)
@@ -0,0 +1,130 @@
+"""
+Lazily created, fork-aware MySQL connection pools.
+
+Creating ``MySQLConnectionPool`` opens every connection up front, and
+importing ``mysql.connector`` alone costs tens of milliseconds, so neither
+happens until the first request actually asks for a connection. CLI tools,
+tests and freshly forked workers that never touch the database skip both.
+
+A pool belongs to the process that created it. If a pool was opened before
+a fork (e.g. Gunicorn ``--preload``), the child drops its copy and opens its
+own instead of sharing the parent's sockets. Each worker's pool is sized so
+that all workers together stay within ``DB_CONNECTION_BUDGET``; Gunicorn's
+``post_fork`` hook (``gunicorn.conf.py``) reports the worker count.
+
+With ``MYSQL_REPLICA_HOST`` set, views marked ``@read_only`` (or queries
+that ask for ``get_connection(read_only=True)``) read from a replica pool.
+After a user's write their session is pinned to the primary for
+``REPLICA_STICKY_SECONDS`` so they always see their own changes.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, request, session
+
+# mysql.connector refuses larger pools
+MAX_POOL_SIZE = 32
+DEFAULT_CONNECTION_BUDGET = 40
+
+_worker_count = None
+
+
+def set_worker_count(workers):
+    """Record how many processes share the connection budget."""
+    global _worker_count
+    _worker_count = workers
+
+
+def worker_count():
+    if _worker_count:
+        return _worker_count
+    return int(os.getenv('WEB_CONCURRENCY', 1))
+
+
+def pool_size_for(budget, workers):
+    """Connections per worker so that ``workers`` pools fit in ``budget``."""
+    return max(1, min(MAX_POOL_SIZE, budget // max(1, workers)))
+
+
+class LazyPool:
+    """Stands in for a connection pool until ``get_connection`` is called."""
+
+    def __init__(self, factory, budget=DEFAULT_CONNECTION_BUDGET, size=None):
+        self._factory = factory
+        self.budget = budget
+        self.size = size
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._pool is not None and self._pid == os.getpid()
+
+    def pool_size(self):
+        return self.size or pool_size_for(self.budget, worker_count())
+
+    def reset(self):
+        """Forget the pool without closing it (its sockets may be a parent's)."""
+        with self._lock:
+            self._pool = None
+            self._pid = None
+
+    def _get_pool(self):
+        if not self.started:
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = None
+                    try:
+                        pool = self._factory(self.pool_size())
+                    except Exception as e:
+                        # Leave unset so the next request retries
+                        logging.error(f"Could not initialize database pool: {e}")
+                        raise
+                    self._pool, self._pid = pool, os.getpid()
+        return self._pool
+
+    def get_connection(self):
+        return self._get_pool().get_connection()
+
+
+def read_only(view):
+    """Mark a view as safe to serve from the read replica."""
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def sticky_to_primary():
+    """True while this session's last write may not have reached the replica."""
+    wrote_at = session.get('db_wrote_at')
+    window = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+    return wrote_at is not None and time.time() - wrote_at < window
+
+
+def get_connection(read_only=None):
+    """
+    A connection from the replica for read-only work, else from the primary.
+
+    ``read_only=None`` follows the view's ``@read_only`` marker.
+    """
+    if read_only is None:
+        read_only = g.get('db_read_only', False)
+    replica = getattr(current_app, 'db_replica_pool', None)
+    if read_only and replica is not None and not sticky_to_primary():
+        return replica.get_connection()
+    return current_app.db_pool.get_connection()
+
+
+def init_app(app):
+    @app.after_request
+    def remember_write(response):
+        # Any state-changing request by a user pins their reads to the primary
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and 'user_id' in session:
+            session['db_wrote_at'] = time.time()
+        return response
@@ -0,0 +1,104 @@
+"""
+Serving of uploaded files after the app's own auth checks.
+
+By default files are sent by Werkzeug, which already answers conditional
+(ETag / If-Modified-Since) and Range requests. Setting ``SENDFILE_BACKEND``
+hands the byte transfer to the front proxy instead:
+
+- ``x-sendfile``: Apache/lighttpd ``X-Sendfile`` via Flask's ``USE_X_SENDFILE``
+- ``x-accel-redirect``: nginx, redirecting to an ``internal`` location
+  mounted at ``X_ACCEL_PREFIX`` that maps onto ``UPLOAD_FOLDER``
+
+With ``STORAGE_BACKEND = 's3'`` the app never touches the bytes: after the
+checks it redirects to a presigned URL valid for ``STORAGE_URL_EXPIRY``
+seconds, and the bucket sends the cache headers.
+
+Content-addressed files never change, so they are marked immutable.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from flask import abort, current_app, make_response, redirect, send_from_directory
+from werkzeug.security import safe_join
+from services import storage
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def init_app(app):
+    if app.config.get('SENDFILE_BACKEND') == 'x-sendfile':
+        app.config['USE_X_SENDFILE'] = True
+
+
+# Names a user may request per storage, after ``{uid}`` is filled in:
+# the current content-addressed layout, and flat legacy ``user<id>_`` names
+_OWNED = {
+    'avatars': r"u{uid}/[0-9a-f]{{32}}-\d+\.webp|user{uid}_[^/]+",
+    'receipts': r"u{uid}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.\w+|user{uid}_[^/]+",
+}
+
+
+def _is_plain(filename):
+    """False for names with ``..``, empty segments or a leading ``/``."""
+    return (
+        bool(filename)
+        and not filename.startswith('/')
+        and '..' not in filename
+        and '' not in filename.split('/')
+        and posixpath.normpath(filename) == filename
+    )
+
+
+def owns(filename, user_id, kind):
+    """True if ``filename`` is one of ``user_id``'s files in the ``kind`` storage."""
+    if not _is_plain(filename):
+        return False
+    pattern = _OWNED[kind].format(uid=int(user_id))
+    return bool(re.fullmatch(pattern, filename))
+
+
+def _accel_redirect(folder, filename):
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    internal = os.path.relpath(path, upload_root).replace(os.sep, '/')
+    response = make_response('')
+    response.headers['X-Accel-Redirect'] = current_app.config['X_ACCEL_PREFIX'].rstrip('/') + '/' + internal
+    response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return response
+
+
+def _cache_control(immutable):
+    # Files sit behind login, so only the browser may cache them
+    if immutable:
+        return f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return "private, no-cache"
+
+
+def _presigned_redirect(store, filename, immutable):
+    expires = current_app.config.get('STORAGE_URL_EXPIRY', storage.DEFAULT_URL_EXPIRY)
+    try:
+        url = store.url(filename, expires=expires, cache_control=_cache_control(immutable))
+    except ValueError:
+        abort(404)
+    response = redirect(url, code=302)
+    # Let the browser reuse the redirect, but never past the URL's expiry
+    response.headers['Cache-Control'] = f"private, max-age={expires // 2}"
+    return response
+
+
+def send_upload(kind, filename, immutable=False):
+    """Send ``filename`` from the ``kind`` storage with suitable cache headers."""
+    store = storage.get_storage(kind)
+    if not isinstance(store, storage.LocalStorage):
+        return _presigned_redirect(store, filename, immutable)
+
+    if current_app.config.get('SENDFILE_BACKEND') == 'x-accel-redirect':
+        response = _accel_redirect(store.root, filename)
+    else:
+        response = send_from_directory(store.root, filename, conditional=True, etag=True)
+    response.headers['Cache-Control'] = _cache_control(immutable)
+    return response
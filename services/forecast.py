@@ -0,0 +1,241 @@
+"""
+Month-end spend forecast for the dashboard.
+
+For every category the projection adds to what has been spent so far an
+estimate of the rest of the month, averaged from two sources:
+
+- the current month's daily series, exponentially smoothed
+  (``FORECAST_ALPHA``): recent daily spend times the days left
+- seasonality from the last ``FORECAST_HISTORY_MONTHS`` archived months:
+  the share of a category's monthly spend that usually still comes after
+  today (rent on the 28th, groceries spread out), times its monthly mean
+
+Categories are columns of NumPy arrays, so smoothing a run of days is one
+matrix-vector product rather than a loop per category and day.
+
+State is kept per user and built incrementally. The seasonal profile is
+read once and only changes when a month is archived. The smoothing state
+covers closed days (before today), so a dashboard load only reads rows
+dated today or later. The state lives in each worker process, so it is
+tied to the user's ``services.versions`` counters rather than invalidated
+locally: writers call ``expense_changed`` in their transaction, which bumps
+the expense version only for edits to past days, and every worker rebuilds
+on its next load once it sees the counter move.
+"""
+
+import calendar
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from flask import current_app
+from services import categories, coldstore, money, versions
+
+DEFAULT_ALPHA = 0.3
+DEFAULT_HISTORY_MONTHS = 12
+DEFAULT_CACHE_USERS = 256
+DEFAULT_TTL = 600
+DAYS = 31
+
+HISTORY_QUERY = categories.grouped(
+    money.cents('SUM(amount)') + " AS total_cents",
+    "FROM archived_expense WHERE user_id=%s AND month_key >= %s",
+    keys={"month_key": "month_key", "day": "DAY(date)"},
+)
+
+MONTH_QUERY = categories.grouped(
+    money.cents('SUM(amount)') + " AS total_cents",
+    "FROM expense WHERE user_id=%s AND date >= %s",
+    keys={"date": "date"},
+)
+
+
+class Profile:
+    """Per-category seasonality from archived months."""
+
+    def __init__(self, rows):
+        import numpy as np
+
+        self.categories = sorted({r['category'] for r in rows})
+        index = {c: i for i, c in enumerate(self.categories)}
+        months = len({r['month_key'] for r in rows})
+
+        by_day = np.zeros((len(self.categories), DAYS), dtype=np.int64)
+        for r in rows:
+            by_day[index[r['category']], r['day'] - 1] += r['total_cents']
+        totals = by_day.sum(axis=1)
+
+        # cumulative[c, d]: share of category c's spend usually done by the end of day d+1
+        self.cumulative = np.zeros(by_day.shape)
+        np.divide(by_day.cumsum(axis=1), totals[:, None], out=self.cumulative, where=totals[:, None] > 0)
+        self.monthly_mean = totals / months if months else totals.astype(float)
+
+    def remaining(self, categories, day):
+        """Expected spend still to come after ``day``, aligned with ``categories``."""
+        import numpy as np
+
+        index = {c: i for i, c in enumerate(self.categories)}
+        rows = np.array([index.get(c, -1) for c in categories], dtype=np.int64)
+        known = rows >= 0
+        out = np.zeros(len(categories))
+        out[known] = self.monthly_mean[rows[known]] * (1 - self.cumulative[rows[known], day - 1])
+        return out, known
+
+    def daily_mean(self, categories, days_in_month):
+        index = {c: i for i, c in enumerate(self.categories)}
+        return [self.monthly_mean[index[c]] / days_in_month if c in index else 0.0 for c in categories]
+
+
+class MonthState:
+    """Smoothed daily spend per category over the closed days of one month."""
+
+    def __init__(self, month_start, alpha, version=0):
+        import numpy as np
+
+        self.month_start = month_start
+        self.alpha = alpha
+        self.version = version
+        self.categories = []
+        self.spent = np.zeros(0, dtype=np.int64)   # cents on closed days
+        self.level = np.zeros(0)                   # smoothed cents per day
+        self.closed_through = month_start - timedelta(days=1)
+        self.lock = threading.Lock()
+
+    def _grow(self, categories, profile, days_in_month):
+        import numpy as np
+
+        new = [c for c in categories if c not in self.categories]
+        if new:
+            self.categories += new
+            self.spent = np.concatenate([self.spent, np.zeros(len(new), dtype=np.int64)])
+            # Start a new category at its historical daily rate, if any
+            self.level = np.concatenate([self.level, profile.daily_mean(new, days_in_month)])
+
+    def close_days(self, rows, through, profile, days_in_month):
+        """Fold daily ``rows`` up to and including ``through`` into the state."""
+        import numpy as np
+
+        days = (through - self.closed_through).days
+        if days <= 0:
+            return
+        self._grow(sorted({r['category'] for r in rows}), profile, days_in_month)
+        index = {c: i for i, c in enumerate(self.categories)}
+        series = np.zeros((len(self.categories), days), dtype=np.int64)
+        for r in rows:
+            series[index[r['category']], (r['date'] - self.closed_through).days - 1] += r['total_cents']
+
+        # Simple exponential smoothing over `days` steps at once:
+        # level_n = (1-a)^n level_0 + sum_k a (1-a)^(n-1-k) x_k
+        decay = 1 - self.alpha
+        weights = self.alpha * decay ** np.arange(days - 1, -1, -1)
+        self.level = decay ** days * self.level + series @ weights
+        self.spent += series.sum(axis=1)
+        self.closed_through = through
+
+
+def project(state, profile, open_rows, today, limit=0):
+    """Month-end projection from closed-day state plus today's (and later) rows."""
+    import numpy as np
+
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    state._grow(sorted({r['category'] for r in open_rows} | set(profile.categories)), profile, days_in_month)
+    index = {c: i for i, c in enumerate(state.categories)}
+    spent = state.spent.copy()
+    for r in open_rows:
+        spent[index[r['category']]] += r['total_cents']
+
+    days_left = days_in_month - today.day
+    smoothed = state.level * days_left
+    seasonal, known = profile.remaining(state.categories, today.day)
+    remaining = np.where(known, (smoothed + seasonal) / 2, smoothed)
+    projected = spent + np.rint(remaining).astype(np.int64)
+
+    total = int(projected.sum())
+    return {
+        "spent": int(spent.sum()),
+        "projected": total,
+        "by_category": dict(sorted(
+            ((c, int(projected[i])) for i, c in enumerate(state.categories) if projected[i]),
+            key=lambda item: item[1], reverse=True,
+        )),
+        "days_left": days_left,
+        "limit": limit,
+        "over_limit": bool(limit) and total > limit,
+        "percent_of_limit": money.percent(total, limit),
+    }
+
+
+class _UserCache:
+    """Thread-safe LRU of per-user ``[profile, month_state, archive_version]`` with a TTL."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self._entries.get(user_id)
+            if entry is None or self._clock() >= entry[0]:
+                self._entries.pop(user_id, None)
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, value):
+        with self.lock:
+            self._entries[user_id] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    app.forecast_cache = _UserCache(
+        app.config.get('FORECAST_CACHE_USERS', DEFAULT_CACHE_USERS),
+        app.config.get('FORECAST_CACHE_TTL', DEFAULT_TTL),
+    )
+
+
+def month_end(cur, user_id, today, limit=0):
+    """The user's month-end forecast, reading only what the cached state lacks."""
+    config = current_app.config
+    cache = current_app.forecast_cache
+    month_start = today.replace(day=1)
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+
+    archive_version, expense_version, _ = versions.read(cur, user_id)
+    entry = cache.get(user_id)
+    if entry is None or entry[2] != archive_version:
+        cur.execute(HISTORY_QUERY, (
+            user_id, coldstore.cutoff_key(today, config.get('FORECAST_HISTORY_MONTHS', DEFAULT_HISTORY_MONTHS))
+        ))
+        entry = [Profile(cur.fetchall()), None, archive_version]
+        cache.set(user_id, entry)
+    profile, state, _ = entry
+
+    if state is None or state.month_start != month_start or state.version != expense_version:
+        state = MonthState(month_start, config.get('FORECAST_ALPHA', DEFAULT_ALPHA), expense_version)
+        entry[1] = state
+
+    # Closed days the state hasn't seen yet, then everything still open
+    with state.lock:
+        cur.execute(MONTH_QUERY, (user_id, state.closed_through + timedelta(days=1)))
+        rows = cur.fetchall()
+        yesterday = today - timedelta(days=1)
+        state.close_days([r for r in rows if r['date'] <= yesterday], yesterday, profile, days_in_month)
+        return project(state, profile, [r for r in rows if r['date'] >= today], today, limit)
+
+
+def expense_changed(cur, user_id, *days, today=None):
+    """
+    Record, in the writer's transaction, a change to expenses on ``days``.
+
+    Only days before ``today`` can be closed in some worker's state, so
+    only those (or ``None``, for unknown days) bump the expense version.
+    """
+    today = today or date.today()
+    if any(day is None or day < today for day in days):
+        versions.bump(cur, [user_id], "expense")
@@ -0,0 +1,141 @@
+"""
+Money as integer cents.
+
+Amounts are ``DECIMAL(10,2)`` in MySQL. Pages used to receive them as
+``Decimal`` and turn each into a ``float``: the driver builds a ``Decimal``
+per row, the route allocates a ``float`` from it, and binary rounding
+creeps into the sums (``0.1 + 0.2``). Hot-path queries instead select
+``cents('amount')``, which the driver decodes straight to ``int``; routes
+add ints, which is exact, and leave formatting to the template filters:
+
+- ``{{ cents | money }}`` -> ``"1234.50"``
+- ``{{ cents | units }}`` -> ``1234.5``, for charts and ``tojson``
+
+The database schema is unchanged. ``to_cents`` covers amounts that don't
+come from such a query (forms, settings, cold storage).
+``python -m services.money`` benchmarks both paths.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from operator import itemgetter
+
+CENT = Decimal("0.01")
+
+
+def cents(expr):
+    """SQL for ``expr`` (a DECIMAL(…,2) expression) as an integer number of cents."""
+    return f"CAST(({expr}) * 100 AS SIGNED)"
+
+
+def to_cents(value):
+    """``Decimal('12.34')``, ``'12.34'`` or ``12.34`` -> ``1234``; ``None`` -> 0."""
+    if value is None:
+        return 0
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int(value.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def from_cents(amount):
+    """``1234`` -> ``Decimal('12.34')``."""
+    return Decimal(amount).scaleb(-2)
+
+
+def sum_column(rows, key):
+    """Total of the cents column ``key``; ``map`` keeps the loop in C."""
+    return sum(map(itemgetter(key), rows))
+
+
+def totals_by(rows, label, key):
+    """``{row[label]: row[key]}`` for ``GROUP BY`` rows."""
+    return dict(zip(map(itemgetter(label), rows), map(itemgetter(key), rows)))
+
+
+def group_sum(rows, label, key):
+    """Sum the cents column ``key`` per ``row[label]``, keeping first-seen order."""
+    totals = {}
+    for row in rows:
+        totals[row[label]] = totals.get(row[label], 0) + row[key]
+    return totals
+
+
+def percent(part, whole, digits=1):
+    """``part`` as a percentage of ``whole``; 0 when ``whole`` is 0."""
+    return round(part * 100 / whole, digits) if whole else 0
+
+
+def format_money(amount):
+    """Cents as ``"-1234.50"``."""
+    sign = "-" if amount < 0 else ""
+    whole, frac = divmod(abs(int(amount)), 100)
+    return f"{sign}{whole}.{frac:02d}"
+
+
+def units(amount):
+    """Cents as a float number of currency units, for charts."""
+    return amount / 100
+
+
+def init_app(app):
+    app.jinja_env.filters['money'] = format_money
+    app.jinja_env.filters['units'] = units
+
+
+def benchmark(rows=100_000, rounds=5):
+    """
+    Median seconds per path to decode and total ``rows`` amounts, and each total.
+
+    Values start as the text the MySQL protocol carries, so each path pays
+    for the driver's conversion too: ``Decimal`` for a DECIMAL column, ``int``
+    for ``cents(...)``.
+    """
+    import random
+    import time
+
+    rng = random.Random(7)
+    raw = [rng.randint(1, 9_999_999) for _ in range(rows)]
+    decimal_wire = [f"{c // 100}.{c % 100:02d}".encode() for c in raw]
+    cents_wire = [str(c).encode() for c in raw]
+
+    def float_path():
+        # driver: DECIMAL -> Decimal; route: float(r['amount']) and sum
+        data = [{'amount': Decimal(v.decode())} for v in decimal_wire]
+        return sum([float(r['amount']) for r in data])
+
+    def cents_path():
+        # driver: BIGINT -> int; route: sum_column
+        data = [{'amount': int(v)} for v in cents_wire]
+        return sum_column(data, 'amount')
+
+    def median(fn):
+        samples, result = [], None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - start)
+        return sorted(samples)[len(samples) // 2], result
+
+    float_time, float_total = median(float_path)
+    cents_time, cents_total = median(cents_path)
+    return {
+        "exact": from_cents(sum(raw)),
+        "float": (float_time, Decimal(repr(float_total))),
+        "cents": (cents_time, from_cents(cents_total)),
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare float and integer-cents totals.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.rows)
+    exact = results.pop("exact")
+    for name, (seconds, total) in results.items():
+        print(f"{name:6s} {seconds / args.rows * 1e9:7.1f} ns/row  total {total}  error {total - exact}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Password hashing with a tunable cost.
+
+Hashes use Werkzeug's ``method$salt$hash`` format, so existing rows keep
+verifying. ``PASSWORD_HASH_METHOD`` picks the algorithm and its parameters,
+e.g. ``scrypt:32768:8:1`` (N, r, p) or ``pbkdf2:sha256:600000``; run
+
+    python -m services.passwords --target-ms 100
+
+on production hardware to find the scrypt cost that takes about that long.
+When the method changes, ``needs_rehash`` flags old hashes so login can
+upgrade them while it has the plaintext.
+
+Under gevent workers, verification runs on a gevent thread pool of
+``PASSWORD_HASH_WORKERS`` native threads: ``hashlib.scrypt`` and PBKDF2
+release the GIL, so the waiting greenlet yields and the worker keeps serving
+other requests, and the pool size caps how many cores a burst of logins can
+occupy. Sync and threaded workers verify inline, since handing the hash to
+another thread would only block the request thread on it.
+``PASSWORD_HASH_WORKERS = 0`` verifies inline everywhere.
+"""
+
+import sys
+import threading
+import time
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+DEFAULT_WORKERS = 4
+
+
+def normalize(method):
+    """Spell out the parameters Werkzeug fills in for a bare method name."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        defaults = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        defaults = ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f"unsupported password hash method: {method!r}")
+    return ":".join([name, *args, *defaults[len(args):]])
+
+
+def _gevent_patched():
+    """True once gevent has monkey-patched ``threading`` in this process."""
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+class PasswordHasher:
+    """Hashes with one configured method; under gevent, verifies on a bounded pool."""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=DEFAULT_WORKERS):
+        self.method = normalize(method)
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                from gevent.threadpool import ThreadPool
+                self._executor = ThreadPool(self.workers)
+            return self._executor
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        if self.workers == 0 or not _gevent_patched():
+            return check_password_hash(pwhash, password)
+        return self._pool().apply(check_password_hash, (pwhash, password))
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with other parameters than ours."""
+        return pwhash.split("$", 1)[0] != self.method
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.kill()
+            self._executor = None
+
+
+def init_app(app):
+    app.password_hasher = PasswordHasher(
+        app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS),
+    )
+
+
+def hash_password(password):
+    return current_app.password_hasher.hash(password)
+
+
+def verify_password(pwhash, password):
+    return current_app.password_hasher.verify(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return current_app.password_hasher.needs_rehash(pwhash)
+
+
+def time_method(method, rounds=3):
+    """Median seconds for one hash with ``method``."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash("benchmark-password", method=method)
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
+
+
+def benchmark(target_ms, r=8, p=1, max_n=2 ** 20):
+    """
+    Return the scrypt method whose cost is closest to ``target_ms``.
+
+    N is doubled from 2**12; scrypt's memory use is ``128 * N * r`` bytes,
+    so ``max_n`` also bounds per-login memory.
+    """
+    best, best_gap = None, None
+    n = 2 ** 12
+    while n <= max_n:
+        method = f"scrypt:{n}:{r}:{p}"
+        elapsed_ms = time_method(method) * 1000
+        gap = abs(elapsed_ms - target_ms)
+        if best_gap is None or gap < best_gap:
+            best, best_gap = method, gap
+        if elapsed_ms >= target_ms:
+            break
+        n *= 2
+    return best
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pick a PASSWORD_HASH_METHOD for this machine.")
+    parser.add_argument("--target-ms", type=float, default=100.0)
+    parser.add_argument("-r", type=int, default=8)
+    parser.add_argument("-p", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    method = benchmark(args.target_ms, args.r, args.p)
+    print(f"PASSWORD_HASH_METHOD={method}  # ~{time_method(method) * 1000:.0f} ms per hash")
+
+
+if __name__ == "__main__":
+    main()
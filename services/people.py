@@ -0,0 +1,154 @@
+"""
+People who pay for expenses, with running per-person totals.
+
+``done_by`` used to be a free string on every expense, and automated
+income (what each person paid) was a ``GROUP BY done_by`` over ``expense``
+on the dashboard, income and settings pages. Now each user has a ``people``
+table:
+
+- ``expense.person_id`` and ``archived_expense.person_id`` reference it; the
+  ``done_by`` text stays for display, as ``category`` did for category ids
+- ``setting.default_person_id`` replaces the ``default_done_by`` string
+- ``people.spent`` is what each person's live expenses add up to, kept
+  current by the same writes that keep ``categories.spent`` (see
+  ``services.budgets``)
+
+``totals`` therefore reads automated income from ``people`` with one
+lookup on ``(user_id, name)``. Aggregations that still need expenses (a date
+range, an archived month) group on the integer ``person_id`` with
+``grouped``. The migration seeds ``people`` and ``spent`` from live
+expenses; the ids of rows written before the columns existed are filled by
+
+    python -m services.people [--chunk 5000]
+"""
+
+from decimal import Decimal
+from services import categories, money
+
+TABLES = categories.TABLES
+
+# Id of the user's person called %s, for INSERT/UPDATE ... VALUES
+ID_SQL = "(SELECT id FROM people WHERE user_id=%s AND name=%s)"
+
+# New people start from what's already been spent under their name;
+# the sum is only taken when the row is actually missing
+CREATE_SQL = """
+    INSERT IGNORE INTO people (user_id, name, spent)
+    SELECT %s, %s, (SELECT COALESCE(SUM(amount), 0) FROM expense WHERE user_id=%s AND done_by=%s)
+    FROM DUAL
+    WHERE NOT EXISTS (SELECT 1 FROM people WHERE user_id=%s AND name=%s)
+"""
+
+TOTALS_QUERY = (
+    "SELECT name AS done_by, " + money.cents('spent') + " AS total_cents "
+    "FROM people WHERE user_id=%s AND spent <> 0 ORDER BY name"
+)
+
+
+def ensure(cur, user_id, name):
+    """Make sure ``name`` has a ``people`` row (starting its total)."""
+    cur.execute(CREATE_SQL, (user_id, name, user_id, name, user_id, name))
+
+
+def record(cur, user_id, name, amount):
+    """Add ``amount`` (negative to remove) to ``name``'s running total."""
+    if amount:
+        cur.execute(
+            "UPDATE people SET spent = spent + %s WHERE user_id=%s AND name=%s",
+            (str(amount), user_id, name)
+        )
+
+
+def move(cur, user_id, old_name, old_amount, new_name, new_amount):
+    """Total updates for an edited expense."""
+    if old_name == new_name:
+        record(cur, user_id, new_name, Decimal(new_amount) - Decimal(old_amount))
+    else:
+        record(cur, user_id, old_name, -Decimal(old_amount))
+        record(cur, user_id, new_name, new_amount)
+
+
+def reset(cur, user_id):
+    """Zero a user's totals once their live expenses are archived or deleted."""
+    cur.execute("UPDATE people SET spent = 0 WHERE user_id=%s", (user_id,))
+
+
+def totals(cur, user_id):
+    """``[{'done_by', 'total_cents'}]`` of live expenses per person, from the running totals."""
+    cur.execute(TOTALS_QUERY, (user_id,))
+    return cur.fetchall()
+
+
+def grouped(select, source, keys=None):
+    """Like ``categories.grouped``, per ``person_id``; rows carry ``done_by``."""
+    return categories.grouped(select, source, keys, lookup="people", id_column="person_id", text_column="done_by")
+
+
+def _create_missing_sql(table):
+    if table == "expense":
+        return """
+            INSERT IGNORE INTO people (user_id, name, spent)
+            SELECT user_id, done_by, SUM(amount) FROM expense
+            WHERE person_id IS NULL GROUP BY user_id, done_by
+        """
+    return f"""
+        INSERT IGNORE INTO people (user_id, name)
+        SELECT DISTINCT user_id, done_by FROM {table} WHERE person_id IS NULL
+    """
+
+
+def backfill(conn, table, chunk=categories.DEFAULT_CHUNK):
+    """Fill ``table.person_id`` ``chunk`` ids per commit; returns rows updated."""
+    if table not in TABLES:
+        raise ValueError(f"unknown table {table!r}")
+    with conn.cursor() as cur:
+        cur.execute(_create_missing_sql(table))
+        conn.commit()
+        return categories.update_in_chunks(conn, cur, table, "person_id", f"""
+            UPDATE {table} t
+            JOIN people p ON p.user_id = t.user_id AND p.name = t.done_by
+            SET t.person_id = p.id
+            WHERE t.id BETWEEN %s AND %s AND t.person_id IS NULL
+        """, chunk)
+
+
+def backfill_defaults(conn):
+    """Point ``setting.default_person_id`` at the person named by ``default_done_by``."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT IGNORE INTO people (user_id, name)
+            SELECT user_id, default_done_by FROM setting
+            WHERE default_done_by IS NOT NULL AND default_person_id IS NULL
+        """)
+        cur.execute("""
+            UPDATE setting s
+            JOIN people p ON p.user_id = s.user_id AND p.name = s.default_done_by
+            SET s.default_person_id = p.id
+            WHERE s.default_person_id IS NULL
+        """)
+        updated = cur.rowcount
+        conn.commit()
+    return updated
+
+
+def main(argv=None):
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Fill person_id on expense rows and settings.")
+    parser.add_argument("--chunk", type=int, default=categories.DEFAULT_CHUNK, help="ids per transaction")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        conn = app.db_pool.get_connection()
+        try:
+            for table in TABLES:
+                print(f"{table}: {backfill(conn, table, args.chunk)} rows updated")
+            print(f"setting: {backfill_defaults(conn)} rows updated")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
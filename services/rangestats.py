@@ -0,0 +1,154 @@
+"""
+Expense aggregates over a date range for the dashboard.
+
+A range's stats are its expense total and count, per-category and
+per-person totals, and the daily series. Days before today only change
+through writes that bump the user's ``services.versions`` counters: edits
+to past days bump the expense version (``forecast.expense_changed``, and
+recurring copies), and *End month* and *Fresh start* bump the archive
+version as they empty the table. So the closed part of a range, through
+yesterday, is kept in a per-process LRU (``RANGE_CACHE_ENTRIES``) for
+``RANGE_CACHE_TTL`` seconds, keyed by user and ``DateRange.key`` and stored
+with those two versions. A load then only reads rows dated today or later
+and adds them to the cached part. Unbounded (all-time) stats aren't cached;
+their per-person totals already come from running counters.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from flask import current_app
+from services import categories, money, people, versions
+from services.timeseries import daily_totals
+
+DEFAULT_CACHE_ENTRIES = 512
+DEFAULT_TTL = 600
+
+TOTAL_QUERY = "SELECT " + money.cents('COALESCE(SUM(amount), 0)') + " AS total_cents FROM expense WHERE user_id=%s"
+COUNT_QUERY = "SELECT COUNT(*) AS cnt FROM expense WHERE user_id=%s"
+
+
+def load(cur, user_id, date_range):
+    """Read the stats of ``date_range`` from ``expense``; amounts in cents."""
+    range_sql, range_params = date_range.sql()
+    params = (user_id, *range_params)
+
+    cur.execute(TOTAL_QUERY + range_sql, params)
+    total_cents = cur.fetchone()['total_cents']
+
+    # All-time totals are kept per person on write (services.people); a
+    # range needs the expenses
+    if date_range.active:
+        cur.execute(people.grouped(
+            money.cents('SUM(amount)') + " AS total_cents",
+            "FROM expense WHERE user_id=%s" + range_sql,
+        ), params)
+        by_person = cur.fetchall()
+    else:
+        by_person = people.totals(cur, user_id)
+
+    cur.execute(categories.grouped(
+        money.cents('SUM(amount)') + " AS total_cents",
+        "FROM expense WHERE user_id=%s" + range_sql,
+    ), params)
+    by_category = cur.fetchall()
+
+    daily = daily_totals(cur, user_id, date_range=date_range)
+
+    cur.execute(COUNT_QUERY + range_sql, params)
+    count = int(cur.fetchone()['cnt'])
+
+    return {
+        "total_cents": total_cents,
+        "count": count,
+        "people": by_person,
+        "categories": by_category,
+        "daily": daily,
+    }
+
+
+def _combine(groups, label):
+    """Add up ``total_cents`` of rows sharing ``label``, in first-seen order."""
+    combined = {}
+    for rows in groups:
+        for row in rows:
+            if row[label] in combined:
+                combined[row[label]]['total_cents'] += row['total_cents']
+            else:
+                combined[row[label]] = dict(row)
+    return list(combined.values())
+
+
+def merge(*parts):
+    """Stats of consecutive ranges as one; ``parts`` in date order."""
+    if len(parts) == 1:
+        return parts[0]
+    return {
+        "total_cents": sum(part["total_cents"] for part in parts),
+        "count": sum(part["count"] for part in parts),
+        "people": _combine([part["people"] for part in parts], "done_by"),
+        "categories": _combine([part["categories"] for part in parts], "category"),
+        "daily": [row for part in parts for row in part["daily"]],
+    }
+
+
+def _closed(cur, user_id, date_range):
+    """Stats of a range ending before today, from the cache when still current."""
+    cache = current_app.range_cache
+    archive_version, expense_version, _ = versions.read(cur, user_id)
+    current = (archive_version, expense_version)
+    key = (user_id, date_range.key)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    stats = load(cur, user_id, date_range)
+    cache.set(key, (current, stats))
+    return stats
+
+
+def stats(cur, user_id, date_range, today=None):
+    """Stats of ``date_range``, reading only today's side when the rest is cached."""
+    if not date_range.active:
+        return load(cur, user_id, date_range)
+    closed, open_ = date_range.split(today or date.today())
+    parts = []
+    if closed is not None:
+        parts.append(_closed(cur, user_id, closed))
+    if open_ is not None:
+        parts.append(load(cur, user_id, open_))
+    return merge(*parts)
+
+
+class RangeCache:
+    """Thread-safe LRU of closed-range stats by ``(user_id, DateRange.key)``, with a TTL."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() >= entry[0]:
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    app.range_cache = RangeCache(
+        app.config.get('RANGE_CACHE_ENTRIES', DEFAULT_CACHE_ENTRIES),
+        app.config.get('RANGE_CACHE_TTL', DEFAULT_TTL),
+    )
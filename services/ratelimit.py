@@ -0,0 +1,196 @@
+"""
+Token-bucket rate limiting for login attempts.
+
+Each attempt takes one token from three buckets: the client IP's, the
+(email, IP) pair's and the email's own. Buckets hold up to ``burst`` tokens
+and refill at ``per_minute`` tokens a minute; an empty bucket means the
+request is answered with 429 before any database lookup or password hash is
+done. The per-email ceiling ("account") is larger than what one IP can spend
+on a pair, so only guesses spread over many addresses can exhaust it.
+
+Buckets live in process memory by default. Setting ``RATELIMIT_SQLITE_PATH``
+keeps them in a SQLite file instead, so every worker process on the host
+shares the same limits. Rejections are counted per rule in
+``RateLimiter.rejected`` and logged, with emails hashed.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES = {
+    "ip": (20, 10),     # burst, refill per minute
+    "email": (5, 2),    # per (email, IP)
+    "account": (50, 10),
+}
+
+# SQLite buckets that have refilled are dropped every this many takes
+PRUNE_EVERY = 1000
+
+
+def refill(tokens, updated, now, burst, per_minute):
+    return min(burst, tokens + (now - updated) * per_minute / 60.0)
+
+
+def retry_after(tokens, per_minute):
+    """Seconds until ``tokens`` reaches one."""
+    return (1 - tokens) * 60.0 / per_minute
+
+
+def full_at(tokens, now, burst, per_minute):
+    """When the bucket is back to ``burst``, and so no different from a missing one."""
+    return now + (burst - tokens) * 60.0 / per_minute
+
+
+class MemoryBackend:
+    """Buckets in a bounded LRU dict; least recently used are dropped first."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_minute, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = refill(tokens, updated, now, burst, per_minute)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = retry_after(tokens, per_minute)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file shared by all processes on this host."""
+
+    def __init__(self, path, prune_every=PRUNE_EVERY):
+        self.path = path
+        self.prune_every = prune_every
+        self._takes = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        # Opened on first use per thread and process, like services.db.LazyPool:
+        # with a preloaded app the master must not hand its handle to workers
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            import sqlite3
+
+            db = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._create_table(db)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @staticmethod
+    def _create_table(db):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(bucket)")]
+            if columns and "full_at" not in columns:
+                # Buckets from before pruning; losing them only resets the limits
+                db.execute("DROP TABLE bucket")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS bucket (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    full_at REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS bucket_full_at ON bucket (full_at)")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def take(self, key, burst, per_minute, now):
+        db = self._connect()
+        self._takes += 1
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT tokens, updated FROM bucket WHERE key=?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = refill(tokens, updated, now, burst, per_minute)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = retry_after(tokens, per_minute)
+            db.execute(
+                "INSERT OR REPLACE INTO bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at(tokens, now, burst, per_minute))
+            )
+            if self._takes % self.prune_every == 0:
+                self.prune(now, db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return wait
+
+    def prune(self, now, db=None):
+        """Drop buckets that have refilled to their burst; returns how many."""
+        db = db or self._connect()
+        return db.execute("DELETE FROM bucket WHERE full_at <= ?", (now,)).rowcount
+
+
+class RateLimiter:
+    """Named token-bucket rules over one backend."""
+
+    def __init__(self, backend, rules=None, clock=time.time):
+        self.backend = backend
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.rejected = Counter()
+        self._clock = clock
+
+    def hit(self, rule, value):
+        """Take a token for ``value`` under ``rule``; return seconds to wait, 0 if allowed."""
+        burst, per_minute = self.rules[rule]
+        wait = self.backend.take(f"{rule}:{value}", burst, per_minute, self._clock())
+        if wait:
+            self.rejected[rule] += 1
+            logger.warning("Rate limited %s=%s for %.0fs", rule, _log_value(rule, value), wait)
+        return wait
+
+
+def _log_value(rule, value):
+    """IPs as-is; anything containing an email as a short hash of it."""
+    if rule == "ip":
+        return value
+    return hashlib.sha256(str(value).encode()).hexdigest()[:12]
+
+
+def init_app(app):
+    path = app.config.get('RATELIMIT_SQLITE_PATH')
+    backend = SQLiteBackend(path) if path else MemoryBackend()
+    app.login_limiter = RateLimiter(backend, {
+        "ip": (app.config.get('LOGIN_IP_BURST', DEFAULT_RULES["ip"][0]),
+               app.config.get('LOGIN_IP_PER_MINUTE', DEFAULT_RULES["ip"][1])),
+        "email": (app.config.get('LOGIN_EMAIL_BURST', DEFAULT_RULES["email"][0]),
+                  app.config.get('LOGIN_EMAIL_PER_MINUTE', DEFAULT_RULES["email"][1])),
+        "account": (app.config.get('LOGIN_ACCOUNT_BURST', DEFAULT_RULES["account"][0]),
+                    app.config.get('LOGIN_ACCOUNT_PER_MINUTE', DEFAULT_RULES["account"][1])),
+    })
+
+
+def check_login(limiter, ip, email):
+    """Seconds the caller must wait before another login attempt, or 0."""
+    # The email is first charged per (email, IP), so one noisy address only
+    # exhausts its own pair; it spends at most that pair's refill rate on the
+    # shared account ceiling, which is set well above it
+    return (
+        limiter.hit("ip", ip)
+        or limiter.hit("email", f"{email}|{ip}")
+        or limiter.hit("account", email)
+    )
@@ -0,0 +1,148 @@
+"""
+Content-addressed receipt storage.
+
+Uploads are hashed while they are streamed to a temp file and then stored as
+``u<user_id>/<aa>/<bb>/<sha256>.<ext>`` in the ``receipts`` storage, so the same
+scan uploaded twice by one user is kept once. The ``receipt`` table counts how
+many expenses point at each file; when the count drops to zero the row is
+removed and the file can be purged once the transaction has committed.
+A write that stored a blob and then fails is undone with ``abandon``.
+"""
+
+import hashlib
+import mimetypes
+import re
+from flask import current_app
+from services import storage, thumbnails, uploads
+
+
+_CONTENT_PATH_RE = re.compile(r"u\d+/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+")
+
+
+# One set-based decrement for every receipt a user's live expenses point at
+RELEASE_ALL_SQL = """
+    UPDATE receipt r
+    JOIN (
+        SELECT attachment, COUNT(*) AS refs FROM expense
+        WHERE user_id=%s AND attachment IS NOT NULL
+        GROUP BY attachment
+    ) e ON e.attachment = r.path
+    SET r.ref_count = r.ref_count - e.refs
+    WHERE r.user_id=%s
+"""
+
+
+def receipt_path(user_id, digest, ext):
+    """Relative storage path for a blob, sharded on the first hash bytes."""
+    return f"u{user_id}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def is_content_addressed(path):
+    """True for paths produced by ``receipt_path`` (their bytes never change)."""
+    return bool(_CONTENT_PATH_RE.fullmatch(path))
+
+
+def _put_blob(store, tmp_path, rel_path):
+    """Move the spooled upload into place unless the blob is already stored."""
+    if store.exists(rel_path):
+        uploads.discard(tmp_path)
+    else:
+        store.put_file(tmp_path, rel_path, mimetypes.guess_type(rel_path)[0])
+
+
+def store(cur, file, user_id):
+    """
+    Save an uploaded receipt and take a reference on it.
+
+    Returns the relative path to keep in ``expense.attachment``. Raises
+    ``uploads.UploadRejected`` if the content doesn't match the extension.
+    """
+    ext = uploads.extension(file.filename)
+    receipt_store = storage.get_storage('receipts')
+    sha = hashlib.sha256()
+    tmp_path, size = uploads.spool(file.stream, receipt_store.tmp_dir(), ext, hasher=sha)
+    rel_path = receipt_path(user_id, sha.hexdigest(), ext)
+
+    # The reference is taken before looking for the blob, so a concurrent
+    # ``purge`` has either seen this row or finished deleting (see ``purge``)
+    cur.execute("""
+        INSERT INTO receipt (user_id, path, size, ref_count)
+        VALUES (%s, %s, %s, 1)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+    """, (user_id, rel_path, size))
+    _put_blob(receipt_store, tmp_path, rel_path)
+    return rel_path
+
+
+def release(cur, user_id, path):
+    """
+    Drop one reference to ``path``.
+
+    Returns ``True`` if that was the last reference, in which case the
+    caller should ``purge`` the file after committing. Legacy attachments
+    with no ``receipt`` row are left alone.
+    """
+    if not path:
+        return False
+    cur.execute(
+        "UPDATE receipt SET ref_count = ref_count - 1 WHERE user_id=%s AND path=%s",
+        (user_id, path)
+    )
+    cur.execute(
+        "DELETE FROM receipt WHERE user_id=%s AND path=%s AND ref_count <= 0",
+        (user_id, path)
+    )
+    return cur.rowcount == 1
+
+
+def release_all(cur, user_id):
+    """
+    Drop the references held by all of ``user_id``'s live expenses.
+
+    Call it before the expenses are deleted, in the same transaction.
+    Returns the paths that lost their last reference, to ``purge`` after
+    committing.
+    """
+    cur.execute(RELEASE_ALL_SQL, (user_id, user_id))
+    cur.execute(
+        "SELECT path FROM receipt WHERE user_id=%s AND ref_count <= 0 FOR UPDATE",
+        (user_id,)
+    )
+    paths = [row['path'] for row in cur.fetchall()]
+    cur.execute("DELETE FROM receipt WHERE user_id=%s AND ref_count <= 0", (user_id,))
+    return paths
+
+
+def purge(conn, user_id, path):
+    """
+    Remove an orphaned receipt file and its thumbnail from storage.
+
+    Runs after the release has committed, so an upload of the same bytes may
+    have taken a new reference since. The ``receipt`` row is locked (or,
+    when absent, its key range) while the files go: a concurrent ``store``
+    either got its row in first and the file is kept, or waits and then
+    finds the blob missing and writes it again.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT ref_count FROM receipt WHERE user_id=%s AND path=%s FOR UPDATE",
+            (user_id, path)
+        )
+        if cur.fetchone() is None:
+            store = storage.get_storage('receipts')
+            for name in (path, thumbnails.thumb_name(path, current_app.thumbnailer.fmt)):
+                store.delete(name)
+        conn.commit()
+
+
+def abandon(conn, user_id, path):
+    """
+    Undo a write that failed after ``store`` returned ``path``.
+
+    The reference goes with the rollback, so the blob, already in storage,
+    is purged unless another expense still references it. If the failure
+    came after the commit, the committed reference keeps the file.
+    """
+    conn.rollback()
+    if path:
+        purge(conn, user_id, path)
@@ -0,0 +1,171 @@
+"""
+Recurring expense and income templates.
+
+A ``recurring`` row (rent, a salary, a subscription) is copied into
+``expense`` or ``income`` once per month. ``end_month`` does it for the
+next month of the user who rolls over, the recurring page does it for the
+current month on request, and
+
+    python -m services.recurring [--month 2024-06]
+
+does it for every user with due templates, ``RECURRING_BATCH_USERS`` users
+per transaction. Each batch is one ``INSERT ... SELECT`` per table, so the
+cost doesn't depend on how many templates a user has.
+
+Re-runs don't duplicate. Every copied row carries an idempotency key,
+``recurring_key = '<template id>:<YYYYMM>'``, unique per user, and a
+duplicate key turns the insert into a no-op (``ON DUPLICATE KEY UPDATE``,
+not ``INSERT IGNORE``, which would also swallow truncation and foreign-key
+errors), so two runs for the same month insert each row once. Templates also remember the last month they were copied for
+(``last_month_key``), so a month that ``end_month`` has already archived and
+cleared is not filled again.
+"""
+
+import calendar
+from datetime import date
+from services import archive, versions
+
+KINDS = ("expense", "income")
+DEFAULT_BATCH_USERS = 500
+
+_DUE = "r.active = 1 AND r.last_month_key < %s AND r.user_id IN ({users})"
+
+# Categories and people rows for template labels and payers, so copies get their ids
+CATEGORIES_SQL = """
+    INSERT IGNORE INTO categories (user_id, name)
+    SELECT DISTINCT r.user_id, r.label
+    FROM recurring r
+    WHERE r.kind = 'expense' AND """ + _DUE
+
+PEOPLE_SQL = """
+    INSERT IGNORE INTO people (user_id, name)
+    SELECT DISTINCT r.user_id, COALESCE(r.done_by, 'Self')
+    FROM recurring r
+    WHERE r.kind = 'expense' AND """ + _DUE
+
+EXPENSE_SQL = """
+    INSERT INTO expense (user_id, amount, category, category_id, note, date, done_by, person_id, recurring_key)
+    SELECT r.user_id, r.amount, r.label, c.id, r.note,
+           DATE_ADD(%s, INTERVAL LEAST(r.day, %s) - 1 DAY),
+           p.name, p.id, CONCAT(r.id, ':', %s)
+    FROM recurring r
+    JOIN categories c ON c.user_id = r.user_id AND c.name = r.label
+    JOIN people p ON p.user_id = r.user_id AND p.name = COALESCE(r.done_by, 'Self')
+    WHERE r.kind = 'expense' AND """ + _DUE + """
+    ON DUPLICATE KEY UPDATE expense.id = expense.id
+"""
+
+INCOME_SQL = """
+    INSERT INTO income (user_id, source, amount, recurring_key)
+    SELECT r.user_id, r.label, r.amount, CONCAT(r.id, ':', %s)
+    FROM recurring r
+    WHERE r.kind = 'income' AND """ + _DUE + """
+    ON DUPLICATE KEY UPDATE income.id = income.id
+"""
+
+# Expense rows copied by this run. A template stops being due (MARK_SQL) in
+# the transaction that copies it, so rows keyed to a template that is still
+# due were inserted by this run, never by an earlier one whose copies the
+# insert skipped
+_COPIES = """
+    FROM recurring r
+    JOIN expense e ON e.user_id = r.user_id AND e.recurring_key = CONCAT(r.id, ':', %s)
+    WHERE r.kind = 'expense' AND """ + _DUE
+
+# Budget counters (services.budgets) for the expense copies, one row per category
+BUDGETS_SQL = """
+    UPDATE categories c
+    JOIN (
+        SELECT e.category_id, SUM(e.amount) AS total
+        """ + _COPIES + """
+        GROUP BY e.category_id
+    ) t ON t.category_id = c.id
+    SET c.spent = c.spent + t.total
+"""
+
+# Per-person running totals (services.people) for the expense copies
+PEOPLE_TOTALS_SQL = """
+    UPDATE people p
+    JOIN (
+        SELECT e.person_id, SUM(e.amount) AS total
+        """ + _COPIES + """
+        GROUP BY e.person_id
+    ) t ON t.person_id = p.id
+    SET p.spent = p.spent + t.total
+"""
+
+MARK_SQL = "UPDATE recurring r SET r.last_month_key = %s WHERE " + _DUE
+
+DUE_USERS_SQL = """
+    SELECT DISTINCT user_id FROM recurring
+    WHERE active = 1 AND last_month_key < %s
+    ORDER BY user_id
+"""
+
+
+def materialize(cur, user_ids, month_key):
+    """
+    Copy ``user_ids``' due templates into ``month_key``; returns rows inserted.
+
+    The caller commits, so the copies, ``last_month_key`` and the users'
+    expense versions (``services.versions``) land together.
+    """
+    if not user_ids:
+        return 0
+    users = ", ".join(["%s"] * len(user_ids))
+    year, month = divmod(month_key, 100)
+    first_day = date(year, month, 1)
+    days = calendar.monthrange(year, month)[1]
+
+    cur.execute(CATEGORIES_SQL.format(users=users), (month_key, *user_ids))
+    cur.execute(PEOPLE_SQL.format(users=users), (month_key, *user_ids))
+    cur.execute(EXPENSE_SQL.format(users=users), (first_day, days, month_key, month_key, *user_ids))
+    inserted = cur.rowcount
+    cur.execute(INCOME_SQL.format(users=users), (month_key, month_key, *user_ids))
+    inserted += cur.rowcount
+    cur.execute(BUDGETS_SQL.format(users=users), (month_key, month_key, *user_ids))
+    cur.execute(PEOPLE_TOTALS_SQL.format(users=users), (month_key, month_key, *user_ids))
+    cur.execute(MARK_SQL.format(users=users), (month_key, month_key, *user_ids))
+    # Copies can land on days a worker's forecast state has already closed
+    versions.bump(cur, user_ids, "expense")
+    return inserted
+
+
+def materialize_all(conn, month_key, batch_users=DEFAULT_BATCH_USERS):
+    """Materialize ``month_key`` for every user with due templates, one batch per commit."""
+    with conn.cursor() as cur:
+        cur.execute(DUE_USERS_SQL, (month_key,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        inserted = 0
+        for start in range(0, len(user_ids), batch_users):
+            inserted += materialize(cur, user_ids[start:start + batch_users], month_key)
+            conn.commit()
+    return len(user_ids), inserted
+
+
+def main(argv=None):
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Copy recurring templates into a month.")
+    parser.add_argument("--month", default=None, help="YYYY-MM (default: this month)")
+    args = parser.parse_args(argv)
+
+    month_key = archive.month_key(args.month) if args.month else archive.key_for(date.today())
+    if month_key is None:
+        parser.error("--month must look like 2024-06")
+
+    app = create_app()
+    with app.app_context():
+        conn = app.db_pool.get_connection()
+        try:
+            users, inserted = materialize_all(
+                conn, month_key, app.config.get('RECURRING_BATCH_USERS', DEFAULT_BATCH_USERS)
+            )
+        finally:
+            conn.close()
+    print(f"Materialized {inserted} rows for {users} users into {archive.month_label(month_key)}")
+
+
+if __name__ == "__main__":
+    main()
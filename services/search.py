@@ -0,0 +1,98 @@
+"""
+Full-text search over live and archived expenses.
+
+``expense`` carries a ``FULLTEXT (category, note)`` index. User input is
+turned into a MySQL boolean-mode query where every term is required and
+prefix-matched (``dent`` finds "dentist"). ``archived_expense`` is
+partitioned by month, and InnoDB can't keep FULLTEXT indexes on partitioned
+tables, so its searchable text, and the fields a result shows, are copied
+into ``archived_expense_text``, an unpartitioned table keyed by
+``(id, month_key)`` with the same FULLTEXT index. Results are read from that
+copy alone, so it is kept when a month is compacted into cold storage (see
+``services.coldstore``) and compacted months stay searchable. Results from
+both tables are ranked together by relevance. Pages are fetched with one
+extra row instead of a separate ``COUNT(*)``.
+"""
+
+import re
+
+PER_PAGE = 20
+MAX_TERMS = 8
+# InnoDB ignores tokens shorter than innodb_ft_min_token_size (default 3)
+MIN_TERM_LENGTH = 3
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+SEARCH_QUERY = """
+    SELECT id, amount, category, note, date, done_by, NULL AS month, 0 AS archived,
+           MATCH(category, note) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM expense
+    WHERE user_id=%s AND MATCH(category, note) AGAINST (%s IN BOOLEAN MODE)
+    UNION ALL
+    SELECT t.id, t.amount, t.category, t.note, t.date, t.done_by, t.month, 1 AS archived,
+           MATCH(t.category, t.note) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM archived_expense_text t
+    WHERE t.user_id=%s AND MATCH(t.category, t.note) AGAINST (%s IN BOOLEAN MODE)
+    ORDER BY score DESC, date DESC, id DESC
+    LIMIT %s OFFSET %s
+"""
+
+# Re-running for a month already indexed only adds its new rows
+INDEX_MONTH_SQL = """
+    INSERT IGNORE INTO archived_expense_text (id, month_key, user_id, category, note, amount, date, done_by, month)
+    SELECT id, month_key, user_id, category, note, amount, date, done_by, month FROM archived_expense
+    WHERE user_id=%s AND month_key=%s
+"""
+
+
+def search_terms(text):
+    """Searchable lowercase words of ``text``, operators stripped."""
+    terms = [t.lower() for t in _TERM_RE.findall(text or "")]
+    return [t for t in terms if len(t) >= MIN_TERM_LENGTH][:MAX_TERMS]
+
+
+def boolean_query(text):
+    """
+    Build a boolean-mode query requiring every term as a prefix.
+
+    Operators in the input are stripped so users can't craft their own
+    boolean expressions. Returns ``""`` when nothing searchable remains.
+    """
+    return " ".join(f"+{t}*" for t in search_terms(text))
+
+
+def search_expenses(cur, user_id, text, page=1, per_page=PER_PAGE):
+    """
+    Return ``(results, has_next)`` for one page of ranked matches.
+
+    ``results`` are dict rows with an ``archived`` flag telling the caller
+    which table (and therefore which detail page) each hit came from.
+    """
+    query = boolean_query(text)
+    if not query:
+        return [], False
+
+    page = max(page, 1)
+    cur.execute(SEARCH_QUERY, (
+        query, user_id, query,
+        query, user_id, query,
+        per_page + 1, (page - 1) * per_page,
+    ))
+    rows = cur.fetchall()
+    return rows[:per_page], len(rows) > per_page
+
+
+def index_archived_month(cur, user_id, month_key):
+    """Make ``month_key``'s archived expenses searchable; call after archiving them."""
+    cur.execute(INDEX_MONTH_SQL, (user_id, month_key))
+
+
+def unindex_archived(cur, user_id, month_key=None):
+    """Drop the search text of a user's archived month (or of all of them)."""
+    if month_key is None:
+        cur.execute("DELETE FROM archived_expense_text WHERE user_id=%s", (user_id,))
+    else:
+        cur.execute(
+            "DELETE FROM archived_expense_text WHERE user_id=%s AND month_key=%s",
+            (user_id, month_key)
+        )
@@ -0,0 +1,112 @@
+"""
+Per-user settings cache.
+
+The ``setting`` row is read by almost every page, so it is kept in process
+memory for ``SETTINGS_CACHE_TTL`` seconds and memoised on ``flask.g`` for the
+rest of the request. Each cached row remembers the user's ``setting``
+version (``services.versions``), and a hit is only served while that version
+is unchanged, so a write in another worker is seen on the next request.
+Routes that write the row bump the version in their transaction and call
+``invalidate`` to drop this worker's copy.
+"""
+
+import threading
+import time
+from flask import current_app, g, session
+from services import money, versions
+
+DEFAULT_TTL = 60
+
+SETTINGS_QUERY = """
+    SELECT s.monthly_limit, s.total_savings, COALESCE(p.name, s.default_done_by) AS default_done_by,
+           s.use_automated_income, COALESCE(v.setting_version, 0) AS setting_version
+    FROM setting s
+    LEFT JOIN people p ON p.id = s.default_person_id
+    LEFT JOIN cache_version v ON v.user_id = s.user_id
+    WHERE s.user_id=%s
+    LIMIT 1
+"""
+
+
+class SettingsCache:
+    """Thread-safe TTL cache of ``(version, normalised setting row)`` keyed by user id."""
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, value = entry
+            if self._clock() >= expires:
+                del self._entries[user_id]
+                return None
+            return value
+
+    def set(self, user_id, value):
+        with self._lock:
+            self._entries[user_id] = (self._clock() + self.ttl, value)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def init_app(app):
+    app.settings_cache = SettingsCache(app.config.get('SETTINGS_CACHE_TTL', DEFAULT_TTL))
+
+
+def normalize(row):
+    """Turn a (possibly missing) setting row into a dict with defaults; amounts in cents."""
+    row = row or {}
+    return {
+        "exists": bool(row),
+        "monthly_limit": money.to_cents(row.get('monthly_limit')),
+        "total_savings": money.to_cents(row.get('total_savings')),
+        "default_done_by": row.get('default_done_by'),
+        "use_automated_income": bool(row.get('use_automated_income')),
+    }
+
+
+def get_settings(cur):
+    """
+    Return the logged-in user's settings.
+
+    Loaded at most once per request. A cached row costs one primary-key
+    lookup on ``cache_version``; on a miss the row and its version come
+    from one query on the caller's (dictionary) cursor, so no extra
+    connection is checked out.
+    """
+    if 'settings' in g:
+        return g.settings
+
+    user_id = session['user_id']
+    cache = current_app.settings_cache
+    entry = cache.get(user_id)
+    if entry is not None and entry[0] == versions.read(cur, user_id)[2]:
+        setting = entry[1]
+    else:
+        cur.execute(SETTINGS_QUERY, (user_id,))
+        row = cur.fetchone()
+        setting = normalize(row)
+        # Users without a row yet have no version to check against
+        if row:
+            cache.set(user_id, (row.get('setting_version', 0), setting))
+
+    g.settings = setting
+    return setting
+
+
+def invalidate(user_id):
+    """Drop this worker's cached settings for ``user_id`` after a write."""
+    current_app.settings_cache.invalidate(user_id)
+    g.pop('settings', None)
@@ -0,0 +1,189 @@
+"""
+Pluggable storage for uploaded files.
+
+Uploads are grouped by kind (``receipts``, ``avatars``, and ``archive`` for
+compacted history, see ``services.coldstore``) and addressed by a
+relative key such as ``u1/ab/cd/<sha256>.pdf``. ``STORAGE_BACKEND`` picks
+where the bytes live:
+
+- ``local`` (default): ``RECEIPT_FOLDER`` / ``AVATAR_FOLDER`` / ``ARCHIVE_FOLDER`` on this node's disk, served by the
+  app or handed to the front proxy (see ``services.files``)
+- ``s3``: an S3-compatible bucket (AWS, MinIO, ...) under
+  ``<S3_PREFIX><kind>/``; downloads are redirected to short-lived presigned
+  URLs and large uploads go up as parallel multipart transfers
+
+Writers always spool to a local temp file first (``tmp_dir``) and then hand
+it over with ``put_file``, which takes ownership of the temp file.
+"""
+
+import contextlib
+import os
+import tempfile
+import threading
+from flask import current_app
+from werkzeug.security import safe_join
+
+# Upload kind -> config key of its local folder
+KINDS = {"receipts": "RECEIPT_FOLDER", "avatars": "AVATAR_FOLDER", "archive": "ARCHIVE_FOLDER"}
+
+DEFAULT_URL_EXPIRY = 300
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class LocalStorage:
+    """Files under a directory on this node."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"unsafe storage key: {key!r}")
+        return path
+
+    def tmp_dir(self):
+        # Same filesystem as the store, so put_file is an atomic rename
+        return os.path.join(self.root, 'tmp')
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def put_file(self, tmp_path, key, content_type=None):
+        dest = self.local_path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp_path, dest)
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextlib.contextmanager
+    def fetch(self, key):
+        """Yield a local path holding the object's bytes."""
+        yield self.local_path(key)
+
+    def url(self, key, expires=DEFAULT_URL_EXPIRY, cache_control=None):
+        """Local files have no direct URL; the app serves them."""
+        return None
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket."""
+
+    def __init__(self, client, bucket, prefix="", transfer_config=None):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.transfer_config = transfer_config
+
+    def _key(self, key):
+        if key.startswith('/') or '..' in key.split('/'):
+            raise ValueError(f"unsafe storage key: {key!r}")
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None
+
+    def tmp_dir(self):
+        return tempfile.gettempdir()
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put_file(self, tmp_path, key, content_type=None):
+        # upload_file switches to a threaded multipart upload above the
+        # configured threshold
+        extra = {'ContentType': content_type} if content_type else None
+        try:
+            self.client.upload_file(
+                tmp_path, self.bucket, self._key(key),
+                ExtraArgs=extra, Config=self.transfer_config,
+            )
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    @contextlib.contextmanager
+    def fetch(self, key):
+        """Download the object to a temp file for the duration of the block."""
+        fd, path = tempfile.mkstemp(suffix='.' + key.rsplit('.', 1)[-1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), path, Config=self.transfer_config)
+            yield path
+        finally:
+            os.remove(path)
+
+    def url(self, key, expires=DEFAULT_URL_EXPIRY, cache_control=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if cache_control:
+            params['ResponseCacheControl'] = cache_control
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _s3_client(endpoint_url, region):
+    """One boto3 client per process and endpoint; clients are thread-safe."""
+    with _clients_lock:
+        client = _clients.get((endpoint_url, region))
+        if client is None:
+            import boto3
+
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+            _clients[(endpoint_url, region)] = client
+        return client
+
+
+def storage_config(config):
+    """The picklable subset of app config needed to open a backend."""
+    keys = list(KINDS.values()) + [
+        'STORAGE_BACKEND', 'S3_BUCKET', 'S3_PREFIX', 'S3_ENDPOINT_URL', 'S3_REGION',
+        'S3_MULTIPART_THRESHOLD', 'S3_MULTIPART_CHUNKSIZE', 'S3_MAX_CONCURRENCY',
+    ]
+    return {key: config.get(key) for key in keys}
+
+
+def open_storage(kind, cfg):
+    """Build the backend for ``kind`` from a ``storage_config`` dict."""
+    if kind not in KINDS:
+        raise ValueError(f"unknown upload kind: {kind!r}")
+    backend = cfg.get('STORAGE_BACKEND') or 'local'
+    if backend == 'local':
+        return LocalStorage(cfg[KINDS[kind]])
+    if backend == 's3':
+        from boto3.s3.transfer import TransferConfig
+
+        transfer = TransferConfig(
+            multipart_threshold=cfg.get('S3_MULTIPART_THRESHOLD') or DEFAULT_MULTIPART_THRESHOLD,
+            multipart_chunksize=cfg.get('S3_MULTIPART_CHUNKSIZE') or DEFAULT_MULTIPART_CHUNKSIZE,
+            max_concurrency=cfg.get('S3_MAX_CONCURRENCY') or DEFAULT_MAX_CONCURRENCY,
+        )
+        client = _s3_client(cfg.get('S3_ENDPOINT_URL'), cfg.get('S3_REGION'))
+        return S3Storage(client, cfg['S3_BUCKET'], f"{cfg.get('S3_PREFIX') or ''}{kind}/", transfer)
+    raise ValueError(f"unknown STORAGE_BACKEND: {backend!r}")
+
+
+def get_storage(kind):
+    """The backend for ``kind`` under the current app's config."""
+    return open_storage(kind, storage_config(current_app.config))
@@ -0,0 +1,190 @@
+"""
+Receipt thumbnails rendered in a background process pool.
+
+Each receipt gets a small preview stored next to it (in the ``receipts``
+storage) as ``<receipt>.thumb.<fmt>``: images are downscaled with Pillow and PDFs have
+their first page rendered with PyMuPDF. Rendering is CPU-bound, so it runs in
+a ``ProcessPoolExecutor`` that is created lazily in each worker process;
+uploads queue a render and the thumbnail route waits briefly for one that
+hasn't finished yet. ``THUMBNAIL_WORKERS = 0`` renders inline instead.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, TimeoutError
+from flask import current_app
+from services import storage
+
+IMAGE_EXT = {"png", "jpg", "jpeg"}
+PDF_EXT = {"pdf"}
+
+DEFAULT_SIZE = 320
+DEFAULT_FORMAT = "webp"
+DEFAULT_WAIT = 2.0
+
+# Sentinels returned by ensure()
+UNSUPPORTED = None
+PENDING = ""
+
+
+def thumb_name(path, fmt=DEFAULT_FORMAT):
+    return f"{path}.thumb.{fmt}"
+
+
+def supported(path):
+    ext = path.rsplit('.', 1)[-1].lower()
+    return ext in IMAGE_EXT or ext in PDF_EXT
+
+
+def render(src, dest, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    """
+    Write a thumbnail of ``src`` to ``dest``; runs in a pool process.
+
+    Returns ``False`` if the file type can't be previewed here.
+    """
+    from PIL import Image, ImageOps
+
+    ext = src.rsplit('.', 1)[-1].lower()
+    if ext in PDF_EXT:
+        try:
+            import fitz
+        except ImportError:
+            return False
+        with fitz.open(src) as doc:
+            if not doc.page_count:
+                return False
+            pix = doc[0].get_pixmap(dpi=72)
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    elif ext in IMAGE_EXT:
+        img = ImageOps.exif_transpose(Image.open(src))
+    else:
+        return False
+
+    img.thumbnail((size, size))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    tmp = dest + ".part"
+    img.save(tmp, format=fmt.upper(), quality=75)
+    os.replace(tmp, dest)
+    return True
+
+
+def render_stored(cfg, path, name, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    """
+    Render receipt ``path`` into storage as ``name``; runs in a pool process.
+
+    ``cfg`` is a ``storage.storage_config`` dict, since pool processes have
+    no app context.
+    """
+    store = storage.open_storage('receipts', cfg)
+    os.makedirs(store.tmp_dir(), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=store.tmp_dir(), suffix='.' + fmt)
+    os.close(fd)
+    try:
+        with store.fetch(path) as src:
+            ok = render(src, tmp, size, fmt)
+        if ok:
+            store.put_file(tmp, name, f"image/{fmt}")
+        return ok
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class Thumbnailer:
+    """Lazily started process pool with de-duplication of in-flight renders."""
+
+    def __init__(self, workers, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+        self.workers = workers
+        self.size = size
+        self.fmt = fmt
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            # multiprocessing is slow to import; only pay for it when used
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, cfg, path, name):
+        """Queue a render of receipt ``path`` to ``name`` and return its ``Future``."""
+        with self._lock:
+            future = self._pending.get(name)
+            if future is not None:
+                return future
+
+            if self.workers == 0:
+                future = Future()
+                try:
+                    future.set_result(render_stored(cfg, path, name, self.size, self.fmt))
+                except Exception as e:
+                    future.set_exception(e)
+                return future
+
+            future = self._pool().submit(render_stored, cfg, path, name, self.size, self.fmt)
+            self._pending[name] = future
+
+        future.add_done_callback(lambda _f: self._forget(name))
+        return future
+
+    def _forget(self, name):
+        with self._lock:
+            self._pending.pop(name, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def init_app(app):
+    app.thumbnailer = Thumbnailer(
+        app.config.get('THUMBNAIL_WORKERS', 2),
+        app.config.get('THUMBNAIL_SIZE', DEFAULT_SIZE),
+        app.config.get('THUMBNAIL_FORMAT', DEFAULT_FORMAT),
+    )
+
+
+def schedule(path):
+    """Start rendering a thumbnail for a freshly stored receipt."""
+    if not path or not supported(path):
+        return
+    name = thumb_name(path, current_app.thumbnailer.fmt)
+    if not storage.get_storage('receipts').exists(name):
+        current_app.thumbnailer.submit(storage.storage_config(current_app.config), path, name)
+
+
+def ensure(path):
+    """
+    Return the thumbnail's key in the ``receipts`` storage.
+
+    Returns ``UNSUPPORTED`` if no preview can be made and ``PENDING`` if a
+    render is still running after ``THUMBNAIL_WAIT`` seconds.
+    """
+    if not supported(path):
+        return UNSUPPORTED
+    store = storage.get_storage('receipts')
+    name = thumb_name(path, current_app.thumbnailer.fmt)
+    try:
+        if store.exists(name):
+            return name
+        if not store.exists(path):
+            return UNSUPPORTED
+    except ValueError:
+        return UNSUPPORTED
+
+    future = current_app.thumbnailer.submit(storage.storage_config(current_app.config), path, name)
+    try:
+        ok = future.result(timeout=current_app.config.get('THUMBNAIL_WAIT', DEFAULT_WAIT))
+    except TimeoutError:
+        return PENDING
+    except Exception:
+        current_app.logger.exception("Thumbnail render failed for %s", path)
+        return UNSUPPORTED
+    return name if ok else UNSUPPORTED
@@ -0,0 +1,118 @@
+"""
+Date-bucketed expense series for charts.
+
+SQL only ever groups on the raw ``date`` column, which the
+``(user_id, date)`` index already keeps in order, so the database returns one
+pre-sorted row per day. Rolling days up into weeks or months and filling the
+gaps with zeros happens here in Python on that small result. A gap-filled
+series never has more than ``MAX_BUCKETS`` points: ``fit_granularity`` picks a
+coarser granularity when the data spans too long, and ``bucket`` skips the
+zero filling rather than emit more.
+"""
+
+from datetime import date, timedelta
+
+GRANULARITIES = ('day', 'week', 'month')
+DEFAULT_GRANULARITY = 'day'
+
+MAX_BUCKETS = 400
+
+LABEL_FORMATS = {
+    'day': '%b %d',
+    'week': '%b %d',
+    'month': '%b %Y',
+}
+
+# Day and week labels carry the year once a series spans more than one
+YEAR_LABEL_FORMATS = dict(LABEL_FORMATS, day='%b %d %Y', week='%b %d %Y')
+
+DAILY_TOTALS_QUERY = """
+    SELECT date, SUM(amount) AS total
+    FROM {table}
+    WHERE user_id=%s{range_sql}
+    GROUP BY date
+    ORDER BY date
+"""
+
+
+def parse_granularity(value):
+    """Return a supported granularity, falling back to the default."""
+    return value if value in GRANULARITIES else DEFAULT_GRANULARITY
+
+
+def daily_totals(cur, user_id, table='expense', date_range=None):
+    """Fetch ``(date, total)`` rows for one user, one row per day with spend."""
+    range_sql, range_params = date_range.sql() if date_range else ("", [])
+    cur.execute(
+        DAILY_TOTALS_QUERY.format(table=table, range_sql=range_sql),
+        (user_id, *range_params)
+    )
+    return cur.fetchall()
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_count(first, last, granularity):
+    """Number of ``granularity`` buckets from ``first`` to ``last`` inclusive."""
+    first, last = bucket_start(first, granularity), bucket_start(last, granularity)
+    if granularity == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    step = 7 if granularity == 'week' else 1
+    return (last - first).days // step + 1
+
+
+def _day(row):
+    day = row['date']
+    return date.fromisoformat(day) if isinstance(day, str) else day
+
+
+def fit_granularity(rows, granularity=DEFAULT_GRANULARITY, max_buckets=MAX_BUCKETS):
+    """``granularity``, or the next coarser one whose series fits in ``max_buckets``."""
+    if not rows:
+        return granularity
+    first, last = _day(rows[0]), _day(rows[-1])
+    for candidate in GRANULARITIES[GRANULARITIES.index(granularity):]:
+        if bucket_count(first, last, candidate) <= max_buckets:
+            return candidate
+    return GRANULARITIES[-1]
+
+
+def bucket(rows, granularity=DEFAULT_GRANULARITY, max_buckets=MAX_BUCKETS):
+    """
+    Roll daily rows up to ``granularity`` and fill empty buckets with zero.
+
+    Returns ``(labels, values)`` in chronological order. Spans longer than
+    ``max_buckets`` only get the buckets that have data.
+    """
+    totals = {}
+    for row in rows:
+        key = bucket_start(_day(row), granularity)
+        totals[key] = totals.get(key, 0.0) + float(row['total'])
+
+    if not totals:
+        return [], []
+
+    first, last = min(totals), max(totals)
+    fmt = (YEAR_LABEL_FORMATS if first.year != last.year else LABEL_FORMATS)[granularity]
+    if bucket_count(first, last, granularity) > max_buckets:
+        starts = sorted(totals)
+    else:
+        starts, current = [], first
+        while current <= last:
+            starts.append(current)
+            current = next_bucket(current, granularity)
+    return [start.strftime(fmt) for start in starts], [totals.get(start, 0.0) for start in starts]
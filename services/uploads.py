@@ -0,0 +1,71 @@
+"""
+Chunked, validated upload writing shared by receipts and avatars.
+
+Uploads are copied from the request stream into a temp file in
+``CHUNK_SIZE`` pieces, so a worker never holds more than one chunk of a file
+in memory. The first chunk is checked against the file type's magic bytes
+before anything else is written, and the temp file is only handed to
+storage (``services.storage``) once the whole upload has been copied.
+"""
+
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+MAGIC_BYTES = {
+    "pdf": (b"%PDF-",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "jpg": (b"\xff\xd8\xff",),
+    "jpeg": (b"\xff\xd8\xff",),
+    "doc": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",),
+}
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload's content does not match its extension."""
+
+
+def extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def matches_magic(head, ext):
+    return any(head.startswith(magic) for magic in MAGIC_BYTES.get(ext, ()))
+
+
+def spool(stream, tmp_dir, ext, hasher=None, chunk_size=CHUNK_SIZE):
+    """
+    Copy ``stream`` into a new temp file in ``tmp_dir``.
+
+    Returns ``(tmp_path, size)``. ``hasher`` (e.g. ``hashlib.sha256()``) is
+    fed every chunk. Raises ``UploadRejected`` if the first chunk doesn't
+    carry the magic bytes for ``ext``; the temp file is removed on any error.
+    """
+    head = stream.read(chunk_size)
+    if not matches_magic(head, ext):
+        raise UploadRejected(f"content is not a valid .{ext} file")
+
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            chunk = head
+            while chunk:
+                if hasher is not None:
+                    hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+                chunk = stream.read(chunk_size)
+        return tmp_path, size
+    except BaseException:
+        discard(tmp_path)
+        raise
+
+
+def discard(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,44 @@
+"""
+Per-user data versions shared by every worker process.
+
+``services.settings``, ``services.forecast`` and ``services.analytics``
+cache state in process memory, so an invalidation in the worker that handled a write
+never reaches the others. Instead, writers bump a counter in
+``cache_version`` inside the transaction that changes the data, and the
+caches remember the counters they were built at and rebuild when one has
+moved. Checking costs one primary-key lookup per cached read.
+
+- ``archive``: archived months changed (``end_month``, ``fresh_start``)
+- ``expense``: live expenses on a day some cache may have closed changed
+- ``setting``: the ``setting`` row changed (``/settings/update``, ``end_month``, ``fresh_start``)
+"""
+
+KINDS = ("archive", "expense", "setting")
+
+READ_SQL = "SELECT archive_version, expense_version, setting_version FROM cache_version WHERE user_id=%s"
+
+
+def bump(cur, user_ids, *kinds):
+    """Move each of ``kinds``' counters for each of ``user_ids``."""
+    for kind in kinds:
+        if kind not in KINDS:
+            raise ValueError(f"unknown version {kind!r}")
+    if not user_ids or not kinds:
+        return
+    columns = [f"{kind}_version" for kind in kinds]
+    row = "(%s" + ", 1" * len(columns) + ")"
+    cur.execute(
+        f"INSERT INTO cache_version (user_id, {', '.join(columns)}) VALUES "
+        + ", ".join([row] * len(user_ids))
+        + " ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = {c} + 1" for c in columns),
+        tuple(user_ids)
+    )
+
+
+def read(cur, user_id):
+    """``(archive, expense, setting)`` versions of ``user_id``; zeros before any bump."""
+    cur.execute(READ_SQL, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return 0, 0, 0
+    return row['archive_version'], row['expense_version'], row['setting_version']
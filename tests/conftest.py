@@ -21,8 +21,12 @@ class TestConfig:
     UPLOAD_FOLDER = '/tmp/test_uploads'
     AVATAR_FOLDER = '/tmp/test_uploads/avatars'
     RECEIPT_FOLDER = '/tmp/test_uploads/receipts'
+    ARCHIVE_FOLDER = '/tmp/test_uploads/archive'
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024
     ALLOWED_ATTACH_EXT = {"pdf", "png", "jpg", "jpeg", "doc"}
+    THUMBNAIL_WORKERS = 0
+    PASSWORD_HASH_METHOD = 'scrypt:1024:8:1'
+    PASSWORD_HASH_WORKERS = 0
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
 
@@ -107,3 +111,22 @@ def mock_db(app_no_csrf):
     conn, cursor = make_mock_connection()
     app_no_csrf.db_pool.get_connection.return_value = conn
     return conn, cursor
+
+
+@pytest.fixture
+def s3_bucket(app_no_csrf, monkeypatch):
+    """Point uploads at an in-process S3 stand-in (moto) and return its client."""
+    moto = pytest.importorskip('moto')
+    import boto3
+    from services import storage
+
+    for var, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'),
+                       ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(var, value)
+    with moto.mock_aws():
+        storage._clients.clear()
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='test-uploads')
+        app_no_csrf.config.update(STORAGE_BACKEND='s3', S3_BUCKET='test-uploads', S3_REGION='us-east-1')
+        yield client
+        storage._clients.clear()
@@ -6,6 +6,7 @@ Tests cover signup, login, logout, and profile functionality.
 import pytest
 import os
 import sys
+import types
 from unittest.mock import MagicMock, patch
 from werkzeug.security import generate_password_hash
 
@@ -257,6 +258,78 @@ class TestProfile:
         assert response.status_code == 200
         cursor.execute.assert_called()
 
+    def test_profile_avatar_resized_and_stripped(self, client_no_csrf, app_no_csrf, tmp_path):
+        """Avatars should be stored once per fixed size, as WebP, without EXIF."""
+        import io
+        from PIL import Image
+        login_session(client_no_csrf)
+        app_no_csrf.config['AVATAR_FOLDER'] = str(tmp_path)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'id': 1, 'name': 'Test User', 'email': 'test@example.com', 'avatar_filename': None}
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        photo = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        Image.new('RGB', (2000, 1500), (10, 120, 200)).save(photo, format='JPEG', exif=exif)
+        photo.seek(0)
+
+        response = client_no_csrf.post('/auth/profile', data={
+            'name': 'Test User',
+            'avatar': (photo, 'me.jpg'),
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        stored = sorted(p.name for p in (tmp_path / 'u1').iterdir())
+        assert [name.rsplit('-', 1)[1] for name in stored] == ['128.webp', '32.webp', '64.webp']
+        for name in stored:
+            with Image.open(tmp_path / 'u1' / name) as img:
+                size = int(name.rsplit('-', 1)[1].split('.')[0])
+                assert img.size == (size, size)
+                assert not img.getexif()
+
+        update = [c for c in cursor.execute.call_args_list if 'SET avatar_filename' in c.args[0]][0]
+        key = update.args[1][0]
+        assert key.startswith('u1/') and key + '-64.webp' in [f'u1/{n}' for n in stored]
+
+    def test_avatar_served_immutable(self, client_no_csrf, app_no_csrf, tmp_path):
+        """Normalised avatar files never change, so they can be cached forever."""
+        login_session(client_no_csrf)
+        app_no_csrf.config['AVATAR_FOLDER'] = str(tmp_path)
+        name = f"u1/{'c' * 32}-32.webp"
+        (tmp_path / 'u1').mkdir()
+        (tmp_path / name).write_bytes(b'RIFF')
+
+        response = client_no_csrf.get(f'/uploads/avatars/{name}')
+        assert response.status_code == 200
+        assert 'immutable' in response.headers['Cache-Control']
+
+    def test_avatar_variant_falls_back_for_legacy_names(self):
+        from services.avatars import variant
+        key = 'u1/' + 'c' * 32
+        assert variant(key, 24) == key + '-32.webp'
+        assert variant(key, 100) == key + '-128.webp'
+        assert variant(key, 512) == key + '-128.webp'
+        assert variant('user1_me.png', 32) == 'user1_me.png'
+
+    def test_profile_avatar_wrong_content_rejected(self, client_no_csrf, app_no_csrf, tmp_path):
+        """A file named .png that isn't a PNG should be refused and not stored."""
+        import io
+        login_session(client_no_csrf)
+        app_no_csrf.config['AVATAR_FOLDER'] = str(tmp_path)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'id': 1, 'name': 'Test User', 'email': 'test@example.com', 'avatar_filename': None}
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/auth/profile', data={
+            'name': 'Test User',
+            'avatar': (io.BytesIO(b'<?php echo 1; ?>'), 'shell.png'),
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        assert list(tmp_path.iterdir()) == []
+        assert not any('avatar_filename=%s' in str(c) for c in cursor.execute.call_args_list)
+
 
 class TestAvatarUpload:
     """Test avatar file upload validation."""
@@ -306,3 +379,99 @@ class TestPasswordSecurity:
         assert hashed != password
         assert check_password_hash(hashed, password) is True
         assert check_password_hash(hashed, 'wrong_password') is False
+
+    def test_hash_uses_configured_method(self):
+        from services.passwords import PasswordHasher
+        hasher = PasswordHasher('scrypt:1024:8:1', workers=0)
+        hashed = hasher.hash('pw-12345678')
+
+        assert hashed.startswith('scrypt:1024:8:1$')
+        assert hasher.verify(hashed, 'pw-12345678') is True
+        assert hasher.needs_rehash(hashed) is False
+        assert hasher.needs_rehash(generate_password_hash('pw-12345678')) is True
+
+    def test_bare_method_names_are_normalised(self):
+        """A bare 'scrypt' must not flag Werkzeug's default hashes for rehash."""
+        from services.passwords import PasswordHasher, normalize
+        assert normalize('scrypt') == 'scrypt:32768:8:1'
+        assert normalize('scrypt:16384') == 'scrypt:16384:8:1'
+        assert PasswordHasher('scrypt').needs_rehash(generate_password_hash('x')) is False
+
+    def test_verify_inline_without_gevent(self, monkeypatch):
+        """Sync workers verify on the request thread; no pool is started."""
+        from services.passwords import PasswordHasher
+        monkeypatch.delitem(sys.modules, 'gevent.monkey', raising=False)
+        hasher = PasswordHasher('scrypt:1024:8:1', workers=2)
+        hashed = hasher.hash('pw-12345678')
+        assert hasher.verify(hashed, 'pw-12345678') is True
+        assert hasher.verify(hashed, 'nope') is False
+        assert hasher._executor is None
+
+    def test_verify_on_gevent_thread_pool(self, monkeypatch):
+        """Under gevent the hash runs on a gevent ThreadPool sized by the workers setting."""
+        from services.passwords import PasswordHasher
+        pools = []
+
+        class ThreadPool:
+            def __init__(self, maxsize):
+                self.maxsize = maxsize
+                self.killed = False
+                pools.append(self)
+
+            def apply(self, func, args):
+                return func(*args)
+
+            def kill(self):
+                self.killed = True
+
+        monkey = types.SimpleNamespace(is_module_patched=lambda name: name == 'threading')
+        monkeypatch.setitem(sys.modules, 'gevent.monkey', monkey)
+        monkeypatch.setitem(sys.modules, 'gevent.threadpool', types.SimpleNamespace(ThreadPool=ThreadPool))
+        hasher = PasswordHasher('scrypt:1024:8:1', workers=2)
+        hashed = hasher.hash('pw-12345678')
+        assert hasher.verify(hashed, 'pw-12345678') is True
+        assert hasher.verify(hashed, 'nope') is False
+        assert len(pools) == 1 and pools[0].maxsize == 2
+        hasher.shutdown()
+        assert pools[0].killed
+
+    def test_benchmark_picks_cost_near_target(self):
+        from services.passwords import benchmark
+        method = benchmark(target_ms=0.01, max_n=2 ** 13)
+        assert method == 'scrypt:4096:8:1'
+
+    def test_login_rehashes_outdated_hash(self, client_no_csrf, app_no_csrf):
+        """A successful login should upgrade a hash made with old parameters."""
+        old_hash = generate_password_hash('correctpassword', method='pbkdf2:sha256:1000')
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'id': 1, 'name': 'Test User', 'email': 'test@example.com',
+            'password_hash': old_hash, 'avatar_filename': None,
+        }
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/auth/login', data={
+            'email': 'test@example.com',
+            'password': 'correctpassword',
+        })
+
+        assert response.status_code == 302
+        update = [c for c in cursor.execute.call_args_list if 'SET password_hash' in c.args[0]]
+        assert len(update) == 1
+        new_hash, user_id, expected_old = update[0].args[1]
+        assert new_hash.startswith('scrypt:1024:8:1$') and user_id == 1 and expected_old == old_hash
+
+    def test_login_keeps_current_hash(self, client_no_csrf, app_no_csrf):
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'id': 1, 'name': 'Test User', 'email': 'test@example.com',
+            'password_hash': generate_password_hash('correctpassword', method='scrypt:1024:8:1'),
+            'avatar_filename': None,
+        }
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/auth/login', data={
+            'email': 'test@example.com',
+            'password': 'correctpassword',
+        })
+        assert not any('SET password_hash' in c.args[0] for c in cursor.execute.call_args_list)
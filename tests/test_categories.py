@@ -70,9 +70,9 @@ class TestCategoryList:
 
         conn, cursor = make_mock_connection()
         cursor.fetchall.return_value = [
-            {'id': 1, 'name': 'Food'},
-            {'id': 2, 'name': 'Transport'},
-            {'id': 3, 'name': 'Entertainment'},
+            {'id': 1, 'name': 'Food', 'budget_cents': None, 'spent_cents': 0},
+            {'id': 2, 'name': 'Transport', 'budget_cents': None, 'spent_cents': 0},
+            {'id': 3, 'name': 'Entertainment', 'budget_cents': None, 'spent_cents': 0},
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -90,7 +90,7 @@ class TestAddCategory:
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [{'id': 1, 'name': 'NewCategory'}]
+        cursor.fetchall.return_value = [{'id': 1, 'name': 'NewCategory', 'budget_cents': None, 'spent_cents': 0}]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.post('/categories/', data={
@@ -120,7 +120,7 @@ class TestAddCategory:
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [{'id': 1, 'name': 'Groceries'}]
+        cursor.fetchall.return_value = [{'id': 1, 'name': 'Groceries', 'budget_cents': None, 'spent_cents': 0}]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.post('/categories/', data={
@@ -134,7 +134,7 @@ class TestAddCategory:
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [{'id': 1, 'name': 'Food'}]
+        cursor.fetchall.return_value = [{'id': 1, 'name': 'Food', 'budget_cents': None, 'spent_cents': 0}]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.post('/categories/', data={
@@ -206,7 +206,7 @@ class TestCategoryIsolation:
         login_session(client_no_csrf, user_id=1)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [{'id': 1, 'name': 'User1Category'}]
+        cursor.fetchall.return_value = [{'id': 1, 'name': 'User1Category', 'budget_cents': None, 'spent_cents': 0}]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/categories/')
@@ -215,3 +215,141 @@ class TestCategoryIsolation:
         # Verify user_id filter in query
         calls = cursor.execute.call_args_list
         assert any('user_id' in str(call) for call in calls)
+
+
+class TestCategoryBudgets:
+    """Test per-category budgets."""
+
+    def test_new_category_starts_from_existing_spend(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/categories/', data={'name': 'Food', 'budget': '5000'})
+        sql, params = cursor.execute.call_args_list[0][0]
+        assert 'INSERT IGNORE INTO categories (user_id, name, budget, spent)' in sql
+        assert 'SUM(amount)' in sql
+        assert params == (1, 'Food', '5000', 1, 'Food', 1, 'Food')
+
+    def test_invalid_budget_not_saved(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/categories/budget/3', data={'budget': '-1'})
+        assert response.status_code == 302
+        cursor.execute.assert_not_called()
+
+    def test_set_and_clear_budget(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/categories/budget/3', data={'budget': '250.50'})
+        client_no_csrf.post('/categories/budget/3', data={'budget': ''})
+        params = [c[0][1] for c in cursor.execute.call_args_list]
+        assert params == [('250.50', 3, 1), (None, 3, 1)]
+
+    def test_status_reads_counters_in_one_query(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Food', 'budget_cents': 500000, 'spent_cents': 612550},
+            {'id': 2, 'name': 'Fuel', 'budget_cents': 200000, 'spent_cents': 50000},
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/categories/budgets')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['over'] == ['Food']
+        assert data['budgets'][0] == {
+            'id': 1, 'category': 'Food', 'budget': 500000, 'spent': 612550,
+            'remaining': -112550, 'percent': 122.5, 'over': True,
+        }
+        assert data['budgets'][1]['percent'] == 25.0
+
+        assert cursor.execute.call_count == 1
+        sql = cursor.execute.call_args[0][0]
+        assert 'FROM categories WHERE user_id=%s AND budget IS NOT NULL' in sql
+        assert 'expense' not in sql and 'GROUP BY' not in sql
+
+    def test_status_requires_auth(self, client):
+        response = client.get('/categories/budgets')
+        assert response.status_code == 302
+
+
+class TestCategoryIds:
+    """Test integer category grouping and the category_id backfill."""
+
+    def _db(self):
+        import sqlite3
+        db = sqlite3.connect(':memory:')
+        db.execute("CREATE TABLE categories (id INTEGER PRIMARY KEY, user_id INT, name TEXT)")
+        db.execute("CREATE TABLE expense (user_id INT, category TEXT, category_id INT, amount NUMERIC)")
+        db.executemany("INSERT INTO categories VALUES (?, 1, ?)", [(1, 'Food'), (2, 'Fuel')])
+        db.executemany("INSERT INTO expense VALUES (1, ?, ?, ?)", [
+            ('Food', 1, 10), ('Food', 1, 5), ('Fuel', 2, 40),
+            ('Rent', None, 300), ('Gifts', None, 20), ('Gifts', None, 30),  # not backfilled yet
+        ])
+        return db
+
+    def test_grouped_totals_by_id_with_names(self):
+        from services.categories import grouped
+        db = self._db()
+        sql = grouped("SUM(amount) AS total, COUNT(*) AS count", "FROM expense WHERE user_id=?")
+        rows = db.execute(sql + " ORDER BY total DESC", (1,)).fetchall()
+        assert [(r[0], r[-2], r[-1]) for r in rows] == [
+            ('Rent', 300, 1), ('Gifts', 50, 2), ('Fuel', 40, 1), ('Food', 15, 2),
+        ]
+
+    def test_renamed_category_needs_no_row_rewrites(self):
+        from services.categories import grouped
+        db = self._db()
+        db.execute("UPDATE categories SET name='Groceries' WHERE id=1")
+        rows = db.execute(grouped("SUM(amount) AS total", "FROM expense WHERE user_id=?"), (1,)).fetchall()
+        assert ('Groceries', 15) in [(r[0], r[-1]) for r in rows]
+
+    def test_grouped_extra_keys(self):
+        from services.categories import grouped
+        sql = grouped("SUM(amount) AS total", "FROM expense", keys={"day": "DAY(date)"})
+        assert "DAY(date) AS day, category_id" in sql
+        assert "GROUP BY day, category_id, legacy_name" in sql
+
+    def test_backfill_commits_per_chunk(self):
+        from services import categories
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = (1, 12000)
+        cursor.rowcount = 10
+
+        assert categories.backfill(conn, 'archived_expense', chunk=5000) == 30
+        ranges = [c[0][1] for c in cursor.execute.call_args_list if 'UPDATE archived_expense' in c[0][0]]
+        assert ranges == [(1, 5000), (5001, 10000), (10001, 15000)]
+        # missing categories first, then one commit per chunk
+        assert 'INSERT IGNORE INTO categories' in cursor.execute.call_args_list[0][0][0]
+        assert conn.commit.call_count == 4
+
+    def test_backfill_seeds_budget_counters_from_live_expenses(self):
+        from services import categories
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = (None, None)
+
+        assert categories.backfill(conn, 'expense') == 0
+        assert 'SUM(amount)' in cursor.execute.call_args_list[0][0][0]
+
+    def test_backfill_rejects_other_tables(self):
+        from services import categories
+        conn, _ = make_mock_connection()
+        with pytest.raises(ValueError):
+            categories.backfill(conn, 'users')
+
+    def test_delete_keeps_categories_in_use(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/categories/delete/4')
+        sql, params = cursor.execute.call_args[0]
+        assert 'NOT EXISTS (SELECT 1 FROM expense WHERE user_id=%s AND category_id=%s)' in sql
+        assert params == (4, 1, 1, 4, 1, 4)
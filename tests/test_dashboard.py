@@ -8,6 +8,7 @@ import os
 import sys
 from unittest.mock import MagicMock
 from decimal import Decimal
+from datetime import date
 
 # Ensure the project root is on sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -45,19 +46,23 @@ class TestDashboardAccess:
 
         conn, cursor = make_mock_connection()
         # Mock all the dashboard queries in new order:
-        # 1. settings, 2. manual income, 3. expenses, 4. who_data, 5. category, 6. daily, 7. monthly, 8. recent, 9. count
+        # 1. settings, 2. manual income, 3. expenses, 4. who_data, 5. category, 6. daily, 7. monthly, 8. recent, 9. count,
+        # 10-11. forecast history and current month (only with a monthly limit)
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('8000.00'), 'total_savings': Decimal('2000.00'), 'use_automated_income': 0},  # settings
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('5000.00')},   # expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 500000},   # expenses
             {'cnt': 10},  # expense count
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
-            [{'done_by': 'Self', 'total': Decimal('5000.00')}],  # who data (automated income)
-            [{'category': 'Food', 'total': Decimal('2000.00')}],  # category data
-            [{'day': 'Jan 01', 'total': Decimal('100.00')}],  # daily data
-            [{'mon': 'Jan', 'savings': Decimal('1000.00')}],  # monthly savings
+            [{'done_by': 'Self', 'total_cents': 500000}],  # who data (automated income)
+            [{'category': 'Food', 'total_cents': 200000}],  # category data
+            [{'date': date(2024, 1, 1), 'total': Decimal('100.00')}],  # daily data
+            [{'month': '2024-01', 'savings_cents': 100000}],  # monthly savings
             [],  # recent expenses
+            [],  # forecast: archived history
+            [],  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -75,11 +80,12 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('5000.00'), 'use_automated_income': 0},
-            {'total': Decimal('15000.00')},  # manual income
-            {'total': Decimal('8000.00')},   # expenses
+            {'total_cents': 1500000},  # manual income
+            {'total_cents': 800000},   # expenses
             {'cnt': 20},
+            None,  # forecast: cache versions
         ]
-        cursor.fetchall.side_effect = [[], [], [], [], []]
+        cursor.fetchall.side_effect = [[], [], [], [], [], [], []]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/')
@@ -93,17 +99,20 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('5000.00'), 'use_automated_income': 1},
-            {'total': Decimal('15000.00')},  # manual income (not used)
-            {'total': Decimal('8000.00')},   # expenses
+            {'total_cents': 1500000},  # manual income (not used)
+            {'total_cents': 800000},   # expenses
             {'cnt': 20},
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
-            [{'done_by': 'Person1', 'total': Decimal('4000.00')},
-             {'done_by': 'Person2', 'total': Decimal('4000.00')}],  # automated income = 8000
+            [{'done_by': 'Person1', 'total_cents': 400000},
+             {'done_by': 'Person2', 'total_cents': 400000}],  # automated income = 8000
             [],  # category
             [],  # daily
             [],  # monthly
             [],  # recent
+            [],  # forecast: archived history
+            [],  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -118,11 +127,12 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('8000.00'), 'total_savings': Decimal('1000.00'), 'use_automated_income': 0},
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('6000.00')},   # expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 600000},   # expenses
             {'cnt': 15},
+            None,  # forecast: cache versions
         ]
-        cursor.fetchall.side_effect = [[], [], [], [], []]
+        cursor.fetchall.side_effect = [[], [], [], [], [], [], []]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/')
@@ -136,16 +146,19 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('0.00'), 'use_automated_income': 0},
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('8000.00')},   # expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 800000},   # expenses
             {'cnt': 10},
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
-            [{'done_by': 'Self', 'total': Decimal('8000.00')}],  # automated = 8000
+            [{'done_by': 'Self', 'total_cents': 800000}],  # automated = 8000
             [],
             [],
             [],
             [],
+            [],  # forecast: archived history
+            [],  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -159,8 +172,8 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             None,  # no settings
-            {'total': Decimal('0.00')},  # no manual income
-            {'total': Decimal('0.00')},  # no expenses
+            {'total_cents': 0},  # no manual income
+            {'total_cents': 0},  # no expenses
             {'cnt': 0},
         ]
         cursor.fetchall.side_effect = [[], [], [], [], []]
@@ -177,24 +190,28 @@ class TestDashboardData:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('5000.00'), 'total_savings': Decimal('0.00'), 'use_automated_income': 0},
-            {'total': Decimal('5000.00')},  # manual income
-            {'total': Decimal('1000.00')},  # expenses
+            {'total_cents': 500000},  # manual income
+            {'total_cents': 100000},  # expenses
             {'cnt': 5},
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
-            [{'done_by': 'Self', 'total': Decimal('1000.00')}],  # automated income
+            [{'done_by': 'Self', 'total_cents': 100000}],  # automated income
             [],  # category
             [],  # daily
             [],  # monthly
             [
-                {'id': 1, 'amount': Decimal('100.00'), 'category': 'Food', 'note': 'Lunch', 'date': date(2024, 1, 15)},
-                {'id': 2, 'amount': Decimal('50.00'), 'category': 'Transport', 'note': 'Bus', 'date': date(2024, 1, 14)},
+                {'id': 1, 'amount_cents': 10000, 'category': 'Food', 'note': 'Lunch', 'date': date(2024, 1, 15)},
+                {'id': 2, 'amount_cents': 5005, 'category': 'Transport', 'note': 'Bus', 'date': date(2024, 1, 14)},
             ],
+            [],  # forecast: archived history
+            [],  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/')
         assert response.status_code == 200
+        assert b'Rs. 50.05' in response.data
 
 
 class TestDashboardCharts:
@@ -207,20 +224,23 @@ class TestDashboardCharts:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('0.00'), 'use_automated_income': 0},
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('5000.00')},   # expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 500000},   # expenses
             {'cnt': 10},
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
-            [{'done_by': 'Self', 'total': Decimal('5000.00')}],  # automated income
+            [{'done_by': 'Self', 'total_cents': 500000}],  # automated income
             [
-                {'category': 'Food', 'total': Decimal('2000.00')},
-                {'category': 'Transport', 'total': Decimal('1500.00')},
-                {'category': 'Entertainment', 'total': Decimal('1500.00')},
+                {'category': 'Food', 'total_cents': 200000},
+                {'category': 'Transport', 'total_cents': 150000},
+                {'category': 'Entertainment', 'total_cents': 150000},
             ],
             [],  # daily
             [],  # monthly
             [],  # recent
+            [],  # forecast: archived history
+            [],  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -235,21 +255,393 @@ class TestDashboardCharts:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('0.00'), 'use_automated_income': 0},
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('6000.00')},   # expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 600000},   # expenses
             {'cnt': 15},
+            None,  # forecast: cache versions
         ]
         cursor.fetchall.side_effect = [
             [
-                {'done_by': 'Person1', 'total': Decimal('3000.00')},
-                {'done_by': 'Person2', 'total': Decimal('3000.00')},
+                {'done_by': 'Person1', 'total_cents': 300000},
+                {'done_by': 'Person2', 'total_cents': 300000},
             ],
             [],  # category
             [],  # daily
             [],  # monthly
             [],  # recent
+            [],  # forecast: archived history
+            [],  # forecast: this month
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/')
+        assert response.status_code == 200
+
+
+class TestSavingsSeries:
+    """Test the monthly savings query against a real SQL engine."""
+
+    def _db(self, rows):
+        """In-memory SQLite seeded with `rows` archived incomes and expenses over 12 months."""
+        import sqlite3
+        db = sqlite3.connect(':memory:')
+        db.execute("CREATE TABLE archived_income (user_id INT, amount NUMERIC, month TEXT, month_key INT)")
+        db.execute("CREATE TABLE archived_expense (user_id INT, amount NUMERIC, month TEXT, month_key INT)")
+        db.execute(
+            "CREATE TABLE archive_summary (user_id INT, month_key INT, month TEXT, "
+            "income_total NUMERIC, expense_total NUMERIC)"
+        )
+        months = [(f"2024-{m:02d}", 202400 + m) for m in range(1, 13)]
+        db.executemany(
+            "INSERT INTO archived_income VALUES (1, 10, ?, ?)",
+            (months[n % 12] for n in range(rows))
+        )
+        db.executemany(
+            "INSERT INTO archived_expense VALUES (1, 4, ?, ?)",
+            (months[n % 12] for n in range(rows))
+        )
+        return db
+
+    def _run(self, db):
+        from routes.dashboard import SAVINGS_SERIES_QUERY
+        ops = [0]
+
+        def tick():
+            ops[0] += 1
+            return 0
+
+        db.set_progress_handler(tick, 1000)
+        rows = db.execute(SAVINGS_SERIES_QUERY.replace('%s', '?'), (1,) * 5).fetchall()
+        db.set_progress_handler(None, 0)
+        return rows, ops[0]
+
+    def test_savings_not_inflated_by_join(self):
+        """Each month's savings should be income minus expense, not a cross product."""
+        rows, _ = self._run(self._db(1200))
+        assert len(rows) == 12
+        assert rows[0][0] == '2024-01'
+        # 100 incomes of 10 and 100 expenses of 4 per month, in cents
+        assert all(savings == 60000 for _, savings in rows)
+
+    def test_compacted_months_use_summary(self):
+        """Months moved to cold storage should still appear, in month order."""
+        db = self._db(24)
+        db.execute("DELETE FROM archived_income WHERE month_key=202401")
+        db.execute("DELETE FROM archived_expense WHERE month_key=202401")
+        db.execute("INSERT INTO archive_summary VALUES (1, 202401, '2024-01', 20, 8)")
+        db.execute("INSERT INTO archive_summary VALUES (1, 202312, '2023-12', 100, 30)")
+        rows, _ = self._run(db)
+        assert [month for month, _ in rows[:3]] == ['2023-12', '2024-01', '2024-02']
+        assert [savings for _, savings in rows[:3]] == [7000, 1200, 1200]
+
+    def test_savings_scales_linearly(self):
+        """Doubling a 100k-row seed should roughly double the work, not quadruple it."""
+        _, half = self._run(self._db(50_000))
+        _, full = self._run(self._db(100_000))
+        assert full / half < 2.5
+
+
+class TestExpenseSeries:
+    """Test date-bucketed expense series."""
+
+    def test_days_sort_chronologically_across_months(self):
+        """Jan should come before Apr, and the same day in two months stays separate."""
+        from services.timeseries import bucket
+        rows = [
+            {'date': date(2024, 1, 5), 'total': Decimal('10.00')},
+            {'date': date(2024, 1, 7), 'total': Decimal('5.00')},
+        ]
+        labels, values = bucket(rows, 'day')
+        assert labels == ['Jan 05', 'Jan 06', 'Jan 07']
+        assert values == [10.0, 0.0, 5.0]
+
+    def test_week_buckets_start_on_monday(self):
+        """Weekly buckets should roll days up to their Monday and fill gaps."""
+        from services.timeseries import bucket
+        rows = [
+            {'date': date(2024, 1, 3), 'total': Decimal('10.00')},  # Wed
+            {'date': date(2024, 1, 7), 'total': Decimal('5.00')},   # Sun, same week
+            {'date': date(2024, 1, 22), 'total': Decimal('1.00')},
+        ]
+        labels, values = bucket(rows, 'week')
+        assert labels == ['Jan 01', 'Jan 08', 'Jan 15', 'Jan 22']
+        assert values == [15.0, 0.0, 0.0, 1.0]
+
+    def test_month_buckets_cross_year(self):
+        """Monthly buckets should continue across a year boundary."""
+        from services.timeseries import bucket
+        rows = [
+            {'date': date(2023, 12, 31), 'total': Decimal('2.00')},
+            {'date': date(2024, 2, 1), 'total': Decimal('3.00')},
+        ]
+        labels, values = bucket(rows, 'month')
+        assert labels == ['Dec 2023', 'Jan 2024', 'Feb 2024']
+        assert values == [2.0, 0.0, 3.0]
+
+    def test_days_across_years_carry_the_year(self):
+        from services.timeseries import bucket
+        rows = [
+            {'date': date(2023, 12, 31), 'total': Decimal('1.00')},
+            {'date': date(2024, 1, 1), 'total': Decimal('2.00')},
+        ]
+        labels, _ = bucket(rows, 'day')
+        assert labels == ['Dec 31 2023', 'Jan 01 2024']
+
+    def test_outlier_dates_do_not_explode_the_series(self):
+        """Two expenses centuries apart must not gap-fill millions of buckets."""
+        from services.timeseries import bucket, fit_granularity, MAX_BUCKETS
+        rows = [
+            {'date': date(1, 1, 1), 'total': Decimal('1.00')},
+            {'date': date(2024, 3, 5), 'total': Decimal('2.00')},
+            {'date': date(9999, 12, 31), 'total': Decimal('3.00')},
+        ]
+        granularity = fit_granularity(rows, 'day')
+        assert granularity == 'month'
+        labels, values = bucket(rows, granularity)
+        assert len(labels) == 3
+        assert values == [1.0, 2.0, 3.0]
+        assert len(bucket(rows[1:2] + [{'date': date(2025, 6, 1), 'total': 1}], 'day')[0]) <= MAX_BUCKETS
+
+    def test_long_span_coarsens_to_week(self):
+        from services.timeseries import fit_granularity
+        rows = [{'date': date(2023, 1, 1), 'total': 1}, {'date': date(2024, 6, 1), 'total': 1}]
+        assert fit_granularity(rows, 'day') == 'week'
+        assert fit_granularity(rows, 'month') == 'month'
+
+    def test_invalid_granularity_falls_back_to_day(self):
+        from services.timeseries import parse_granularity
+        assert parse_granularity('week') == 'week'
+        assert parse_granularity('hour') == 'day'
+        assert parse_granularity(None) == 'day'
+
+    def test_dashboard_groups_on_raw_date(self, client_no_csrf, app_no_csrf):
+        """The daily query should group by the indexed date column, not a formatted string."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [
+            None,
+            {'total_cents': 0},
+            {'total_cents': 0},
+            {'cnt': 0},
+        ]
+        cursor.fetchall.side_effect = [[], [], [], [], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/?granularity=month')
+        assert response.status_code == 200
+        assert b'Expenses by Month' in response.data
+        queries = [str(c) for c in cursor.execute.call_args_list]
+        assert any('GROUP BY date' in q for q in queries)
+        assert not any("DATE_FORMAT(date, '%b %d')" in q for q in queries)
+
+
+class TestForecast:
+    """Test the month-end spend forecast."""
+
+    def _rows(self, *rows):
+        return [{'date': d, 'category': c, 'total_cents': t} for d, c, t in rows]
+
+    def _forecast(self, app, fetches, today, limit=100000, user_id=1):
+        from services import forecast
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = fetches
+        with app.app_context():
+            return forecast.month_end(cursor, user_id, today, limit), cursor
+
+    def test_smoothing_matches_stepwise(self):
+        """Folding several days at once should equal smoothing them one by one."""
+        from services.forecast import MonthState, Profile
+        days = [500, 0, 1200, 300, 0, 800]
+        rows = self._rows(*((date(2024, 3, n + 1), 'Food', v) for n, v in enumerate(days) if v))
+        state = MonthState(date(2024, 3, 1), 0.3)
+        state.close_days(rows, date(2024, 3, 6), Profile([]), 31)
+
+        level = 0.0
+        for v in days:
+            level = 0.3 * v + 0.7 * level
+        assert state.level[0] == pytest.approx(level)
+        assert int(state.spent[0]) == 2800
+
+    def test_seasonal_profile_expects_late_rent(self, app_no_csrf):
+        """Rent paid on the 28th in past months should be projected before it is due."""
+        history = [
+            {'month_key': mk, 'day': 28, 'category': 'Rent', 'total_cents': 5000000}
+            for mk in (202401, 202402)
+        ]
+        before, _ = self._forecast(app_no_csrf, [history, []], date(2024, 3, 10), limit=4000000)
+        assert before['spent'] == 0
+        assert before['projected'] > 4000000
+        assert before['over_limit'] is True
+
+        after, _ = self._forecast(app_no_csrf, [history, []], date(2024, 3, 29), limit=4000000, user_id=2)
+        assert after['by_category']['Rent'] < before['by_category']['Rent'] / 10
+
+    def test_later_loads_only_read_open_days(self, app_no_csrf):
+        """A cached state should query from its first unclosed day and match a cold start."""
+        from services import forecast
+        march = self._rows((date(2024, 3, 1), 'Food', 1000), (date(2024, 3, 2), 'Food', 400),
+                           (date(2024, 3, 3), 'Fuel', 2500), (date(2024, 3, 4), 'Food', 700))
+        with app_no_csrf.app_context():
+            cursor = MagicMock()
+            cursor.fetchall.side_effect = [[], march[:3], march[2:]]
+            forecast.month_end(cursor, 1, date(2024, 3, 3))
+            warm = forecast.month_end(cursor, 1, date(2024, 3, 4))
+            assert cursor.execute.call_args_list[-1][0][1] == (1, date(2024, 3, 3))
+
+            cursor.fetchall.side_effect = [[], march]
+            cold = forecast.month_end(cursor, 2, date(2024, 3, 4))
+        assert warm == cold
+        assert warm['spent'] == 4600
+
+    def test_only_past_day_edits_bump_the_version(self):
+        from services import forecast
+        cursor = MagicMock()
+        forecast.expense_changed(cursor, 1, date(2024, 3, 10), today=date(2024, 3, 10))
+        cursor.execute.assert_not_called()
+        forecast.expense_changed(cursor, 1, date(2024, 3, 10), date(2024, 3, 2), today=date(2024, 3, 10))
+        sql, params = cursor.execute.call_args.args
+        assert 'expense_version = expense_version + 1' in sql
+        assert params == (1,)
+
+    def test_other_workers_rebuild_when_versions_move(self, app_no_csrf):
+        """A write handled by another worker shows up as a newer version on the next load."""
+        from services import forecast
+        march = self._rows((date(2024, 3, 1), 'Food', 1000), (date(2024, 3, 9), 'Food', 400))
+        with app_no_csrf.app_context():
+            cursor = MagicMock()
+            cursor.fetchone.return_value = {'archive_version': 0, 'expense_version': 0, 'setting_version': 0}
+            cursor.fetchall.side_effect = [[], march]
+            forecast.month_end(cursor, 1, date(2024, 3, 10))
+
+            # Same versions: only rows from today on are read
+            cursor.fetchall.side_effect = [[]]
+            forecast.month_end(cursor, 1, date(2024, 3, 10))
+            assert cursor.execute.call_args.args[1] == (1, date(2024, 3, 10))
+
+            # An edit to Mar 1 elsewhere: the month is re-read from its first day
+            cursor.fetchone.return_value = {'archive_version': 0, 'expense_version': 1, 'setting_version': 0}
+            cursor.fetchall.side_effect = [march[1:]]
+            edited = forecast.month_end(cursor, 1, date(2024, 3, 10))
+            assert cursor.execute.call_args.args[1] == (1, date(2024, 3, 1))
+            assert edited['spent'] == 400
+
+            # A month archived elsewhere: the seasonal history is re-read too
+            cursor.fetchone.return_value = {'archive_version': 1, 'expense_version': 1, 'setting_version': 0}
+            cursor.fetchall.side_effect = [[], []]
+            forecast.month_end(cursor, 1, date(2024, 3, 10))
+            assert 'archived_expense' in cursor.execute.call_args_list[-2].args[0]
+
+    def test_dashboard_warns_when_on_pace_to_exceed(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        today = date.today()
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [
+            {'monthly_limit': Decimal('100.00'), 'total_savings': Decimal('0.00'), 'use_automated_income': 0},
+            {'total_cents': 0},
+            {'total_cents': 20000},
+            {'cnt': 1},
+            None,  # forecast: cache versions
+        ]
+        cursor.fetchall.side_effect = [
+            [], [], [], [], [],
+            [],  # forecast: archived history
+            self._rows((today, 'Food', 20000)),  # forecast: this month
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/')
         assert response.status_code == 200
+        assert b'On pace for Rs. 200.00' in response.data
+        assert b'fa-triangle-exclamation' in response.data
+
+
+class TestAutomatedIncome:
+    """Test where the dashboard's per-person totals come from."""
+
+    def _get(self, client, app, url):
+        login_session(client)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [None, {'total_cents': 0}, {'total_cents': 0}, {'cnt': 0}]
+        cursor.fetchall.side_effect = [[{'done_by': 'Alex', 'total_cents': 4200}], [], [], [], []]
+        app.db_pool.get_connection.return_value = conn
+        assert client.get(url).status_code == 200
+        return [c[0][0] for c in cursor.execute.call_args_list]
+
+    def test_all_time_uses_running_totals(self, client_no_csrf, app_no_csrf):
+        sql = self._get(client_no_csrf, app_no_csrf, '/')
+        assert any('FROM people WHERE user_id=%s' in s for s in sql)
+        assert not any('GROUP BY person_id' in s or 'GROUP BY done_by' in s for s in sql)
+
+    def test_range_groups_on_person_id(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        # Days before today and today onwards are read separately
+        cursor.fetchone.side_effect = [None, {'total_cents': 0}, None,
+                                       {'total_cents': 0}, {'cnt': 0}, {'total_cents': 0}, {'cnt': 0}]
+        cursor.fetchall.side_effect = [[{'done_by': 'Alex', 'total_cents': 4200}], [], [], [], [], [], [], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+        assert client_no_csrf.get('/?range=30d').status_code == 200
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert any('GROUP BY person_id, legacy_name' in s for s in sql)
+
+
+class TestRangeStats:
+    """Range stats cache the days before today and read the rest."""
+
+    TODAY = date(2024, 3, 10)
+
+    def test_split_around_today(self):
+        from services.daterange import DateRange
+        closed, open_ = DateRange(date(2024, 3, 1), self.TODAY, '30d').split(self.TODAY)
+        assert closed == (date(2024, 3, 1), date(2024, 3, 9), None)
+        assert open_ == (self.TODAY, self.TODAY, None)
+        assert DateRange(date(2024, 3, 1), date(2024, 3, 5), None).split(self.TODAY)[1] is None
+        assert DateRange(self.TODAY, None, None).split(self.TODAY)[0] is None
+        assert DateRange(None, date(2024, 4, 1), None).split(self.TODAY) == (
+            (None, date(2024, 3, 9), None), (self.TODAY, date(2024, 4, 1), None))
+
+    def test_merge_adds_parts(self):
+        from services.rangestats import merge
+        closed = {'total_cents': 700, 'count': 2, 'people': [{'done_by': 'Self', 'total_cents': 700}],
+                  'categories': [{'category': 'Food', 'total_cents': 500}, {'category': 'Fuel', 'total_cents': 200}],
+                  'daily': [{'date': date(2024, 3, 9), 'total': Decimal('7.00')}]}
+        today = {'total_cents': 100, 'count': 1, 'people': [{'done_by': 'Alex', 'total_cents': 100}],
+                 'categories': [{'category': 'Food', 'total_cents': 100}],
+                 'daily': [{'date': self.TODAY, 'total': Decimal('1.00')}]}
+        merged = merge(closed, today)
+        assert merged['total_cents'] == 800 and merged['count'] == 3
+        assert merged['categories'] == [{'category': 'Food', 'total_cents': 600}, {'category': 'Fuel', 'total_cents': 200}]
+        assert [r['done_by'] for r in merged['people']] == ['Self', 'Alex']
+        assert [r['date'] for r in merged['daily']] == [date(2024, 3, 9), self.TODAY]
+        # The cached part is left as it was
+        assert closed['categories'][0]['total_cents'] == 500
+
+    def _load(self, cursor, versions, open_only=False):
+        from services import rangestats
+        from services.daterange import DateRange
+        cursor.fetchone.return_value = {'archive_version': versions[0], 'expense_version': versions[1],
+                                        'setting_version': 0}
+        counts = [{'total_cents': 100}, {'cnt': 1}] * (1 if open_only else 2)
+        cursor.fetchone.side_effect = [cursor.fetchone.return_value] + counts
+        cursor.fetchall.side_effect = [[], [], []] * (1 if open_only else 2)
+        cursor.execute.reset_mock()
+        stats = rangestats.stats(cursor, 1, DateRange(date(2024, 3, 1), self.TODAY, '30d'), today=self.TODAY)
+        return stats, [c.args for c in cursor.execute.call_args_list]
+
+    def test_closed_days_cached_until_versions_move(self, app_no_csrf):
+        with app_no_csrf.app_context():
+            cursor = MagicMock()
+            stats, calls = self._load(cursor, (0, 0))
+            assert stats['total_cents'] == 200 and stats['count'] == 2
+            assert (1, date(2024, 3, 1), date(2024, 3, 9)) in [params for _, params in calls]
+
+            # Same versions: only today's rows are read
+            stats, calls = self._load(cursor, (0, 0), open_only=True)
+            assert stats['total_cents'] == 200
+            assert all(params[1:] in ((), (self.TODAY, self.TODAY)) for _, params in calls)
+
+            # A past-day edit elsewhere: the closed days are read again
+            stats, calls = self._load(cursor, (0, 1))
+            assert (1, date(2024, 3, 1), date(2024, 3, 9)) in [params for _, params in calls]
@@ -6,7 +6,7 @@ Tests cover expense CRUD operations and file attachments.
 import pytest
 import os
 import sys
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from decimal import Decimal
 from datetime import date
 
@@ -51,7 +51,7 @@ class TestExpenseAccess:
             [],  # persons
         ]
         cursor.fetchone.side_effect = [
-            {'total': Decimal('0'), 'count': 0},  # summary
+            {'total_cents': 0, 'count': 0},  # summary
             {'default_done_by': 'Self'},  # default done_by
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -77,7 +77,7 @@ class TestExpenseList:
             [{'done_by': 'Self'}],
         ]
         cursor.fetchone.side_effect = [
-            {'total': Decimal('150.00'), 'count': 2},
+            {'total_cents': 15000, 'count': 2},
             {'default_done_by': 'Self'},
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -97,7 +97,7 @@ class TestExpenseList:
             [{'done_by': 'Self'}],
         ]
         cursor.fetchone.side_effect = [
-            {'total': Decimal('100.00'), 'count': 1},
+            {'total_cents': 10000, 'count': 1},
             {'default_done_by': 'Self'},
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -112,7 +112,7 @@ class TestExpenseList:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [[], [], []]
         cursor.fetchone.side_effect = [
-            {'total': Decimal('0'), 'count': 0},
+            {'total_cents': 0, 'count': 0},
             {'default_done_by': 'Self'},
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -300,6 +300,89 @@ class TestEditExpense:
         assert '/expenses' in response.headers.get('Location', '')
 
 
+class TestBudgetCounters:
+    """Test that expense writes keep category spend counters current."""
+
+    def _counter_updates(self, cursor):
+        return [c[0][1] for c in cursor.execute.call_args_list if 'UPDATE categories SET spent = spent +' in c[0][0]]
+
+    def test_add_increments_category(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/add', data={
+            'amount': '75.50', 'category': 'Food', 'date': '2024-01-15', 'done_by': 'Self',
+        })
+        assert self._counter_updates(cursor) == [('75.50', 1, 'Food')]
+        conn.commit.assert_called_once()
+
+    def test_add_links_category_id(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/add', data={
+            'amount': '9.99', 'category': 'Snacks', 'date': '2024-01-15', 'done_by': 'Self',
+        })
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        created = next(i for i, s in enumerate(sql) if 'INSERT IGNORE INTO categories' in s)
+        inserted = next(i for i, s in enumerate(sql) if 'INSERT INTO expense' in s)
+        assert created < inserted
+        assert '(SELECT id FROM categories WHERE user_id=%s AND name=%s)' in sql[inserted]
+        assert cursor.execute.call_args_list[inserted][0][1][:4] == ('9.99', 'Snacks', 1, 'Snacks')
+
+    def test_edit_within_category_applies_difference(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'id': 1, 'amount': Decimal('100.00'), 'category': 'Food', 'note': None,
+            'date': date(2024, 1, 15), 'attachment': None, 'done_by': 'Self',
+        }
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/edit/1', data={
+            'amount': '150.00', 'category': 'Food', 'date': '2024-01-15', 'done_by': 'Self',
+        })
+        assert self._counter_updates(cursor) == [('50.00', 1, 'Food')]
+
+    def test_edit_across_categories_moves_spend(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'id': 1, 'amount': Decimal('100.00'), 'category': 'Food', 'note': None,
+            'date': date(2024, 1, 15), 'attachment': None, 'done_by': 'Self',
+        }
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/edit/1', data={
+            'amount': '40.00', 'category': 'Fuel', 'date': '2024-01-15', 'done_by': 'Self',
+        })
+        assert self._counter_updates(cursor) == [('-100.00', 1, 'Food'), ('40.00', 1, 'Fuel')]
+
+    def test_delete_decrements_category(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'attachment': None, 'date': date(2024, 1, 15), 'amount': Decimal('12.50'), 'category': 'Food', 'done_by': 'Self',
+        }
+        cursor.rowcount = 1
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/delete/1')
+        assert self._counter_updates(cursor) == [('-12.50', 1, 'Food')]
+
+    def test_delete_of_missing_row_leaves_counters(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        cursor.rowcount = 0
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/delete/1')
+        assert self._counter_updates(cursor) == []
+
+
 class TestDeleteExpense:
     """Test deleting expenses."""
 
@@ -308,6 +391,7 @@ class TestDeleteExpense:
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'attachment': None, 'date': date(2024, 1, 15), 'amount': Decimal('12.50'), 'category': 'Food', 'done_by': 'Self'}
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.post('/expenses/delete/1', follow_redirects=False)
@@ -407,3 +491,530 @@ class TestExpenseCSRF:
         login_session(client)
         response = client.post('/expenses/delete/1')
         assert response.status_code == 400
+
+
+class TestExpenseDateRange:
+    """Test from/to date-range filtering."""
+
+    def test_parse_explicit_range(self):
+        """from/to should parse as inclusive dates and be swapped if reversed."""
+        from services.daterange import parse_range
+        rng = parse_range({'from': '2024-02-10', 'to': '2024-02-01'})
+        assert rng.start == date(2024, 2, 1)
+        assert rng.end == date(2024, 2, 10)
+        assert rng.sql() == (" AND date >= %s AND date <= %s", [date(2024, 2, 1), date(2024, 2, 10)])
+
+    def test_parse_presets(self):
+        """Presets should resolve relative to today."""
+        from services.daterange import parse_range
+        today = date(2024, 3, 14)  # Thursday
+        assert parse_range({'range': 'week'}, today)[:2] == (date(2024, 3, 11), today)
+        assert parse_range({'range': '30d'}, today)[:2] == (date(2024, 2, 14), today)
+        assert parse_range({'range': 'ytd'}, today)[:2] == (date(2024, 1, 1), today)
+
+    def test_invalid_range_is_ignored(self):
+        """Garbage dates should mean no bound rather than an error."""
+        from services.daterange import parse_range
+        rng = parse_range({'from': 'yesterday', 'range': 'forever'})
+        assert not rng.active
+        assert rng.sql() == ("", [])
+
+    def test_month_predicate(self):
+        """Archived months are filtered on their YYYY-MM key."""
+        from services.daterange import parse_range
+        rng = parse_range({'from': '2024-01-15', 'to': '2024-03-02'})
+        assert rng.month_sql() == (" AND month_key >= %s AND month_key <= %s", [202401, 202403])
+
+    def test_expense_list_applies_range(self, client_no_csrf, app_no_csrf):
+        """Every expense read on the page should carry the date bounds."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.side_effect = [[], [], []]
+        cursor.fetchone.side_effect = [
+            {'total_cents': 0, 'count': 0},
+            {'default_done_by': 'Self'},
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/expenses/?from=2024-01-01&to=2024-01-31')
+        assert response.status_code == 200
+
+        expense_calls = [c for c in cursor.execute.call_args_list if 'FROM expense' in c.args[0]]
+        assert len(expense_calls) == 4
+        for call in expense_calls:
+            assert 'date >= %s AND date <= %s' in call.args[0]
+            assert date(2024, 1, 1) in call.args[1]
+
+
+class TestExpenseSearch:
+    """Test full-text search over live and archived expenses."""
+
+    def test_boolean_query_requires_prefix_terms(self):
+        """Each term should be required and prefix-matched."""
+        from services.search import boolean_query
+        assert boolean_query("Dent bill") == "+dent* +bill*"
+
+    def test_boolean_query_strips_operators(self):
+        """User-supplied boolean operators and short tokens are dropped."""
+        from services.search import boolean_query
+        assert boolean_query('-rent +"car" (x)*') == "+rent* +car*"
+        assert boolean_query("a ?") == ""
+
+    def test_search_requires_auth(self, client):
+        response = client.get('/expenses/search?q=dentist')
+        assert response.status_code == 302
+
+    def test_search_empty_query_skips_db(self, client_no_csrf, app_no_csrf):
+        """No query means no database round-trip."""
+        login_session(client_no_csrf)
+        response = client_no_csrf.get('/expenses/search')
+        assert response.status_code == 200
+        app_no_csrf.db_pool.get_connection.assert_not_called()
+
+    def test_search_returns_live_and_archived(self, client_no_csrf, app_no_csrf):
+        """Results from both tables should render with their own detail links."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [
+            {'id': 7, 'amount': Decimal('120.00'), 'category': 'Health', 'note': 'Dentist bill',
+             'date': date(2024, 3, 2), 'done_by': 'Self', 'month': None, 'archived': 0, 'score': 2.1},
+            {'id': 3, 'amount': Decimal('90.00'), 'category': 'Health', 'note': 'Dentist checkup',
+             'date': date(2023, 11, 8), 'done_by': 'Self', 'month': '2023-11', 'archived': 1, 'score': 1.4},
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/expenses/search?q=dent')
+        assert response.status_code == 200
+        assert b'/expenses/view/7' in response.data
+        assert b'/history/expense/3' in response.data
+        assert b'Next' not in response.data
+
+        query, params = cursor.execute.call_args.args
+        assert 'MATCH(category, note) AGAINST' in query
+        assert params[0] == '+dent*'
+        assert params[-2:] == (21, 0)
+        # Archived rows are matched through the unpartitioned FULLTEXT side table
+        assert 'MATCH(t.category, t.note) AGAINST' in query
+        # and read from it alone, so compacted months stay searchable
+        assert 'JOIN archived_expense' not in query
+        assert 'LIKE' not in query
+        assert params[3:6] == ('+dent*', 1, '+dent*')
+
+    def test_end_month_indexes_archived_text(self, client_no_csrf, app_no_csrf):
+        """Archived rows become searchable in the same transaction that archives them."""
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [
+            {'use_automated_income': 0, 'total_savings': Decimal('0.00')},
+            {'total_cents': 0},
+            {'total_cents': 0},
+        ]
+        cursor.fetchall.side_effect = [[], [], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/settings/end-month')
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        indexed = next(i for i, s in enumerate(sql) if 'INSERT IGNORE INTO archived_expense_text' in s)
+        assert indexed < sql.index("DELETE FROM expense WHERE user_id=%s")
+
+    def test_fresh_start_drops_archived_text(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.side_effect = [[], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/settings/fresh-start')
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert "DELETE FROM archived_expense_text WHERE user_id=%s" in sql
+
+    def test_search_pagination(self, client_no_csrf, app_no_csrf):
+        """An extra row past the page size means there is a next page."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [
+            {'id': n, 'amount': Decimal('1.00'), 'category': 'Food', 'note': 'lunch',
+             'date': date(2024, 1, 1), 'done_by': 'Self', 'month': None, 'archived': 0, 'score': 1.0}
+            for n in range(21)
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/expenses/search?q=lunch&page=2')
+        assert response.status_code == 200
+        assert b'Next' in response.data
+        assert b'Previous' in response.data
+        assert cursor.execute.call_args.args[1][-2:] == (21, 20)
+
+
+PNG = b'\x89PNG\r\n\x1a\n'
+JPEG = b'\xff\xd8\xff\xe0'
+
+
+class TestReceiptStore:
+    """Test content-addressed receipt storage."""
+
+    def _upload(self, data, filename):
+        import io
+        from werkzeug.datastructures import FileStorage
+        return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+    def test_store_shards_by_content_hash(self, app_no_csrf, tmp_path):
+        """Receipts should be stored under a sharded SHA-256 path."""
+        import hashlib
+        from services import receipts
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        digest = hashlib.sha256(b'%PDF-scan-1').hexdigest()
+
+        with app_no_csrf.app_context():
+            path = receipts.store(MagicMock(), self._upload(b'%PDF-scan-1', 'receipt.PDF'), 1)
+
+        assert path == f"u1/{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+        assert (tmp_path / path).read_bytes() == b'%PDF-scan-1'
+        assert list((tmp_path / 'tmp').iterdir()) == []
+
+    def test_identical_uploads_are_deduplicated(self, app_no_csrf, tmp_path):
+        """The same bytes under different names should share one file and bump the ref count."""
+        from services import receipts
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        cur = MagicMock()
+
+        with app_no_csrf.app_context():
+            first = receipts.store(cur, self._upload(PNG + b'same', 'a.png'), 1)
+            second = receipts.store(cur, self._upload(PNG + b'same', 'b.png'), 1)
+
+        assert first == second
+        assert len([p for p in tmp_path.rglob('*.png')]) == 1
+        assert 'ref_count = ref_count + 1' in cur.execute.call_args.args[0]
+
+    def test_same_filename_does_not_overwrite(self, app_no_csrf, tmp_path):
+        """Two different scans both named receipt.jpg should both survive."""
+        from services import receipts
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+
+        with app_no_csrf.app_context():
+            first = receipts.store(MagicMock(), self._upload(JPEG + b'one', 'receipt.jpg'), 1)
+            second = receipts.store(MagicMock(), self._upload(JPEG + b'two', 'receipt.jpg'), 1)
+
+        assert first != second
+        assert (tmp_path / first).read_bytes() == JPEG + b'one'
+        assert (tmp_path / second).read_bytes() == JPEG + b'two'
+
+    def test_delete_purges_last_reference(self, client_no_csrf, app_no_csrf, tmp_path):
+        """Deleting the only expense using a receipt should remove the file."""
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        blob = tmp_path / 'u1' / 'ab' / 'cd' / 'abcd.pdf'
+        blob.parent.mkdir(parents=True)
+        blob.write_bytes(b'pdf')
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [{'attachment': 'u1/ab/cd/abcd.pdf', 'date': date(2024, 1, 15), 'amount': Decimal('12.50'), 'category': 'Food', 'done_by': 'Self'}, None]
+        cursor.rowcount = 1
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/expenses/delete/1')
+        assert response.status_code == 302
+        assert not blob.exists()
+
+    def test_delete_keeps_shared_receipt(self, client_no_csrf, app_no_csrf, tmp_path):
+        """A receipt still referenced by another expense should be kept."""
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        blob = tmp_path / 'u1' / 'ab' / 'cd' / 'abcd.pdf'
+        blob.parent.mkdir(parents=True)
+        blob.write_bytes(b'pdf')
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'attachment': 'u1/ab/cd/abcd.pdf', 'date': date(2024, 1, 15), 'amount': Decimal('12.50'), 'category': 'Food', 'done_by': 'Self'}
+        cursor.rowcount = 0
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/delete/1')
+        assert blob.exists()
+
+    def test_purge_keeps_blob_reused_after_release(self, app_no_csrf, tmp_path):
+        """An upload that took a new reference after the release commits keeps the file."""
+        from services import receipts
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        blob = tmp_path / 'u1' / 'ab' / 'cd' / 'abcd.pdf'
+        blob.parent.mkdir(parents=True)
+        blob.write_bytes(b'pdf')
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'ref_count': 1}
+
+        with app_no_csrf.app_context():
+            receipts.purge(conn, 1, 'u1/ab/cd/abcd.pdf')
+        assert blob.exists()
+        assert 'FOR UPDATE' in cursor.execute.call_args.args[0]
+        conn.commit.assert_called_once()
+
+    def test_store_takes_reference_before_checking_blob(self, app_no_csrf, tmp_path):
+        """A concurrent purge must see the new row before the blob is looked up."""
+        from services import receipts, storage
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        cur = MagicMock()
+        order = []
+        cur.execute.side_effect = lambda *a: order.append('insert')
+
+        with app_no_csrf.app_context():
+            real_exists = storage.LocalStorage.exists
+            with patch.object(storage.LocalStorage, 'exists',
+                              lambda self, p: order.append('exists') or real_exists(self, p)):
+                receipts.store(cur, self._upload(b'%PDF-new', 'r.pdf'), 1)
+        assert order == ['insert', 'exists']
+
+    def test_end_month_releases_and_purges_receipts(self, client_no_csrf, app_no_csrf, tmp_path):
+        """Archiving a month drops its receipts' references and purges the orphans."""
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        blob = tmp_path / 'u1' / 'ab' / 'cd' / 'abcd.pdf'
+        blob.parent.mkdir(parents=True)
+        blob.write_bytes(b'pdf')
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [
+            {'use_automated_income': 0, 'total_savings': Decimal('0.00')},
+            {'total_cents': 0},
+            {'total_cents': 1250},
+            None,  # purge: still unreferenced
+        ]
+        cursor.fetchall.side_effect = [[], [], [{'path': 'u1/ab/cd/abcd.pdf'}]]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/settings/end-month')
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        released = next(i for i, s in enumerate(sql) if 'SET r.ref_count = r.ref_count - e.refs' in s)
+        assert released < sql.index("DELETE FROM expense WHERE user_id=%s")
+        assert not blob.exists()
+
+    def test_fresh_start_releases_receipts(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.side_effect = [[], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/settings/fresh-start')
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        released = next(i for i, s in enumerate(sql) if 'SET r.ref_count = r.ref_count - e.refs' in s)
+        assert released < sql.index("DELETE FROM expense WHERE user_id=%s")
+        assert any('DELETE FROM receipt WHERE user_id=%s AND ref_count <= 0' in s for s in sql)
+
+
+class TestStreamingUpload:
+    """Test chunked, magic-byte-checked upload writing."""
+
+    def test_spool_copies_in_chunks_and_hashes(self, tmp_path):
+        """Small chunk sizes should still produce the full file and digest."""
+        import io
+        import hashlib
+        from services.uploads import spool
+        data = b'%PDF-' + bytes(range(256)) * 40
+        sha = hashlib.sha256()
+
+        tmp, size = spool(io.BytesIO(data), str(tmp_path), 'pdf', hasher=sha, chunk_size=1000)
+
+        assert size == len(data)
+        assert open(tmp, 'rb').read() == data
+        assert sha.hexdigest() == hashlib.sha256(data).hexdigest()
+
+    def test_spool_rejects_before_writing(self, tmp_path):
+        """A mismatched header should abort without creating a temp file."""
+        import io
+        from services.uploads import spool, UploadRejected
+        with pytest.raises(UploadRejected):
+            spool(io.BytesIO(b'MZ\x90\x00 not a pdf'), str(tmp_path), 'pdf')
+        assert list(tmp_path.iterdir()) == []
+
+    def test_failed_insert_purges_new_receipt(self, client_no_csrf, app_no_csrf, tmp_path):
+        """A blob stored for an expense that never commits must not be left behind."""
+        import io
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None  # purge: the receipt row was rolled back
+
+        def execute(sql, params=None):
+            if sql.startswith('INSERT INTO expense'):
+                raise RuntimeError('lost connection')
+        cursor.execute.side_effect = execute
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        with pytest.raises(RuntimeError):
+            client_no_csrf.post('/expenses/add', data={
+                'amount': '10.00',
+                'category': 'Food',
+                'date': '2024-01-15',
+                'done_by': 'Self',
+                'attachment': (io.BytesIO(b'%PDF-scan'), 'receipt.pdf'),
+            }, content_type='multipart/form-data')
+
+        conn.rollback.assert_called_once()
+        assert not any(p.is_file() for p in tmp_path.rglob('*'))
+
+    def test_add_expense_rejects_disguised_receipt(self, client_no_csrf, app_no_csrf, tmp_path):
+        """An executable renamed to .jpg should not be stored or inserted."""
+        import io
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/expenses/add', data={
+            'amount': '10.00',
+            'category': 'Food',
+            'date': '2024-01-15',
+            'done_by': 'Self',
+            'attachment': (io.BytesIO(b'MZ\x90\x00'), 'receipt.jpg'),
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 302
+        assert '/expenses/add' in response.headers['Location']
+        assert not any('INSERT INTO expense' in str(c) for c in cursor.execute.call_args_list)
+        assert not any(p.is_file() for p in tmp_path.rglob('*'))
+
+
+class TestReceiptThumbnails:
+    """Test thumbnail rendering and serving."""
+
+    def _png(self, path, size=(1200, 900)):
+        from PIL import Image
+        Image.new('RGB', size, (200, 30, 30)).save(path, format='PNG')
+
+    def test_render_image_thumbnail(self, tmp_path):
+        """Large images should be downscaled to fit the thumbnail box."""
+        from PIL import Image
+        from services.thumbnails import render
+        src, dest = tmp_path / 'r.png', tmp_path / 'r.png.thumb.webp'
+        self._png(src)
+
+        assert render(str(src), str(dest), size=320, fmt='webp') is True
+        with Image.open(dest) as thumb:
+            assert thumb.format == 'WEBP'
+            assert max(thumb.size) == 320
+
+    def test_render_pdf_first_page(self, tmp_path):
+        """PDFs should get a preview of their first page."""
+        fitz = pytest.importorskip('fitz')
+        from PIL import Image
+        from services.thumbnails import render
+        src, dest = tmp_path / 'r.pdf', tmp_path / 'r.pdf.thumb.webp'
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), 'Dentist bill')
+        doc.new_page()
+        doc.save(str(src))
+
+        assert render(str(src), str(dest)) is True
+        with Image.open(dest) as thumb:
+            assert max(thumb.size) <= 320
+
+    def test_render_in_process_pool(self, tmp_path):
+        """The pool path should produce the same file as inline rendering."""
+        from services.storage import storage_config
+        from services.thumbnails import Thumbnailer
+        self._png(tmp_path / 'r.png')
+        cfg = storage_config({'RECEIPT_FOLDER': str(tmp_path)})
+
+        pool = Thumbnailer(workers=1)
+        try:
+            assert pool.submit(cfg, 'r.png', 'r.png.thumb.webp').result(timeout=30) is True
+        finally:
+            pool.shutdown()
+        assert (tmp_path / 'r.png.thumb.webp').exists()
+
+    def test_thumbnail_route_serves_cached_preview(self, client_no_csrf, app_no_csrf, tmp_path):
+        """The route should render on first hit and serve an immutable preview."""
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        rel = f"u1/ab/ab/{'ab' * 32}.png"
+        (tmp_path / rel).parent.mkdir(parents=True)
+        self._png(tmp_path / rel)
+
+        response = client_no_csrf.get(f'/uploads/thumbs/{rel}')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/webp'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert (tmp_path / f'{rel}.thumb.webp').exists()
+
+    def test_thumbnail_route_unsupported_type(self, client_no_csrf, app_no_csrf, tmp_path):
+        login_session(client_no_csrf)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        (tmp_path / 'user1_notes.doc').write_bytes(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')
+
+        response = client_no_csrf.get('/uploads/thumbs/user1_notes.doc')
+        assert response.status_code == 404
+
+    def test_thumbnail_route_checks_owner(self, client_no_csrf, app_no_csrf, tmp_path):
+        login_session(client_no_csrf, user_id=1)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        self._png(tmp_path / 'user2_r.png')
+
+        response = client_no_csrf.get('/uploads/thumbs/user2_r.png')
+        assert response.status_code == 404
+
+
+class TestObjectStorage:
+    """Test receipts stored in an S3-compatible bucket."""
+
+    def _upload(self, data, filename):
+        import io
+        from werkzeug.datastructures import FileStorage
+        return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+    def test_store_writes_to_bucket_once(self, app_no_csrf, s3_bucket):
+        """Identical uploads should land in the bucket under one key."""
+        from services import receipts
+
+        with app_no_csrf.app_context():
+            first = receipts.store(MagicMock(), self._upload(b'%PDF-scan', 'a.pdf'), 1)
+            second = receipts.store(MagicMock(), self._upload(b'%PDF-scan', 'b.pdf'), 1)
+
+        assert first == second
+        listing = s3_bucket.list_objects_v2(Bucket='test-uploads')['Contents']
+        assert [obj['Key'] for obj in listing] == [f'receipts/{first}']
+        obj = s3_bucket.get_object(Bucket='test-uploads', Key=f'receipts/{first}')
+        assert obj['Body'].read() == b'%PDF-scan'
+        assert obj['ContentType'] == 'application/pdf'
+
+    def test_large_upload_uses_parallel_multipart(self, app_no_csrf, s3_bucket, tmp_path):
+        """Files above the threshold should be sent as several parts."""
+        from services import storage
+        app_no_csrf.config.update(S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024)
+        src = tmp_path / 'big.pdf'
+        src.write_bytes(b'%PDF-' + os.urandom(11 * 1024 * 1024))
+
+        with app_no_csrf.app_context():
+            store = storage.get_storage('receipts')
+            store.put_file(str(src), 'u1/big.pdf')
+
+        head = s3_bucket.head_object(Bucket='test-uploads', Key='receipts/u1/big.pdf')
+        assert head['ContentLength'] == 11 * 1024 * 1024 + 5
+        assert head['ETag'].strip('"').endswith('-3')
+        assert not src.exists()
+
+    def test_delete_purges_from_bucket(self, client_no_csrf, app_no_csrf, s3_bucket):
+        login_session(client_no_csrf)
+        s3_bucket.put_object(Bucket='test-uploads', Key='receipts/u1/ab/cd/abcd.pdf', Body=b'%PDF-')
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [{'attachment': 'u1/ab/cd/abcd.pdf', 'date': date(2024, 1, 15), 'amount': Decimal('12.50'), 'category': 'Food', 'done_by': 'Self'}, None]
+        cursor.rowcount = 1
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/expenses/delete/1')
+        assert 'Contents' not in s3_bucket.list_objects_v2(Bucket='test-uploads')
+
+    def test_thumbnail_rendered_into_bucket(self, client_no_csrf, app_no_csrf, s3_bucket):
+        """Thumbnails of stored receipts should be written back to the bucket."""
+        import io
+        from PIL import Image
+        login_session(client_no_csrf)
+        rel = f"u1/ab/ab/{'ab' * 32}.png"
+        png = io.BytesIO()
+        Image.new('RGB', (800, 600)).save(png, format='PNG')
+        s3_bucket.put_object(Bucket='test-uploads', Key=f'receipts/{rel}', Body=png.getvalue())
+
+        response = client_no_csrf.get(f'/uploads/thumbs/{rel}')
+        assert response.status_code == 302
+        thumb = s3_bucket.get_object(Bucket='test-uploads', Key=f'receipts/{rel}.thumb.webp')
+        assert thumb['ContentType'] == 'image/webp'
@@ -73,10 +73,10 @@ class TestHistoryList:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [
             [{'month': '2024-01'}, {'month': '2023-12'}],  # available months
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')}],  # archived income
-            [{'done_by': 'Self', 'total': Decimal('5000.00')}],  # actual income
-            [{'id': 1, 'amount': Decimal('1000.00'), 'category': 'Food', 'note': 'Test', 'date': date(2024, 1, 15), 'done_by': 'Self'}],  # expenses
-            [{'category': 'Food', 'total': Decimal('1000.00'), 'count': 1}],  # category breakdown
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1000000}],  # archived income
+            [{'done_by': 'Self', 'total_cents': 500000}],  # actual income
+            [{'id': 1, 'amount_cents': 100000, 'category': 'Food', 'note': 'Test', 'date': date(2024, 1, 15), 'done_by': 'Self'}],  # expenses
+            [{'category': 'Food', 'total_cents': 100000, 'count': 1}],  # category breakdown
         ]
         cursor.fetchone.return_value = {'total': Decimal('5000.00')}  # total expenses
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -92,8 +92,8 @@ class TestHistoryList:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [
             [{'month': '2024-01'}],
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('15000.00')}],  # expected income
-            [{'done_by': 'Self', 'total': Decimal('8000.00')}],  # actual income
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1500000}],  # expected income
+            [{'done_by': 'Self', 'total_cents': 800000}],  # actual income
             [],  # expenses
             [],  # category breakdown
         ]
@@ -110,10 +110,10 @@ class TestHistoryList:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [
             [{'month': '2024-01'}],
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('15000.00')}],
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1500000}],
             [
-                {'done_by': 'Person1', 'total': Decimal('4000.00')},
-                {'done_by': 'Person2', 'total': Decimal('4000.00')},
+                {'done_by': 'Person1', 'total_cents': 400000},
+                {'done_by': 'Person2', 'total_cents': 400000},
             ],  # actual income = 8000
             [],
             [],
@@ -131,8 +131,8 @@ class TestHistoryList:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [
             [{'month': '2024-01'}],
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')}],  # expected = 10000
-            [{'done_by': 'Self', 'total': Decimal('7000.00')}],  # actual = 7000
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1000000}],  # expected = 10000
+            [{'done_by': 'Self', 'total_cents': 700000}],  # actual = 7000
             [],
             [],
         ]
@@ -152,8 +152,8 @@ class TestHistoryList:
             [{'month': '2024-01'}],
             [],
             [],
-            [{'id': 1, 'amount': Decimal('500.00'), 'category': 'Food', 'note': 'Test', 'date': date(2024, 1, 15), 'done_by': 'Self'}],
-            [{'category': 'Food', 'total': Decimal('500.00'), 'count': 1}],
+            [{'id': 1, 'amount_cents': 50000, 'category': 'Food', 'note': 'Test', 'date': date(2024, 1, 15), 'done_by': 'Self'}],
+            [{'category': 'Food', 'total_cents': 50000, 'count': 1}],
         ]
         cursor.fetchone.return_value = {'total': Decimal('500.00')}
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -204,12 +204,31 @@ class TestHistoryCompare:
         assert response.status_code == 302
         assert '/auth/login' in response.headers.get('Location', '')
 
+    def _archive(self, cursor, months):
+        """Mock the month list followed by the analytics load of the whole archive."""
+        cursor.fetchall.side_effect = [
+            [{'month_key': int(m.replace('-', '')), 'month': m} for m in months],
+            [   # archived income
+                {'month_key': 202401, 'source': 'Salary', 'cents': 1000000},
+                {'month_key': 202312, 'source': 'Salary', 'cents': 800000},
+                {'month_key': 202311, 'source': 'Salary', 'cents': 800000},
+            ],
+            [   # archived expenses
+                {'month_key': 202401, 'category': 'Food', 'done_by': 'Self', 'cents': 200000},
+                {'month_key': 202401, 'category': 'Rent', 'done_by': 'Self', 'cents': 300000},
+                {'month_key': 202312, 'category': 'Rent', 'done_by': 'Self', 'cents': 300000},
+                {'month_key': 202312, 'category': 'Travel', 'done_by': 'Self', 'cents': 100000},
+                {'month_key': 202311, 'category': 'Rent', 'done_by': 'Self', 'cents': 300000},
+            ],
+            [],  # no compacted months
+        ]
+
     def test_compare_page_renders(self, client_no_csrf, app_no_csrf):
         """Compare page should render."""
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [{'month': '2024-01'}, {'month': '2023-12'}]
+        self._archive(cursor, ['2024-01', '2023-12'])
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/history/compare')
@@ -220,44 +239,103 @@ class TestHistoryCompare:
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        # The compare route makes multiple queries - need to mock all of them
-        cursor.fetchall.side_effect = [
-            [{'month': '2024-01'}, {'month': '2023-12'}],  # available months
-            [{'month': '2024-01', 'total': Decimal('10000.00')}, {'month': '2023-12', 'total': Decimal('8000.00')}],  # income totals
-            [{'month': '2024-01', 'total': Decimal('5000.00')}, {'month': '2023-12', 'total': Decimal('4000.00')}],  # expense totals
-            [{'category': 'Food', 'month': '2024-01', 'total': Decimal('2000.00')}],  # category breakdown
-            [{'source': 'Salary', 'month': '2024-01', 'total': Decimal('10000.00')}],  # income sources
-        ]
-        cursor.fetchone.side_effect = [
-            {'total': Decimal('10000.00')},  # trend income
-            {'total': Decimal('5000.00')},   # trend expenses
-            {'total': Decimal('8000.00')},   # trend income
-            {'total': Decimal('4000.00')},   # trend expenses
-        ]
+        self._archive(cursor, ['2024-01', '2023-12'])
         app_no_csrf.db_pool.get_connection.return_value = conn
 
-        response = client_no_csrf.get('/history/compare?m1=2024-01&m2=2023-12')
+        response = client_no_csrf.get('/history/compare?m1=2023-12&m2=2024-01')
         assert response.status_code == 200
+        assert b'Highest increase: <strong>Food</strong>' in response.data
+        assert b'Biggest saving: <strong>Travel</strong>' in response.data
 
     def test_compare_shows_trend(self, client_no_csrf, app_no_csrf):
         """Compare should show trend data across all months."""
         login_session(client_no_csrf)
 
         conn, cursor = make_mock_connection()
-        cursor.fetchall.return_value = [
-            {'month': '2024-01'},
-            {'month': '2023-12'},
-            {'month': '2023-11'},
-        ]
-        cursor.fetchone.side_effect = [
-            {'total': Decimal('10000.00')}, {'total': Decimal('5000.00')},
-            {'total': Decimal('9000.00')}, {'total': Decimal('4500.00')},
-            {'total': Decimal('8000.00')}, {'total': Decimal('4000.00')},
-        ]
+        self._archive(cursor, ['2024-01', '2023-12', '2023-11'])
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/history/compare')
         assert response.status_code == 200
+        assert b'"net": 5000.0' in response.data
+        # The whole archive is loaded in a fixed number of queries
+        assert cursor.execute.call_count == 5
+
+    def test_compare_reuses_loaded_archive(self, client_no_csrf, app_no_csrf):
+        """A second visit should only query the month list and the archive version."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        self._archive(cursor, ['2024-01', '2023-12'])
+        app_no_csrf.db_pool.get_connection.return_value = conn
+        client_no_csrf.get('/history/compare')
+
+        cursor.fetchall.side_effect = [[{'month_key': 202401, 'month': '2024-01'}]]
+        cursor.execute.reset_mock()
+        assert client_no_csrf.get('/history/compare?m1=2024-01&m2=2023-12').status_code == 200
+        assert cursor.execute.call_count == 2
+        assert 'FROM cache_version' in cursor.execute.call_args.args[0]
+
+    def test_compare_reloads_after_archive_version_moves(self, client_no_csrf, app_no_csrf):
+        """Another worker archiving a month must not leave this one on the old columns."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        self._archive(cursor, ['2024-01', '2023-12'])
+        app_no_csrf.db_pool.get_connection.return_value = conn
+        client_no_csrf.get('/history/compare')
+
+        cursor.fetchone.return_value = {'archive_version': 1, 'expense_version': 0, 'setting_version': 0}
+        self._archive(cursor, ['2024-01', '2023-12'])
+        cursor.execute.reset_mock()
+        assert client_no_csrf.get('/history/compare').status_code == 200
+        assert cursor.execute.call_count == 5
+
+
+class TestAnalytics:
+    """Test the columnar month x category engine."""
+
+    def _cols(self):
+        from services.analytics import ArchiveColumns
+        incomes = [(202401, 'Salary', 10010), (202402, 'Salary', 10000), (202402, 'Bonus', 20)]
+        expenses = [(202401, 'Food', 'Alex', 10), (202401, 'Food', 'Sam', 20), (202402, 'Rent', 'Alex', 5000)]
+        return ArchiveColumns(incomes, expenses)
+
+    def test_pivots_are_exact_cents(self):
+        cols = self._cols()
+        assert cols.month_keys == [202401, 202402]
+        assert cols.categories == ['Food', 'Rent']
+        assert cols.expense_pivot().tolist() == [[30, 0], [0, 5000]]
+        assert cols.income_pivot().tolist() == [[0, 10010], [20, 10000]]
+        assert cols.person_pivot().tolist() == [[10, 20], [5000, 0]]
+
+    def test_trend_fills_months_without_rows(self):
+        from services.analytics import trend
+        rows = trend(self._cols(), [202402, 202312, 202401])
+        assert [r['month'] for r in rows] == ['2023-12', '2024-01', '2024-02']
+        assert rows[0] == {"month": '2023-12', "income": 0.0, "expense": 0.0, "net": 0.0, "savings_rate": 0.0}
+        assert rows[1]['expense'] == 0.3 and rows[1]['net'] == 99.8
+        assert rows[2]['savings_rate'] == 50.1
+
+    def test_comparison(self):
+        from services.analytics import comparison
+        result = comparison(self._cols(), '2024-01', '2024-02')
+        assert result['categories'] == {'Food': {'2024-01': 0.3}, 'Rent': {'2024-02': 50.0}}
+        assert result['category_deltas'] == {'Food': -0.3, 'Rent': 50.0}
+        assert result['income_sources'] == {'Bonus': {'2024-02': 0.2}, 'Salary': {'2024-01': 100.1, '2024-02': 100.0}}
+        assert result['net'] == {'2024-01': 99.8, '2024-02': 50.2}
+
+    def test_matches_sql_path(self):
+        """The columnar trend should agree with the per-month SUM queries."""
+        from services import analytics
+        db, keys = analytics._synthetic_db(months=6, rows_per_month=20)
+        expected = analytics._sql_path(db, keys, keys[0], keys[1])
+        rows = analytics.trend(analytics.ArchiveColumns(*analytics._synthetic_rows(db)), keys)
+        for row, (_, inc, exp) in zip(rows, expected):
+            assert row['income'] == pytest.approx(inc)
+            assert row['expense'] == pytest.approx(exp)
 
 
 class TestHistorySavingsCalculation:
@@ -270,7 +348,7 @@ class TestHistorySavingsCalculation:
         conn, cursor = make_mock_connection()
         cursor.fetchall.side_effect = [
             [{'month': '2024-01'}],
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')}],  # income = 10000
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1000000}],  # income = 10000
             [],
             [],
             [],
@@ -299,3 +377,238 @@ class TestHistorySavingsCalculation:
 
         response = client_no_csrf.get('/history/?month=2024-01')
         assert response.status_code == 200  # Should not crash
+
+
+class TestHistoryDateRange:
+    """Test month-granular range filtering of archives."""
+
+    def test_history_months_filtered_by_range(self, client_no_csrf, app_no_csrf):
+        """A date range should restrict the archived months listed."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/history/?from=2024-01-01&to=2024-06-30')
+        assert response.status_code == 200
+
+        query, params = cursor.execute.call_args_list[0].args
+        assert query.count('month_key >= %s AND month_key <= %s') == 3
+        assert params == (1, 202401, 202406) * 3
+
+
+class TestReplicaRouting:
+    """Test read-only history pages going to the read replica."""
+
+    def _pools(self, app):
+        primary, primary_cursor = make_mock_connection()
+        primary_cursor.fetchone.return_value = None
+        replica, replica_cursor = make_mock_connection()
+        replica_cursor.fetchall.return_value = []
+        app.db_pool.get_connection.return_value = primary
+        app.db_replica_pool = MagicMock()
+        app.db_replica_pool.get_connection.return_value = replica
+        return app.db_pool, app.db_replica_pool
+
+    def test_read_only_page_uses_replica(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        primary, replica = self._pools(app_no_csrf)
+
+        assert client_no_csrf.get('/history/').status_code == 200
+        replica.get_connection.assert_called_once()
+        primary.get_connection.assert_not_called()
+
+    def test_recent_write_sticks_to_primary(self, client_no_csrf, app_no_csrf):
+        """Right after a write the user must read their own data from the primary."""
+        import time
+        login_session(client_no_csrf)
+        primary, replica = self._pools(app_no_csrf)
+        with client_no_csrf.session_transaction() as sess:
+            sess['db_wrote_at'] = time.time()
+
+        client_no_csrf.get('/history/')
+        replica.get_connection.assert_not_called()
+        primary.get_connection.assert_called()
+
+        with client_no_csrf.session_transaction() as sess:
+            sess['db_wrote_at'] = time.time() - app_no_csrf.config.get('REPLICA_STICKY_SECONDS', 5) - 1
+        client_no_csrf.get('/history/')
+        replica.get_connection.assert_called_once()
+
+    def test_post_marks_session_as_written(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        self._pools(app_no_csrf)
+
+        client_no_csrf.post('/expenses/delete/1')
+        with client_no_csrf.session_transaction() as sess:
+            assert 'db_wrote_at' in sess
+
+    def test_per_query_marker(self, app_no_csrf):
+        from services import db
+        primary, replica = self._pools(app_no_csrf)
+
+        with app_no_csrf.test_request_context('/'):
+            db.get_connection(read_only=True)
+            db.get_connection()
+        replica.get_connection.assert_called_once()
+        primary.get_connection.assert_called_once()
+
+    def test_without_replica_reads_use_primary(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        assert client_no_csrf.get('/history/').status_code == 200
+        app_no_csrf.db_pool.get_connection.assert_called()
+
+
+class TestArchiveMonthKey:
+    """Test integer month keys and year partitions of the archive tables."""
+
+    def test_month_key_round_trip(self):
+        from services.archive import key_for, month_key, month_label
+        assert month_key('2024-05') == 202405
+        assert month_label(202405) == '2024-05'
+        assert key_for(date(2024, 12, 31)) == 202412
+        assert month_key('2024-13') is None
+        assert month_key('May 2024') is None
+        assert month_key(None) is None
+
+    def test_selected_month_filters_on_key(self, client_no_csrf, app_no_csrf):
+        """Month filters must hit month_key so MySQL can prune partitions."""
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = []
+        cursor.fetchone.return_value = {'total': Decimal('0')}
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.get('/history/?month=2024-03')
+
+        month_queries = [c.args for c in cursor.execute.call_args_list[1:]]
+        assert month_queries
+        for query, params in month_queries:
+            assert 'month_key=%s' in query and 'month=%s' not in query
+            assert params[0] == 202403
+
+    def test_partition_sql(self):
+        from services.archive import add_partition_sql, partition_sql
+        sql = partition_sql('archived_expense', 2024, 2025)
+        assert 'PARTITION BY RANGE (month_key)' in sql
+        assert 'PARTITION p2024 VALUES LESS THAN (202500)' in sql
+        assert 'PARTITION p2025 VALUES LESS THAN (202600)' in sql
+        assert sql.rstrip(')').endswith('PARTITION pmax VALUES LESS THAN MAXVALUE\n')
+        assert add_partition_sql('archived_income', 2027) == (
+            "ALTER TABLE archived_income REORGANIZE PARTITION pmax INTO ("
+            "PARTITION p2027 VALUES LESS THAN (202800), PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        )
+
+
+class TestColdStorage:
+    """Test compacting old archive months into cold files."""
+
+    MONTH_ROWS = (
+        [{'id': 1, 'source': 'Salary', 'amount': Decimal('3000.00')}],
+        [
+            {'id': 7, 'amount': Decimal('12.34'), 'category': 'Food', 'note': 'Lunch',
+             'date': date(2022, 3, 9), 'done_by': 'Alex'},
+            {'id': 5, 'amount': Decimal('800.00'), 'category': 'Rent', 'note': None,
+             'date': date(2022, 3, 1), 'done_by': 'Sam'},
+        ],
+    )
+
+    def _write(self, path, month_key=202203):
+        from services import coldstore
+        coldstore.write_file(str(path), {month_key: coldstore._encode_month(*self.MONTH_ROWS)})
+
+    def test_file_round_trip(self, tmp_path):
+        from services import coldstore
+        path = tmp_path / '2022.cold'
+        self._write(path)
+
+        data = coldstore.read_month(str(path), 202203)
+        assert data['income'] == self.MONTH_ROWS[0]
+        assert data['expense'] == self.MONTH_ROWS[1]
+        assert coldstore.read_month(str(path), 202204) is None
+        assert list(coldstore.read_blocks(str(path))) == [202203]
+
+    def test_cutoff_key(self):
+        from services.coldstore import cutoff_key
+        assert cutoff_key(date(2026, 10, 19), 24) == 202410
+        assert cutoff_key(date(2026, 1, 5), 1) == 202512
+        assert cutoff_key(date(2026, 1, 5), 13) == 202412
+
+    def test_month_cache_evicts_least_recent(self):
+        from services.coldstore import MonthCache
+        cache = MonthCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+    def test_compact_writes_file_then_moves_rows(self, tmp_path):
+        from services import coldstore
+        from services.storage import LocalStorage
+        store = LocalStorage(str(tmp_path))
+        self._write(tmp_path / 'previous.cold', month_key=202201)
+        store.put_file(str(tmp_path / 'previous.cold'), coldstore.file_key(1, 2022))
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.side_effect = list(self.MONTH_ROWS)
+        coldstore.compact_user_year(conn, store, 1, 2022, [202203])
+
+        path = store.local_path('u1/2022.cold')
+        assert sorted(coldstore.read_blocks(path)) == [202201, 202203]
+        assert coldstore.read_month(path, 202203)['expense'] == self.MONTH_ROWS[1]
+
+        assert 'ON DUPLICATE KEY UPDATE' in cursor.executemany.call_args.args[0]
+        summary = cursor.executemany.call_args.args[1]
+        assert summary == [(1, 202203, '2022-03', Decimal('3000.00'), Decimal('812.34'), 1, 2, 'u1/2022.cold')]
+        deletes = [c.args[0] for c in cursor.execute.call_args_list if c.args[0].startswith('DELETE')]
+        assert len(deletes) == 2
+        assert not any('archived_expense_text' in d for d in deletes)
+        sql = [c.args[0] for c in cursor.execute.call_args_list]
+        assert any('INSERT IGNORE INTO archived_expense_text' in s for s in sql)
+        conn.commit.assert_called_once()
+        assert not os.listdir(store.tmp_dir())
+
+    def _cold_month(self, app, tmp_path):
+        app.config['ARCHIVE_FOLDER'] = str(tmp_path)
+        (tmp_path / 'u1').mkdir()
+        self._write(tmp_path / 'u1' / '2022.cold')
+
+    def test_history_reads_compacted_month(self, client_no_csrf, app_no_csrf, tmp_path):
+        login_session(client_no_csrf)
+        self._cold_month(app_no_csrf, tmp_path)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [{'month_key': 202203, 'month': '2022-03', 'file_key': 'u1/2022.cold'}]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/history/?month=2022-03')
+        assert response.status_code == 200
+        assert b'Lunch' in response.data
+        assert b'812.34' in response.data
+        # Only the month list touched the database
+        assert cursor.execute.call_count == 1
+
+        # Hot months are served from the cache, not the file
+        os.remove(tmp_path / 'u1' / '2022.cold')
+        response = client_no_csrf.get('/history/?month=2022-03&category=Rent')
+        assert response.status_code == 200
+        assert b'Lunch' not in response.data
+
+    def test_view_compacted_expense(self, client_no_csrf, app_no_csrf, tmp_path):
+        login_session(client_no_csrf)
+        self._cold_month(app_no_csrf, tmp_path)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [None, {'month_key': 202203, 'file_key': 'u1/2022.cold'}]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/history/expense/7?month=2022-03')
+        assert response.status_code == 200
+        assert b'Lunch' in response.data
+        query, params = cursor.execute.call_args_list[0].args
+        assert 'month_key=%s' in query and params == (7, 1, 202203)
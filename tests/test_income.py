@@ -47,8 +47,8 @@ class TestIncomeAccess:
         # Query order: 1. settings, 2. manual income, 3. automated income
         cursor.fetchone.return_value = {'use_automated_income': 0}  # settings
         cursor.fetchall.side_effect = [
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('5000.00')}],  # manual income
-            [{'done_by': 'Self', 'total': Decimal('3000.00')}],  # automated income
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 500000}],  # manual income
+            [{'done_by': 'Self', 'total_cents': 300000}],  # automated income
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -67,10 +67,10 @@ class TestIncomeList:
         cursor.fetchone.return_value = {'use_automated_income': 0}  # manual mode
         cursor.fetchall.side_effect = [
             [
-                {'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')},
-                {'id': 2, 'source': 'Freelance', 'amount': Decimal('5000.00')},
+                {'id': 1, 'source': 'Salary', 'amount_cents': 1000000},
+                {'id': 2, 'source': 'Freelance', 'amount_cents': 500000},
             ],
-            [{'done_by': 'Self', 'total': Decimal('8000.00')}],
+            [{'done_by': 'Self', 'total_cents': 800000}],
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -86,10 +86,10 @@ class TestIncomeList:
         conn, cursor = make_mock_connection()
         cursor.fetchone.return_value = {'use_automated_income': 1}  # automated mode
         cursor.fetchall.side_effect = [
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')}],
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1000000}],
             [
-                {'done_by': 'Person1', 'total': Decimal('4000.00')},
-                {'done_by': 'Person2', 'total': Decimal('3000.00')},
+                {'done_by': 'Person1', 'total_cents': 400000},
+                {'done_by': 'Person2', 'total_cents': 300000},
             ],
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
@@ -104,8 +104,8 @@ class TestIncomeList:
         conn, cursor = make_mock_connection()
         cursor.fetchone.return_value = {'use_automated_income': 0}
         cursor.fetchall.side_effect = [
-            [{'id': 1, 'source': 'Salary', 'amount': Decimal('10000.00')}],  # manual = 10000
-            [{'done_by': 'Self', 'total': Decimal('7000.00')}],  # automated = 7000
+            [{'id': 1, 'source': 'Salary', 'amount_cents': 1000000}],  # manual = 10000
+            [{'done_by': 'Self', 'total_cents': 700000}],  # automated = 7000
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -333,3 +333,129 @@ class TestIncomeCSRF:
         login_session(client)
         response = client.post('/income/delete/1')
         assert response.status_code == 400
+
+
+class TestMoney:
+    """Test integer-cents money helpers."""
+
+    def test_to_cents(self):
+        from services.money import from_cents, to_cents
+        assert to_cents(Decimal('12.34')) == 1234
+        assert to_cents('0.1') == 10
+        assert to_cents(0.29) == 29
+        assert to_cents(Decimal('1.005')) == 101
+        assert to_cents(None) == 0
+        assert from_cents(-1234) == Decimal('-12.34')
+
+    def test_totals_are_exact(self):
+        from services.money import sum_column
+        rows = [{'amount_cents': 10}, {'amount_cents': 20}] * 1000
+        assert sum_column(rows, 'amount_cents') == 30000
+        assert sum(float(Decimal('0.10')) + float(Decimal('0.20')) for _ in range(1000)) != 300
+
+    def test_grouping(self):
+        from services.money import group_sum, percent, totals_by
+        rows = [{'who': 'A', 'c': 5}, {'who': 'B', 'c': 7}, {'who': 'A', 'c': 1}]
+        assert group_sum(rows, 'who', 'c') == {'A': 6, 'B': 7}
+        assert totals_by(rows[:2], 'who', 'c') == {'A': 5, 'B': 7}
+        assert percent(1, 3) == 33.3
+        assert percent(1, 0) == 0
+
+    def test_filters(self, app):
+        env = app.jinja_env
+        assert env.from_string("{{ 123456 | money }}").render() == "1234.56"
+        assert env.from_string("{{ -5 | money }}").render() == "-0.05"
+        assert env.from_string("{{ [150, 2] | map('units') | list | tojson }}").render() == "[1.5, 0.02]"
+
+    def test_income_page_renders_cents(self, client_no_csrf, app_no_csrf):
+        """Totals should be summed in cents and rendered without float noise."""
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'use_automated_income': 0}
+        cursor.fetchall.side_effect = [
+            [{'id': n, 'source': f'Gig {n}', 'amount_cents': 10} for n in range(3)],
+            [],
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/income/')
+        assert b'Rs. 0.30' in response.data
+        query = cursor.execute.call_args_list[1].args[0]
+        assert 'CAST((amount) * 100 AS SIGNED) AS amount_cents' in query
+
+    def test_benchmark(self):
+        from services.money import benchmark
+        results = benchmark(rows=2000, rounds=1)
+        assert results["cents"][1] == results["exact"]
+
+
+class TestPeople:
+    """Test per-person running totals behind automated income."""
+
+    def test_income_reads_running_totals(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'use_automated_income': 1}
+        cursor.fetchall.side_effect = [
+            [],
+            [{'done_by': 'Alex', 'total_cents': 120050}, {'done_by': 'Sam', 'total_cents': 30000}],
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/income/')
+        assert response.status_code == 200
+        assert b'1500.50' in response.data
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert any('FROM people WHERE user_id=%s' in s for s in sql)
+        assert not any('GROUP BY done_by' in s for s in sql)
+
+    def test_grouped_by_person_id_with_legacy_rows(self):
+        import sqlite3
+        from services.people import grouped
+        db = sqlite3.connect(':memory:')
+        db.execute("CREATE TABLE people (id INTEGER PRIMARY KEY, user_id INT, name TEXT)")
+        db.execute("CREATE TABLE archived_expense (user_id INT, month_key INT, done_by TEXT, person_id INT, amount INT)")
+        db.execute("INSERT INTO people VALUES (7, 1, 'Alex')")
+        db.executemany("INSERT INTO archived_expense VALUES (1, 202401, ?, ?, ?)", [
+            ('Alex', 7, 100), ('Alex', 7, 50), ('Sam', None, 25),
+        ])
+        sql = grouped("SUM(amount) AS total_cents", "FROM archived_expense WHERE month_key=? AND user_id=?")
+        rows = db.execute(sql + " ORDER BY total_cents DESC", (202401, 1)).fetchall()
+        assert [(r[0], r[-1]) for r in rows] == [('Alex', 150), ('Sam', 25)]
+
+    def test_edit_moves_total_between_people(self):
+        from services import people
+        cursor = MagicMock()
+        people.move(cursor, 1, 'Alex', Decimal('40.00'), 'Sam', Decimal('40.00'))
+        assert [c[0][1] for c in cursor.execute.call_args_list] == [
+            ('-40.00', 1, 'Alex'), ('40.00', 1, 'Sam'),
+        ]
+
+    def test_default_done_by_points_at_person(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'id': 1}
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.post('/settings/update', data={'limit': '100', 'savings': '0', 'default_done_by': 'Alex'})
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert 'INSERT IGNORE INTO people' in sql[1]
+        assert 'default_person_id=(SELECT id FROM people WHERE user_id=%s AND name=%s)' in sql[2]
+        assert cursor.execute.call_args_list[2][0][1][3:5] == (1, 'Alex')
+
+    def test_settings_resolve_default_through_people(self):
+        from services.settings import SETTINGS_QUERY
+        assert 'LEFT JOIN people p ON p.id = s.default_person_id' in SETTINGS_QUERY
+        assert 'COALESCE(p.name, s.default_done_by) AS default_done_by' in SETTINGS_QUERY
+
+    def test_backfill_fills_person_ids_in_chunks(self):
+        from services import people
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = (10, 20)
+        cursor.rowcount = 11
+
+        assert people.backfill(conn, 'expense', chunk=100) == 11
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert 'INSERT IGNORE INTO people (user_id, name, spent)' in sql[0]
+        assert 'SET t.person_id = p.id' in sql[-1]
+        assert cursor.execute.call_args_list[-1][0][1] == (10, 109)
@@ -0,0 +1,183 @@
+"""
+Test suite for recurring templates.
+Tests cover template CRUD and batch materialization into income/expense.
+"""
+
+import pytest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+from decimal import Decimal
+from datetime import date
+
+# Ensure the project root is on sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def make_mock_connection():
+    """Create a mock MySQL connection with cursor context manager."""
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.__enter__ = MagicMock(return_value=cursor)
+    cursor.__exit__ = MagicMock(return_value=False)
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def login_session(client, user_id=1, user_name='Test User'):
+    """Helper to set up a logged-in session."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['user_name'] = user_name
+
+
+class TestRecurringPage:
+    """Test the recurring templates page."""
+
+    def test_recurring_requires_auth(self, client):
+        response = client.get('/recurring/')
+        assert response.status_code in (302, 308)
+        assert '/auth/login' in response.headers.get('Location', '')
+
+    def test_lists_templates(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [
+            {'id': 1, 'kind': 'expense', 'label': 'Rent', 'amount_cents': 2500000, 'day': 28,
+             'note': None, 'done_by': 'Self', 'last_month_key': 202405},
+        ]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.get('/recurring/')
+        assert response.status_code == 200
+        assert b'Rent' in response.data
+        assert b'25000.00' in response.data
+        assert b'2024-05' in response.data
+
+    def test_add_template(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/recurring/', data={
+            'kind': 'expense', 'label': 'Rent', 'amount': '25000', 'day': '28', 'done_by': 'Self',
+        })
+        assert response.status_code == 302
+        sql, params = cursor.execute.call_args[0]
+        assert 'INSERT INTO recurring' in sql
+        assert params == (1, 'expense', 'Rent', '25000', 28, None, 'Self')
+        conn.commit.assert_called_once()
+
+    @pytest.mark.parametrize('form', [
+        {'kind': 'transfer', 'label': 'Rent', 'amount': '10', 'day': '1'},
+        {'kind': 'expense', 'label': '', 'amount': '10', 'day': '1'},
+        {'kind': 'expense', 'label': 'Rent', 'amount': '-5', 'day': '1'},
+        {'kind': 'expense', 'label': 'Rent', 'amount': '10', 'day': '32'},
+    ])
+    def test_invalid_template_rejected(self, client_no_csrf, app_no_csrf, form):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/recurring/', data=form)
+        assert response.status_code == 302
+        cursor.execute.assert_not_called()
+
+    def test_apply_fills_current_month(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.rowcount = 2
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        response = client_no_csrf.post('/recurring/apply')
+        assert response.status_code == 302
+        key = date.today().year * 100 + date.today().month
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        assert 'INSERT INTO expense' in sql[2] and 'INSERT IGNORE' not in sql[2]
+        assert cursor.execute.call_args_list[2][0][1][2:] == (key, key, 1)
+        conn.commit.assert_called_once()
+
+
+class TestMaterialize:
+    """Test copying templates into a month."""
+
+    def test_one_statement_per_table_for_a_batch(self):
+        from services import recurring
+        cursor = MagicMock()
+        cursor.rowcount = 3
+
+        inserted = recurring.materialize(cursor, [4, 5, 6], 202402)
+        assert inserted == 6
+        (categories_sql, _), (people_sql, _), (expense_sql, expense_params), (income_sql, income_params), \
+            (budget_sql, budget_params), (totals_sql, totals_params), (mark_sql, mark_params), (version_sql, version_params) = (
+                c[0] for c in cursor.execute.call_args_list
+            )
+        assert 'INSERT IGNORE INTO categories' in categories_sql
+        assert 'INSERT INTO expense' in expense_sql and 'IN (%s, %s, %s)' in expense_sql
+        assert 'ON DUPLICATE KEY UPDATE expense.id = expense.id' in expense_sql
+        assert 'c.id' in expense_sql and 'p.id' in expense_sql
+        assert 'INSERT IGNORE INTO people' in people_sql
+        assert 'SET p.spent = p.spent + t.total' in totals_sql and totals_params == (202402, 202402, 4, 5, 6)
+        # Day 31 templates land on Feb 29 in a leap year
+        assert expense_params == (date(2024, 2, 1), 29, 202402, 202402, 4, 5, 6)
+        assert 'ON DUPLICATE KEY UPDATE income.id = income.id' in income_sql
+        assert "CONCAT(r.id, ':', %s)" in income_sql
+        assert 'SET c.spent = c.spent + t.total' in budget_sql and budget_params == (202402, 202402, 4, 5, 6)
+        # Counters add up the rows that were copied, not every due template
+        assert "e.recurring_key = CONCAT(r.id, ':', %s)" in budget_sql and 'e.person_id' in totals_sql
+        assert 'last_month_key = %s' in mark_sql and mark_params == (202402, 202402, 4, 5, 6)
+        # Other workers' forecasts must see the copies, one row per user
+        assert 'expense_version = expense_version + 1' in version_sql and version_params == (4, 5, 6)
+
+    def test_no_users_no_queries(self):
+        from services import recurring
+        cursor = MagicMock()
+        assert recurring.materialize(cursor, [], 202402) == 0
+        cursor.execute.assert_not_called()
+
+    def test_materialize_all_commits_per_batch(self):
+        from services import recurring
+        conn, cursor = make_mock_connection()
+        cursor.fetchall.return_value = [(u,) for u in range(1, 6)]
+        cursor.rowcount = 1
+
+        users, inserted = recurring.materialize_all(conn, 202403, batch_users=2)
+        assert users == 5
+        assert conn.commit.call_count == 3
+        batches = [c[0][1][4:] for c in cursor.execute.call_args_list if 'INTO expense' in c[0][0]]
+        assert batches == [(1, 2), (3, 4), (5,)]
+
+    def test_next_key_rolls_over_year(self):
+        from services.archive import next_key
+        assert next_key(202405) == 202406
+        assert next_key(202412) == 202501
+
+
+class TestEndMonthRollover:
+    """Test that ending a month starts the next one from the templates."""
+
+    def test_end_month_materializes_next_month(self, client_no_csrf, app_no_csrf):
+        login_session(client_no_csrf)
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.side_effect = [
+            {'use_automated_income': 0, 'total_savings': Decimal('0.00')},
+            {'total_cents': 0},
+            {'total_cents': 0},
+        ]
+        cursor.fetchall.side_effect = [[], [], []]
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        with patch('routes.settings.datetime') as clock:
+            from datetime import datetime
+            clock.now.return_value = datetime(2024, 12, 31, 22, 0)
+            response = client_no_csrf.post('/settings/end-month')
+        assert response.status_code == 302
+
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        cleared = sql.index("DELETE FROM expense WHERE user_id=%s")
+        filled = next(i for i, s in enumerate(sql) if 'INSERT INTO expense' in s)
+        assert filled > cleared
+        # Budget counters restart before the copies are counted in
+        assert cleared < sql.index("UPDATE categories SET spent = 0 WHERE user_id=%s") < filled
+        assert cursor.execute.call_args_list[filled][0][1][:3] == (date(2025, 1, 1), 31, 202501)
+        conn.commit.assert_called_once()
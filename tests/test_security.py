@@ -396,6 +396,157 @@ class TestFileAccessControl:
         assert response.status_code == 302
         assert '/auth/login' in response.headers.get('Location', '')
 
+    def test_receipt_of_other_user_not_served(self, client_no_csrf, app_no_csrf, tmp_path):
+        """A logged-in user must not be able to fetch another user's receipt."""
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        (tmp_path / 'user2_receipt.pdf').write_bytes(b'%PDF-secret')
+        login_session(client_no_csrf, user_id=1)
+
+        response = client_no_csrf.get('/uploads/receipts/user2_receipt.pdf')
+        assert response.status_code == 404
+
+    TRAVERSALS = [
+        '/uploads/receipts/u1/%2E%2E/u2/ab/cd/' + 'cd' * 32 + '.pdf',
+        '/uploads/receipts/user1_/%2e%2e/user2_secret.pdf',
+        '/uploads/thumbs/u1/%2E%2E/u2/ab/cd/' + 'cd' * 32 + '.png',
+        '/uploads/thumbs/user1_/%2e%2e/user2_r.png',
+        '/uploads/avatars/u1/%2E%2E/u2/' + 'c' * 32 + '-32.webp',
+        '/uploads/avatars/user1_/%2e%2e/user2_me.png',
+    ]
+
+    @pytest.mark.parametrize("url", TRAVERSALS)
+    def test_encoded_dot_segments_rejected(self, client_no_csrf, app_no_csrf, tmp_path, url):
+        """``..`` hidden behind the owner's prefix must not reach another user's file."""
+        from PIL import Image
+        for key in ('RECEIPT_FOLDER', 'AVATAR_FOLDER'):
+            app_no_csrf.config[key] = str(tmp_path)
+        victim = tmp_path / url.split('%2E%2E/' if '%2E%2E/' in url else '%2e%2e/')[1]
+        victim.parent.mkdir(parents=True, exist_ok=True)
+        Image.new('RGB', (4, 4)).save(victim, format='PNG')
+        login_session(client_no_csrf, user_id=1)
+
+        response = client_no_csrf.get(url)
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize("name", [
+        '/u1/ab/cd/' + 'cd' * 32 + '.pdf',
+        'u1//ab/cd/' + 'cd' * 32 + '.pdf',
+        'u1/./ab/cd/' + 'cd' * 32 + '.pdf',
+        'u1/ab/cd/x.pdf',
+        'u12/ab/cd/' + 'cd' * 32 + '.pdf',
+        'user1_/x.pdf',
+    ])
+    def test_owns_rejects_unexpected_shapes(self, name):
+        from services.files import owns
+        assert not owns(name, 1, 'receipts')
+
+    def test_owns_accepts_own_files(self):
+        from services.files import owns
+        assert owns('u1/ab/cd/' + 'cd' * 32 + '.pdf', 1, 'receipts')
+        assert owns('user1_receipt.pdf', 1, 'receipts')
+        assert owns('u1/' + 'c' * 32 + '-64.webp', 1, 'avatars')
+        assert not owns('u1/ab/cd/' + 'cd' * 32 + '.pdf', 1, 'avatars')
+
+
+class TestFileServing:
+    """Test caching, range and proxy hand-off for uploaded files."""
+
+    DIGEST = 'ab' * 32
+    CONTENT_PATH = f"u1/ab/ab/{'ab' * 32}.pdf"
+
+    def _receipt(self, app, tmp_path, body=b'%PDF-0123456789'):
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        app.config['RECEIPT_FOLDER'] = str(tmp_path / 'receipts')
+        blob = tmp_path / 'receipts' / self.CONTENT_PATH
+        blob.parent.mkdir(parents=True)
+        blob.write_bytes(body)
+        return blob
+
+    def test_content_addressed_receipt_is_immutable(self, client_no_csrf, app_no_csrf, tmp_path):
+        self._receipt(app_no_csrf, tmp_path)
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get(f'/uploads/receipts/{self.CONTENT_PATH}')
+        assert response.status_code == 200
+        assert 'immutable' in response.headers['Cache-Control']
+        assert 'private' in response.headers['Cache-Control']
+
+    def test_legacy_receipt_revalidates(self, client_no_csrf, app_no_csrf, tmp_path):
+        """Name-based files can be overwritten, so they must revalidate."""
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        (tmp_path / 'user1_receipt.pdf').write_bytes(b'%PDF-1')
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get('/uploads/receipts/user1_receipt.pdf')
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    def test_etag_conditional_request(self, client_no_csrf, app_no_csrf, tmp_path):
+        self._receipt(app_no_csrf, tmp_path)
+        login_session(client_no_csrf)
+
+        first = client_no_csrf.get(f'/uploads/receipts/{self.CONTENT_PATH}')
+        again = client_no_csrf.get(
+            f'/uploads/receipts/{self.CONTENT_PATH}',
+            headers={'If-None-Match': first.headers['ETag']},
+        )
+        assert again.status_code == 304
+
+    def test_range_request(self, client_no_csrf, app_no_csrf, tmp_path):
+        self._receipt(app_no_csrf, tmp_path)
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get(
+            f'/uploads/receipts/{self.CONTENT_PATH}',
+            headers={'Range': 'bytes=5-9'},
+        )
+        assert response.status_code == 206
+        assert response.data == b'01234'
+
+    def test_x_accel_redirect_handoff(self, client_no_csrf, app_no_csrf, tmp_path):
+        """With nginx hand-off the app sends only headers, no file bytes."""
+        self._receipt(app_no_csrf, tmp_path)
+        app_no_csrf.config['SENDFILE_BACKEND'] = 'x-accel-redirect'
+        app_no_csrf.config['X_ACCEL_PREFIX'] = '/_protected_uploads/'
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get(f'/uploads/receipts/{self.CONTENT_PATH}')
+        assert response.status_code == 200
+        assert response.headers['X-Accel-Redirect'] == f'/_protected_uploads/receipts/{self.CONTENT_PATH}'
+        assert response.headers['Content-Type'] == 'application/pdf'
+        assert response.data == b''
+
+    def test_x_accel_missing_file_404(self, client_no_csrf, app_no_csrf, tmp_path):
+        app_no_csrf.config['UPLOAD_FOLDER'] = str(tmp_path)
+        app_no_csrf.config['RECEIPT_FOLDER'] = str(tmp_path)
+        app_no_csrf.config['SENDFILE_BACKEND'] = 'x-accel-redirect'
+        app_no_csrf.config['X_ACCEL_PREFIX'] = '/_protected_uploads'
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get('/uploads/receipts/u1/missing.pdf')
+        assert response.status_code == 404
+
+
+    def test_s3_receipt_redirects_to_presigned_url(self, client_no_csrf, app_no_csrf, s3_bucket):
+        """With object storage the app authorises, then hands off to the bucket."""
+        from urllib.parse import parse_qs, urlparse
+        login_session(client_no_csrf)
+
+        response = client_no_csrf.get(f'/uploads/receipts/{self.CONTENT_PATH}')
+        assert response.status_code == 302
+        url = urlparse(response.headers['Location'])
+        query = parse_qs(url.query)
+        assert url.path.endswith(f'/receipts/{self.CONTENT_PATH}')
+        assert 'X-Amz-Signature' in query or 'Signature' in query
+        assert 'immutable' in query['response-cache-control'][0]
+        assert response.headers['Cache-Control'] == 'private, max-age=150'
+
+    def test_s3_receipt_of_other_user_not_redirected(self, client_no_csrf, app_no_csrf, s3_bucket):
+        login_session(client_no_csrf, user_id=1)
+
+        response = client_no_csrf.get('/uploads/receipts/u2/ab/cd/x.pdf')
+        assert response.status_code == 404
+
 
 # ─────────────────────────────────────────────────────────────
 #  8. FILE UPLOAD VALIDATION TESTS
@@ -467,3 +618,163 @@ class TestPasswordSecurity:
         """MIN_PASSWORD_LENGTH should be at least 8."""
         from routes.auth import MIN_PASSWORD_LENGTH
         assert MIN_PASSWORD_LENGTH >= 8
+
+
+# ─────────────────────────────────────────────────────────────
+#  10. LOGIN RATE LIMITING TESTS
+# ─────────────────────────────────────────────────────────────
+
+class TestLoginRateLimit:
+    """Test token-bucket throttling of login attempts."""
+
+    class Clock:
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    def test_bucket_allows_burst_then_refills(self):
+        from services.ratelimit import MemoryBackend, RateLimiter
+        clock = self.Clock()
+        limiter = RateLimiter(MemoryBackend(), {'email': (3, 6)}, clock=clock)
+
+        assert [limiter.hit('email', 'a@x.io') for _ in range(3)] == [0, 0, 0]
+        assert limiter.hit('email', 'a@x.io') == pytest.approx(10.0)
+        assert limiter.hit('email', 'b@x.io') == 0
+        clock.now += 10
+        assert limiter.hit('email', 'a@x.io') == 0
+        assert limiter.rejected['email'] == 1
+
+    def test_memory_backend_is_bounded(self):
+        from services.ratelimit import MemoryBackend
+        backend = MemoryBackend(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            backend.take(key, 5, 1, 0.0)
+        assert list(backend._buckets) == ['b', 'c']
+
+    def test_sqlite_backend_shared_between_limiters(self, tmp_path):
+        """Two workers pointing at one file should drain the same bucket."""
+        from services.ratelimit import RateLimiter, SQLiteBackend
+        clock = self.Clock()
+        path = str(tmp_path / 'buckets.db')
+        first = RateLimiter(SQLiteBackend(path), {'ip': (2, 1)}, clock=clock)
+        second = RateLimiter(SQLiteBackend(path), {'ip': (2, 1)}, clock=clock)
+
+        assert first.hit('ip', '10.0.0.1') == 0
+        assert second.hit('ip', '10.0.0.1') == 0
+        assert first.hit('ip', '10.0.0.1') > 0
+
+    def test_sqlite_backend_reconnects_after_fork(self, tmp_path):
+        """Nothing is opened at app creation, and a forked worker opens its own handle."""
+        from services.ratelimit import SQLiteBackend
+        backend = SQLiteBackend(str(tmp_path / 'buckets.db'))
+        assert not hasattr(backend._local, 'db')
+
+        backend.take('ip:a', 5, 1, 0.0)
+        parent = backend._local.db
+        with patch('services.ratelimit.os.getpid', return_value=os.getpid() + 1):
+            backend.take('ip:a', 5, 1, 0.0)
+            assert backend._local.db is not parent
+        tokens = backend._local.db.execute("SELECT tokens FROM bucket WHERE key='ip:a'").fetchone()[0]
+        assert tokens == 3
+
+    def test_login_returns_429_before_db_lookup(self, client_no_csrf, app_no_csrf):
+        """Throttled attempts must not query users or hash anything."""
+        from services.ratelimit import MemoryBackend, RateLimiter
+        app_no_csrf.login_limiter = RateLimiter(MemoryBackend(), {'email': (1, 1)})
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        data = {'email': 'victim@example.com', 'password': 'guess'}
+        assert client_no_csrf.post('/auth/login', data=data).status_code == 302
+        app_no_csrf.db_pool.get_connection.reset_mock()
+
+        response = client_no_csrf.post('/auth/login', data=data)
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) == 60
+        app_no_csrf.db_pool.get_connection.assert_not_called()
+        assert app_no_csrf.login_limiter.rejected['email'] == 1
+
+    def test_ip_limit_spans_emails(self, client_no_csrf, app_no_csrf):
+        from services.ratelimit import MemoryBackend, RateLimiter
+        app_no_csrf.login_limiter = RateLimiter(MemoryBackend(), {'ip': (2, 1)})
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        codes = [
+            client_no_csrf.post('/auth/login', data={'email': f'u{i}@example.com', 'password': 'x'}).status_code
+            for i in range(3)
+        ]
+        assert codes == [302, 302, 429]
+
+    def test_ip_limit_uses_forwarded_client_behind_proxy(self):
+        """With PROXY_FIX_X_FOR, clients behind one proxy get separate IP buckets."""
+        from tests.conftest import TestConfig
+        from services.ratelimit import MemoryBackend, RateLimiter
+
+        class ProxiedConfig(TestConfig):
+            WTF_CSRF_ENABLED = False
+            PROXY_FIX_X_FOR = 1
+
+        with patch('config.Config', ProxiedConfig):
+            from app import create_app
+            app = create_app(config_class=ProxiedConfig)
+        app.login_limiter = RateLimiter(MemoryBackend(), {'ip': (1, 1)})
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = None
+        app.db_pool.get_connection.return_value = conn
+        client = app.test_client()
+
+        def login(client_ip):
+            return client.post(
+                '/auth/login', data={'email': 'u@example.com', 'password': 'x'},
+                headers={'X-Forwarded-For': client_ip}, environ_base={'REMOTE_ADDR': '127.0.0.1'},
+            ).status_code
+
+        assert [login('198.51.100.7'), login('203.0.113.9'), login('198.51.100.7')] == [302, 302, 429]
+
+    def test_noisy_address_cannot_lock_victim_account(self):
+        """One IP hammering an email exhausts only its own (email, IP) bucket."""
+        from services.ratelimit import MemoryBackend, RateLimiter, check_login
+        clock = self.Clock()
+        limiter = RateLimiter(MemoryBackend(), clock=clock)
+
+        for _ in range(10):
+            clock.now += 60
+            for _ in range(30):
+                check_login(limiter, '203.0.113.9', 'victim@example.com')
+        assert check_login(limiter, '203.0.113.9', 'victim@example.com') > 0
+        assert check_login(limiter, '198.51.100.7', 'victim@example.com') == 0
+
+    def test_account_ceiling_spans_addresses(self):
+        """Guesses spread over many IPs still hit the per-email ceiling."""
+        from services.ratelimit import MemoryBackend, RateLimiter, check_login
+        limiter = RateLimiter(MemoryBackend(), {'account': (10, 1)}, clock=self.Clock())
+
+        waits = [check_login(limiter, f'10.0.0.{n}', 'victim@example.com') for n in range(11)]
+        assert waits[:10] == [0] * 10
+        assert waits[10] > 0
+        assert limiter.rejected['account'] == 1
+
+    def test_sqlite_backend_prunes_refilled_buckets(self, tmp_path):
+        from services.ratelimit import SQLiteBackend
+        backend = SQLiteBackend(str(tmp_path / 'buckets.db'), prune_every=3)
+        backend.take('ip:a', 5, 60, 0.0)   # full again after 1s
+        backend.take('ip:b', 5, 1, 0.0)    # after 60s
+        backend.take('ip:c', 5, 60, 10.0)  # third take prunes 'a'
+
+        keys = [row[0] for row in backend._connect().execute("SELECT key FROM bucket ORDER BY key")]
+        assert keys == ['ip:b', 'ip:c']
+        assert backend.prune(100.0) == 2
+
+    def test_rejections_do_not_log_raw_email(self, caplog):
+        from services.ratelimit import MemoryBackend, RateLimiter
+        limiter = RateLimiter(MemoryBackend(), {'account': (1, 1)})
+        limiter.hit('account', 'victim@example.com')
+        with caplog.at_level('WARNING', logger='services.ratelimit'):
+            limiter.hit('account', 'victim@example.com')
+        assert 'Rate limited account=' in caplog.text
+        assert 'victim' not in caplog.text
@@ -47,15 +47,18 @@ class TestSettingsAccess:
         # New query order: settings, manual income, expenses, automated income, archived months
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('5000.00'), 'default_done_by': 'Self', 'use_automated_income': 0},
-            {'total': Decimal('8000.00'), 'count': 3},  # manual income
-            {'total': Decimal('5000.00'), 'count': 10},  # expenses
+            {'total_cents': 800000, 'count': 3},  # manual income
+            {'total_cents': 500000, 'count': 10},  # expenses
             {'cnt': 2},  # archived months
         ]
-        cursor.fetchall.return_value = [{'done_by': 'Self', 'total': Decimal('5000.00')}]  # automated income
+        cursor.fetchall.return_value = [{'done_by': 'Self', 'total_cents': 500000}]  # automated income
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/settings/')
         assert response.status_code == 200
+        assert b'Rs. 10000.00' in response.data  # limit
+        assert b'Rs. 8000.00' in response.data   # savings after the month's net
+        assert b'50.0%' in response.data
 
 
 class TestSettingsDisplay:
@@ -68,11 +71,11 @@ class TestSettingsDisplay:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('5000.00'), 'default_done_by': 'Self', 'use_automated_income': 0},
-            {'total': Decimal('15000.00'), 'count': 2},  # manual income
-            {'total': Decimal('8000.00'), 'count': 15},  # expenses
+            {'total_cents': 1500000, 'count': 2},  # manual income
+            {'total_cents': 800000, 'count': 15},  # expenses
             {'cnt': 3},
         ]
-        cursor.fetchall.return_value = [{'done_by': 'Self', 'total': Decimal('8000.00')}]  # automated income
+        cursor.fetchall.return_value = [{'done_by': 'Self', 'total_cents': 800000}]  # automated income
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.get('/settings/')
@@ -85,13 +88,13 @@ class TestSettingsDisplay:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'monthly_limit': Decimal('10000.00'), 'total_savings': Decimal('5000.00'), 'default_done_by': 'Self', 'use_automated_income': 1},
-            {'total': Decimal('15000.00'), 'count': 2},  # manual income
-            {'total': Decimal('8000.00'), 'count': 15},  # expenses
+            {'total_cents': 1500000, 'count': 2},  # manual income
+            {'total_cents': 800000, 'count': 15},  # expenses
             {'cnt': 3},
         ]
         cursor.fetchall.return_value = [
-            {'done_by': 'Person1', 'total': Decimal('4000.00')},
-            {'done_by': 'Person2', 'total': Decimal('4000.00')},
+            {'done_by': 'Person1', 'total_cents': 400000},
+            {'done_by': 'Person2', 'total_cents': 400000},
         ]  # automated income = 8000
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -105,8 +108,8 @@ class TestSettingsDisplay:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             None,  # no settings
-            {'total': Decimal('0'), 'count': 0},
-            {'total': Decimal('0'), 'count': 0},
+            {'total_cents': 0, 'count': 0},
+            {'total_cents': 0, 'count': 0},
             {'cnt': 0},
         ]
         cursor.fetchall.return_value = []
@@ -213,12 +216,13 @@ class TestEndMonth:
         # New query order: settings, manual income, expenses
         cursor.fetchone.side_effect = [
             {'use_automated_income': 0, 'total_savings': Decimal('2000.00')},  # settings
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('5000.00')},   # total expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 500000},   # total expenses
         ]
         cursor.fetchall.side_effect = [
             [{'source': 'Salary', 'amount': Decimal('10000.00')}],  # income rows
-            [{'amount': Decimal('1000.00'), 'category': 'Food', 'note': 'Test', 'date': '2024-01-15', 'done_by': 'Self'}],  # expense rows
+            [{'amount': Decimal('1000.00'), 'category': 'Food', 'category_id': 3, 'note': 'Test', 'date': '2024-01-15', 'done_by': 'Self', 'person_id': 2}],  # expense rows
+            [],  # orphaned receipts
         ]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
@@ -235,14 +239,16 @@ class TestEndMonth:
         # With manual mode: Net = 10000 - 6000 = 4000, new total = 5000 + 4000 = 9000
         cursor.fetchone.side_effect = [
             {'use_automated_income': 0, 'total_savings': Decimal('5000.00')},  # settings
-            {'total': Decimal('10000.00')},  # manual income
-            {'total': Decimal('6000.00')},   # total expenses
+            {'total_cents': 1000000},  # manual income
+            {'total_cents': 600000},   # total expenses
         ]
-        cursor.fetchall.side_effect = [[], []]  # empty income/expense for archive
+        cursor.fetchall.side_effect = [[], [], []]  # empty income/expense for archive, no orphaned receipts
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         response = client_no_csrf.post('/settings/end-month', follow_redirects=False)
         assert response.status_code == 302
+        update = next(c for c in cursor.execute.call_args_list if 'total_savings = total_savings +' in c[0][0])
+        assert update[0][1] == (Decimal('4000.00'), 1)
 
     def test_end_month_clears_current_data(self, client_no_csrf, app_no_csrf):
         """End month should delete current income and expenses."""
@@ -251,10 +257,10 @@ class TestEndMonth:
         conn, cursor = make_mock_connection()
         cursor.fetchone.side_effect = [
             {'use_automated_income': 0, 'total_savings': Decimal('2000.00')},
-            {'total': Decimal('10000.00')},
-            {'total': Decimal('5000.00')},
+            {'total_cents': 1000000},
+            {'total_cents': 500000},
         ]
-        cursor.fetchall.side_effect = [[], []]
+        cursor.fetchall.side_effect = [[], [], []]
         app_no_csrf.db_pool.get_connection.return_value = conn
 
         client_no_csrf.post('/settings/end-month')
@@ -263,6 +269,8 @@ class TestEndMonth:
         calls = [str(call) for call in cursor.execute.call_args_list]
         assert any('DELETE FROM income' in call for call in calls)
         assert any('DELETE FROM expense' in call for call in calls)
+        # Analytics and forecast caches in every worker see the new archive
+        assert any('archive_version = archive_version + 1' in call for call in calls)
 
 
 class TestFreshStart:
@@ -311,3 +319,104 @@ class TestSettingsCSRF:
         login_session(client)
         response = client.post('/settings/fresh-start')
         assert response.status_code == 400
+
+
+class TestSettingsCache:
+    """Test the per-user settings cache."""
+
+    def _setting_queries(self, cursor):
+        return [c for c in cursor.execute.call_args_list if 'FROM setting' in str(c)]
+
+    def test_settings_row_cached_across_requests(self, client_no_csrf, app_no_csrf):
+        """The setting row should only be fetched once while its version is unchanged."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'use_automated_income': 1, 'total_cents': 0,
+            'archive_version': 0, 'expense_version': 0, 'setting_version': 0,
+        }
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.get('/income/')
+        client_no_csrf.get('/income/')
+
+        assert len(self._setting_queries(cursor)) == 1
+        assert any('FROM cache_version' in str(c) for c in cursor.execute.call_args_list)
+
+    def test_write_in_other_worker_reloads_row(self, client_no_csrf, app_no_csrf):
+        """A newer setting version means another worker saved the row: reload it."""
+        login_session(client_no_csrf)
+        app_no_csrf.settings_cache.set(1, (0, {'use_automated_income': False, 'monthly_limit': 5.0}))
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {
+            'use_automated_income': 1, 'total_cents': 0,
+            'archive_version': 0, 'expense_version': 0, 'setting_version': 1,
+        }
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.get('/income/')
+
+        assert len(self._setting_queries(cursor)) == 1
+        assert app_no_csrf.settings_cache.get(1)[0] == 1
+
+    def test_update_bumps_setting_version(self, client_no_csrf, app_no_csrf):
+        """The version moves in the same transaction as the write."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'id': 1}
+        app_no_csrf.db_pool.get_connection.return_value = conn
+        client_no_csrf.post('/settings/update', data={'limit': '100', 'savings': '0'})
+
+        bumps = [c.args[0] for c in cursor.execute.call_args_list if 'INTO cache_version' in c.args[0]]
+        assert len(bumps) == 1 and 'setting_version = setting_version + 1' in bumps[0]
+        conn.commit.assert_called_once()
+
+    def test_update_invalidates_cache(self, client_no_csrf, app_no_csrf):
+        """Saving settings should force the next page to reload the row."""
+        login_session(client_no_csrf)
+
+        conn, cursor = make_mock_connection()
+        cursor.fetchone.return_value = {'id': 1, 'use_automated_income': 0}
+        cursor.fetchall.return_value = []
+        app_no_csrf.db_pool.get_connection.return_value = conn
+
+        client_no_csrf.get('/income/')
+        client_no_csrf.post('/settings/update', data={'limit': '100', 'savings': '0'})
+        client_no_csrf.get('/income/')
+
+        reads = [c for c in self._setting_queries(cursor) if 'SELECT s.monthly_limit' in str(c)]
+        assert len(reads) == 2
+
+    def test_fresh_start_invalidates_cache(self, client_no_csrf, app_no_csrf):
+        """Fresh start deletes the row, so the cached copy must go too."""
+        login_session(client_no_csrf)
+        app_no_csrf.settings_cache.set(1, (0, {'use_automated_income': True}))
+
+        conn, cursor = make_mock_connection()
+        app_no_csrf.db_pool.get_connection.return_value = conn
+        client_no_csrf.post('/settings/fresh-start')
+
+        assert app_no_csrf.settings_cache.get(1) is None
+
+    def test_normalized_amounts_are_cents(self):
+        from services.settings import normalize
+        setting = normalize({'monthly_limit': Decimal('0.10'), 'total_savings': Decimal('0.20')})
+        assert setting['monthly_limit'] + setting['total_savings'] == 30
+        assert normalize(None)['monthly_limit'] == 0
+
+    def test_cache_entries_expire(self):
+        """Entries older than the TTL should be treated as misses."""
+        from services.settings import SettingsCache
+
+        now = [0.0]
+        cache = SettingsCache(ttl=10, clock=lambda: now[0])
+        cache.set(1, {'monthly_limit': 5.0})
+        assert cache.get(1) == {'monthly_limit': 5.0}
+
+        now[0] = 10.0
+        assert cache.get(1) is None
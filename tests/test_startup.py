@@ -0,0 +1,122 @@
+"""
+Startup cost tests: importing and building the app must stay cheap.
+"""
+
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# Self time of this project's modules under `python -X importtime -c "import app"`
+STARTUP_BUDGET_MS = 100
+OWN_MODULES = ('app', 'auth_utils', 'config', 'routes', 'services')
+# Only needed once a request uses them
+DEFERRED_MODULES = ('mysql.connector', 'PIL', 'fitz', 'boto3', 'multiprocessing', 'sqlite3', 'numpy')
+
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+
+class TestStartup:
+    """Test lazy app creation and deferred imports."""
+
+    def test_import_time_budget(self):
+        stderr = run_python('import app', '-X', 'importtime').stderr
+        own_us = 0
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line.split(':', 1)[1].split('|')
+            if name.strip().split('.')[0] in OWN_MODULES:
+                own_us += int(self_us)
+        assert own_us / 1000 < STARTUP_BUDGET_MS
+
+    def test_heavy_modules_deferred(self):
+        """Creating the app must not import drivers or imaging libraries."""
+        out = run_python(
+            'import sys, app; app.create_app(); '
+            f'print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])'
+        ).stdout
+        assert out.strip() == '[]'
+
+    def test_module_app_built_on_first_access(self):
+        out = run_python(
+            "import app; print('app' in vars(app)); a = app.app; print(app.app is a, type(a).__name__)"
+        ).stdout.split()
+        assert out == ['False', 'True', 'Flask']
+
+
+class TestLazyPool:
+    """Test the deferred MySQL pool."""
+
+    def test_pool_created_on_first_connection(self):
+        from services.db import LazyPool
+        factory = MagicMock()
+        pool = LazyPool(factory)
+
+        assert not pool.started
+        factory.assert_not_called()
+        pool.get_connection()
+        pool.get_connection()
+        factory.assert_called_once()
+        assert factory.return_value.get_connection.call_count == 2
+
+    def test_failed_pool_is_retried(self):
+        from services.db import LazyPool
+        factory = MagicMock(side_effect=[ConnectionError('db down'), MagicMock()])
+        pool = LazyPool(factory)
+
+        with pytest.raises(ConnectionError):
+            pool.get_connection()
+        assert not pool.started
+        pool.get_connection()
+        assert pool.started
+
+    def test_pool_sized_from_connection_budget(self, monkeypatch):
+        from services import db
+        monkeypatch.setattr(db, '_worker_count', None)
+        factory = MagicMock()
+
+        db.set_worker_count(8)
+        db.LazyPool(factory, budget=40).get_connection()
+        factory.assert_called_once_with(5)
+
+        assert db.pool_size_for(40, 100) == 1
+        assert db.pool_size_for(400, 2) == db.MAX_POOL_SIZE
+        assert db.LazyPool(factory, budget=40, size=3).pool_size() == 3
+
+    def test_forked_worker_opens_its_own_pool(self, monkeypatch):
+        """A pool inherited across fork must not be reused by the child."""
+        from services import db
+        parent_pool, child_pool = MagicMock(), MagicMock()
+        factory = MagicMock(side_effect=[parent_pool, child_pool])
+        pool = db.LazyPool(factory, size=2)
+        pool.get_connection()
+
+        monkeypatch.setattr(db.os, 'getpid', lambda: -1)
+        assert not pool.started
+        pool.get_connection()
+
+        assert factory.call_count == 2
+        child_pool.get_connection.assert_called_once()
+        parent_pool.close.assert_not_called()
+
+    def test_gunicorn_post_fork_sets_worker_share(self, monkeypatch):
+        import runpy
+        from services import db
+        monkeypatch.setattr(db, '_worker_count', None)
+        conf = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+        server = MagicMock()
+        server.cfg.workers = 10
+
+        conf['post_fork'](server, MagicMock())
+        assert db.worker_count() == 10